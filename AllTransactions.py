@@ -1,23 +1,109 @@
 import os
 import json
-import pandas as pd
-import re
 from datetime import datetime
 from FinancialHelpers import *
-import PlotHelpers
+from TransactionRecord import TransactionRecord
+from TransactionRules import TransactionRules
+from TransactionJournal import TransactionJournal
+from TransactionDatabase import TransactionDatabase, isDatabasePath
+from TransactionExport import exportTransactions
+from TransactionAggregates import TransactionAggregates, isMonthAligned
+from Timings import timings
+
+# TransactionColumns and TransactionSnapshot (numpy) are imported where the columns are needed, and PlotHelpers
+# (matplotlib) where they are plotted. Importing, categorizing and saving transactions never need them.
 
 ################################################################################
 ################################################################################
 ################################################################################
 
 class AllTransactions(object):
-   def __init__(self, pathToTransJson: str):
+   def __init__(self, pathToTransJson: str, journal: bool = False, asOf: datetime = None, startInclusive: datetime = None, stopExclusive: datetime = None, actions = None, snapshot: bool = False, aggregates: bool = False):
+      # pathToTransJson - Can also be JSON Lines (.jsonl) or a SQLite database (.db / .sqlite / .sqlite3). A new
+      #                   database is filled from the json of the same name.
+      # journal         - Save changes to an append only journal next to the json (the journal is used from then on).
+      # asOf            - Load the transactions as they were at this time (requires a journal).
+      # startInclusive, stopExclusive, actions - Only load the matching transactions (same as loading everything
+      #                   and then pruning, but the json is streamed so the others are never kept in memory).
+      # snapshot        - For read only reports. Take the columns from the binary snapshot next to the json (rewritten
+      #                   first if the json has changed since), the json is only loaded if the transactions are needed.
+      # aggregates      - Answer the monthly / yearly breakdowns from the sums per (month, action, category) saved next to
+      #                   the json (see TransactionAggregates), kept up to date as transactions are added / changed.
       self.pathToTransJson = pathToTransJson
-      try:
-         with open(pathToTransJson, 'r') as f:
-            self.transList = json.load(f)
-      except:
-         self.transList = []
+      self.__dateCache = {} # Parsed datetime for each date string
+      self.database = TransactionDatabase(pathToTransJson) if isDatabasePath(pathToTransJson) else None
+      self.journal = TransactionJournal(pathToTransJson) if pathToTransJson != None and self.database == None else None
+      if journal and self.journal != None and not self.journal.exists():
+         self.journal.migrate()
+      self.useJournal = self.journal != None and self.journal.exists()
+      self.snapshot = None
+      if snapshot and self.database == None and not self.useJournal and asOf == None and os.path.isfile(pathToTransJson):
+         from TransactionSnapshot import TransactionSnapshot
+         self.snapshot = TransactionSnapshot(pathToTransJson)
+      self.__pendingPrunes = [] # Prunes to do on the transactions when they are loaded (see transList).
+      self.__columnsMasks = [] # Every prune so far (as a columns mask), to do on the aggregates' columns.
+      self.__datePrunes = [] # [startInclusive, stopExclusive] of every prune by date so far.
+      self.aggregates = None
+      self.__aggregateColumns = None
+
+      changes = []
+      self.__transList = None
+      self.rawIndex = None
+      if self.database != None:
+         pass # Transactions are only loaded from the database if they are needed (see transList).
+      elif self.snapshot != None and self.snapshot.isCurrent():
+         pass # Same for the json when there is a snapshot.
+      elif self.useJournal and asOf != None:
+         transList, changes = self.journal.readHistory(asOf)
+         self.transList = [TransactionRecord(trans) for trans in transList]
+      else:
+         def isInLoadRange(trans):
+            if self.snapshot != None:
+               return True # Everything goes in the snapshot.
+            if actions != None and not self.useJournal and trans['action'] not in actions:
+               return False # (A journal change can change the action, those are pruned once the changes are replayed.)
+            if startInclusive == None and stopExclusive == None:
+               return True
+            date = self.getTransActionDateTime(trans)
+            return (startInclusive == None or date >= startInclusive) and (stopExclusive == None or date < stopExclusive)
+         try:
+            self.transList = [TransactionRecord(trans) for trans in iterJsonList(pathToTransJson) if isInLoadRange(trans)]
+         except:
+            self.transList = []
+         if self.useJournal:
+            changes = self.journal.readChanges()
+         if self.snapshot != None:
+            from TransactionColumns import getTransactionColumns
+            self.snapshot.write(getTransactionColumns(self.transList))
+
+      self.__columns = None
+      self.__unsavedChanges = []
+      for change in changes:
+         self.__applyChange(change)
+
+      # The aggregates (when they are current) include the journal changes replayed above.
+      if aggregates and self.database == None and asOf == None and pathToTransJson != None:
+         self.aggregates = TransactionAggregates(pathToTransJson, [pathToTransJson] + ([self.journal.pathToJournal] if self.useJournal else []))
+         loadedAll = self.__transList != None and (self.snapshot != None or (startInclusive == None and stopExclusive == None and (actions == None or self.useJournal)))
+         if not self.aggregates.load() and loadedAll and (startInclusive != None or stopExclusive != None or actions != None):
+            # Out of date, but every transaction was just loaded (i.e. to rebuild the snapshot) and is about to be
+            # pruned. After that they could only be made by loading everything again (see __getAggregateColumns).
+            self.aggregates.build(self.transList, self.getTransActionDateTime)
+            self.aggregates.save()
+
+      # The journal changes (or the database / snapshot) still need to be limited to the transactions being loaded.
+      if self.useJournal or self.database != None or self.snapshot != None:
+         if startInclusive != None or stopExclusive != None:
+            self.pruneByDateRange(startInclusive, stopExclusive)
+         if actions != None:
+            self.__pruneByActions(actions)
+      else:
+         # Only the transactions in range were loaded, these are the prunes that did.
+         if startInclusive != None or stopExclusive != None:
+            self.__recordPrune(lambda cols: cols.getDateRangeMask(startInclusive, stopExclusive), [startInclusive, stopExclusive])
+         if actions != None:
+            self.__recordPrune(lambda cols: cols.getActionsMask(actions))
+
       self.transactionsAdded = 0
       self.transactionsModified = 0
       self.metaDataKeys = ["action", "type", "type", "name", "category"]
@@ -25,13 +111,155 @@ class AllTransactions(object):
 
    #############################################################################
 
+   @property
+   def transList(self):
+      # With a database (or a snapshot), the transactions (with any prunes applied) are loaded the first time they are needed.
+      if self.__transList == None and self.database != None:
+         self.__transList = [TransactionRecord(trans) for trans in self.database.getTransactions()]
+      elif self.__transList == None:
+         transList = [TransactionRecord(trans) for trans in iterJsonList(self.pathToTransJson)]
+         for prune in self.__pendingPrunes:
+            transList = prune(transList)
+         self.__transList = transList
+      return self.__transList
+
+   @transList.setter
+   def transList(self, transList):
+      self.__transList = transList
+      self.rawIndex = None
+
+   #############################################################################
+
+   def __getRawIndex(self):
+      # Map the canonical key of each 'raw' dict to the stored transactions with that 'raw' dict.
+      # Built the first time a transaction is looked up (i.e. not at all when only making reports).
+      if self.rawIndex == None:
+         self.rawIndex = {}
+         for trans in self.transList:
+            self.rawIndex.setdefault(getRawKey(trans["raw"]), []).append(trans)
+      return self.rawIndex
+
+   #############################################################################
+
+   def getColumns(self) -> 'TransactionColumns':
+      # Built on first use and thrown away whenever the transactions change.
+      from TransactionColumns import getTransactionColumns
+      if self.__columns == None and self.database != None:
+         # Let the database do the summing, one row per date / action / category is all that is needed.
+         self.__columns = self.__getDatabaseColumns(byMonth=False)
+      elif self.__columns == None and self.__transList == None and self.snapshot != None:
+         self.__columns = self.snapshot.read()
+      elif self.__columns == None:
+         self.__columns = getTransactionColumns(self.transList)
+      return self.__columns
+
+   #############################################################################
+
+   def __getDatabaseColumns(self, byMonth: bool) -> 'TransactionColumns':
+      from TransactionColumns import TransactionColumns
+      rows = self.database.getGroupedSums(byMonth)
+      return TransactionColumns([row[0] for row in rows], [row[3] for row in rows], [row[1] for row in rows], [row[2] for row in rows], [None] * len(rows))
+
+   #############################################################################
+
+   def __getAggregateColumns(self):
+      # Columns with one row per (month, action, category) (see TransactionAggregates), with the prunes done so far.
+      # None if the aggregates can't be used.
+      if self.database != None:
+         # The database sums up each month itself, its prunes are filters so they are done before the summing.
+         if self.__aggregateColumns == None:
+            self.__aggregateColumns = self.__getDatabaseColumns(byMonth=True)
+         return self.__aggregateColumns
+      if self.aggregates == None:
+         return None
+      if self.aggregates.buckets == None:
+         if len(self.__unsavedChanges) > 0:
+            return None # They are only made from the transactions as they are saved.
+         if len(self.__columnsMasks) > 0:
+            return None # They are made from all the transactions. Only the pruned ones are loaded, their columns are quicker than loading the rest again.
+         self.aggregates.build(self.transList, self.getTransActionDateTime)
+         self.aggregates.save()
+      if self.__aggregateColumns == None:
+         for startInclusive, stopExclusive in self.__datePrunes:
+            if self.aggregates.straddles(startInclusive, stopExclusive):
+               return None # Pruned part way through a month.
+         cols = self.aggregates.getColumns()
+         for getColumnsMask in self.__columnsMasks:
+            cols = cols.getSubset(getColumnsMask(cols))
+         self.__aggregateColumns = cols
+      return self.__aggregateColumns
+
+   #############################################################################
+
+   def __getColumnsFor(self, timeRanges) -> 'TransactionColumns':
+      # The aggregates can sum up month aligned time ranges, anything else needs the columns of every transaction.
+      cols = self.__getAggregateColumns() if isMonthAligned(timeRanges) else None
+      return cols if cols != None else self.getColumns()
+
+   #############################################################################
+
+   def __updateAggregates(self, trans, add: bool):
+      # Add the transaction to (or take it out of) the aggregates. They are made from all the transactions, so after
+      # a prune they can't be kept up to date, they are thrown away instead (and made again by a load without prunes).
+      self.__aggregateColumns = None
+      if self.aggregates == None or self.aggregates.buckets == None:
+         return
+      if len(self.__columnsMasks) > 0:
+         self.aggregates.buckets = None
+      elif add:
+         self.aggregates.add(trans, self.getTransActionDateTime(trans))
+      else:
+         self.aggregates.remove(trans, self.getTransActionDateTime(trans))
+
+   #############################################################################
+
+   def __getMatchingTrans(self, transToCheck):
+      if timings.enabled:
+         timings.counts['lookups'] += 1
+      if self.__transList == None and self.database != None:
+         return self.database.getMatchingTransactions(transToCheck) # Not loaded, look it up in the database.
+      return self.__getRawIndex().get(getRawKey(transToCheck), [])
+
+   #############################################################################
+
    def isInList(self, transToCheck):
-      alreadyInList = False
-      for trans in self.transList:
-         if trans["raw"] == transToCheck:
-            alreadyInList = True
-            break
-      return alreadyInList
+      return len(self.__getMatchingTrans(transToCheck)) > 0
+
+   #############################################################################
+
+   def __makeChange(self, change):
+      # All changes to the transactions go through here so they can be saved to the journal.
+      change["time"] = datetime.now().strftime(TRANSACTION_DATE_FORMAT)
+      self.__unsavedChanges.append(change)
+      self.__applyChange(change)
+
+   #############################################################################
+
+   def __applyChange(self, change):
+      self.__columns = None
+      self.__aggregateColumns = None
+      if self.database != None:
+         self.database.applyChange(change)
+         if self.__transList == None:
+            return # Nothing loaded to update.
+
+      if change["op"] == "add":
+         if not self.isInList(change["trans"]["raw"]):
+            toAdd = TransactionRecord(change["trans"])
+            self.transList.append(toAdd)
+            self.__getRawIndex().setdefault(getRawKey(toAdd["raw"]), []).append(toAdd)
+            self.__updateAggregates(toAdd, True)
+      elif change["op"] == "mod":
+         for trans in self.__getMatchingTrans(change["raw"]):
+            self.__updateAggregates(trans, False)
+            trans.update(change["values"])
+            self.__updateAggregates(trans, True)
+      elif change["op"] == "removeCategory":
+         for trans in self.transList:
+            if trans.get("category") == change["category"]:
+               self.__updateAggregates(trans, False)
+               trans.pop("category") # remove category from the transaction entry
+               self.__updateAggregates(trans, True)
 
    #############################################################################
 
@@ -42,212 +270,219 @@ class AllTransactions(object):
          toAdd["type"] = docEntry["type"]
          toAdd["name"] = docEntry["name"]
          toAdd["raw"] = transToAdd
-         self.transList.append(toAdd)
+         self.__makeChange({"op": "add", "trans": toAdd})
          self.transactionsAdded += 1
 
    #############################################################################
 
    def modTransaction(self, transToMod, docEntry, action: str):
-      for trans in self.transList:
-         if trans["raw"] == transToMod:
-            trans["action"] = action
-            trans["type"] = docEntry["type"]
-            trans["name"] = docEntry["name"]
-            self.transactionsModified += 1
+      numMatching = len(self.__getMatchingTrans(transToMod))
+      if numMatching > 0:
+         self.__makeChange({"op": "mod", "raw": dict(transToMod.items()), "values": {"action": action, "type": docEntry["type"], "name": docEntry["name"]}})
+         self.transactionsModified += numMatching
 
    #############################################################################
 
    def modCategory(self, transToMod, category: str):
-      for trans in self.transList:
-         if trans["raw"] == transToMod:
-            trans["category"] = category
-            self.transactionsModified += 1
+      numMatching = len(self.__getMatchingTrans(transToMod))
+      if numMatching > 0:
+         self.__makeChange({"op": "mod", "raw": dict(transToMod.items()), "values": {"category": category}})
+         self.transactionsModified += numMatching
 
    #############################################################################
 
    def isMetaDataDifferent(self, transToCheck, docEntry, action: str):
-      for trans in self.transList:
-         if trans["raw"] == transToCheck:
-            if trans["action"] != action or trans["type"] != docEntry["type"] or trans["name"] != docEntry["name"]:
-               return True
+      for trans in self.__getMatchingTrans(transToCheck):
+         if trans["action"] != action or trans["type"] != docEntry["type"] or trans["name"] != docEntry["name"]:
+            return True
       return False
             
    #############################################################################
 
    def isMetaDataActionValid(self, transToCheck):
-      for trans in self.transList:
-         if trans["raw"] == transToCheck:
-            if trans["action"] not in self.validActions:
-               return False
+      for trans in self.__getMatchingTrans(transToCheck):
+         if trans["action"] not in self.validActions:
+            return False
       return True
    
    #############################################################################
 
    def getTransActionDateTime(self, trans) -> datetime:
-      return datetime.strptime(trans['raw']['date'], '%Y-%m-%d %H:%M:%S')
+      # Records already have the parsed datetime. Each distinct date string is only parsed once.
+      if type(trans) == TransactionRecord and type(trans.raw.date) == datetime:
+         return trans.raw.date
+      dateStr = trans['raw']['date']
+      date = self.__dateCache.get(dateStr)
+      if date == None:
+         date = parseTransDateTime(dateStr)
+         self.__dateCache[dateStr] = date
+      return date
 
    #############################################################################
 
    def saveTransactions(self):
       print(f"Saving Transactions: {self.transactionsAdded} Transaction(s) added, {self.transactionsModified} Transaction(s) modified")
-      if self.transactionsAdded > 0 or self.transactionsModified > 0:
-         with open(self.pathToTransJson, 'w') as f:
-            json.dump(self.transList, f)
+      if self.database != None:
+         self.database.commit()
+      elif self.useJournal:
+         # Only the changes are written, the full json is only rewritten once the journal gets long.
+         self.journal.appendChanges(self.__unsavedChanges)
+         self.__unsavedChanges = []
+         if self.journal.needsCompaction():
+            self.journal.compact([trans.toDict() for trans in self.transList])
+      elif self.transactionsAdded > 0 or self.transactionsModified > 0:
+         transList = [trans.toDict() for trans in self.transList]
+         writeJsonList(self.pathToTransJson, transList)
          
-         altPath = os.path.splitext(self.pathToTransJson)[0] + "_" + getUniqueFileNameTimeStr() + ".json"
-         with open(altPath, 'w') as f:
-            json.dump(self.transList, f)
+         pathWithoutExt, ext = os.path.splitext(self.pathToTransJson)
+         writeJsonList(pathWithoutExt + "_" + getUniqueFileNameTimeStr() + ext, transList)
+         self.__unsavedChanges = []
+
+      # Stamp the aggregates with the files just saved (if they match what was saved).
+      if self.aggregates != None and self.aggregates.buckets != None and len(self.__unsavedChanges) == 0:
+         self.aggregates.save()
 
    #############################################################################
 
    def makeTransactionSpreadsheet(self, savePath: str):
-      # Function for adding to the dictionary.
-      def transToPandaDict(theDict, dictKey: str, num: int, valDict, valKey: str):
-         if dictKey not in theDict.keys():
-            theDict[dictKey] = {}
+      # The format is the extension of savePath (.xlsx, .csv, .parquet or .feather, see TransactionExport).
+      exportTransactions(self.transList, savePath, self.metaDataKeys)
 
-         try:
-            if dictKey == "amount":
-               theDict[dictKey][num] = float(valDict[valKey])
-            else:
-               theDict[dictKey][num] = valDict[valKey]
-         except:
-            pass
-      
-      # Fill in the dictionary
-      transDicts = {}
-      transNum = 0
-      for trans in self.transList:
-         for key in self.metaDataKeys:
-            transToPandaDict(transDicts, 'meta.'+key, transNum, trans, key)
-         for key in TRANSACTION_KEYS:
-            transToPandaDict(transDicts, key, transNum, trans["raw"], key)
-         transNum += 1
+   #############################################################################
+
+   def getActionStats(self, action: str):
+      if self.database != None:
+         oldest, newest, count = self.database.getActionStats(action)
+         return {'oldest': parseTransDateTime(oldest) if oldest != None else None, 'newest': parseTransDateTime(newest) if newest != None else None, 'count': count}
 
-      # Save as Excel Spreadsheet via Pandas
-      transData = pd.DataFrame(transDicts)
-      transData.to_excel(savePath)
+      return self.__getColumnsActionStats(self.getColumns(), action)
 
    #############################################################################
 
-   def getActionStats(self, action: str):
-      stats = {'oldest': None, 'newest': None, 'count': 0}
-      for trans in self.transList:
-         if trans['action'] == action:
-            date = self.getTransActionDateTime(trans)
-            if stats['oldest'] == None: stats['oldest'] = date
-            elif date < stats['oldest']: stats['oldest'] = date
-            if stats['newest'] == None: stats['newest'] = date
-            elif date > stats['newest']: stats['newest'] = date
-            stats['count'] += 1
+   def __getColumnsActionStats(self, cols: 'TransactionColumns', action: str):
+      dates = cols.dates[cols.getActionMask(action)]
+      stats = {'oldest': None, 'newest': None, 'count': len(dates)}
+      if len(dates) > 0:
+         stats['oldest'] = dates.min().astype(datetime)
+         stats['newest'] = dates.max().astype(datetime)
       return stats
 
    #############################################################################
 
+   def getActionTimeRanges(self, action: str, byYear: bool = False):
+      # Months (or years) from the oldest to the newest transaction with 'action'. Only their months matter, so
+      # this can come from the aggregates (their dates are in the right month, see TransactionAggregates.getColumns).
+      cols = self.__getAggregateColumns()
+      stats = self.__getColumnsActionStats(cols, action) if cols != None else self.getActionStats(action)
+      if stats['oldest'] == None:
+         return {}
+      if byYear:
+         return getYearsInRange(stats['oldest'], stats['newest'])
+      return getMonthsInRange(stats['oldest'], stats['newest'])
+
+   #############################################################################
+
    def getActionMonthlyBreakdown(self, action: str, categories = []):
-      stats = self.getActionStats(action)
-      months = getMonthsInRange(stats['oldest'], stats['newest'])
+      return self.getActionBreakdown(self.getActionTimeRanges(action), action, categories)
 
-      return self.getActionBreakdown(months, action, categories)
+   #############################################################################
+
+   def getActionYearlyBreakdown(self, action: str, categories = []):
+      return self.getActionBreakdown(self.getActionTimeRanges(action, True), action, categories)
 
    #############################################################################
 
    def getActionBreakdown(self, timeRanges, action: str, categories = []):
-      retVal = {}
-      parseCount = 0
-      for key, thisTimeRange in timeRanges.items():
-         retVal[key] = 0 # Start at 0 dollars than add each matching transaction amount.
-
-         # Filter out non-matching transactions
-         transList = self.transList
-         transList = self.__filterByDateRange(transList, thisTimeRange[0], thisTimeRange[1])
-         transList = self.__filterByAction(transList, action)
-         if len(categories) > 0:
-            transList = self.__filterByCategories(transList, categories)
-
-         # Sum up matching transactions
-         for trans in transList:
-            retVal[key] += float(trans['raw']['amount'])
-            parseCount += 1
+      cols = self.__getColumnsFor(timeRanges)
+      actionSums = cols.getActionSums(cols.getGroupedSums(timeRanges), action)
+      if len(categories) > 0:
+         actionSums = actionSums[[code + 1 for code, cat in enumerate(cols.categoryNames) if cat in categories]]
 
+      retVal = {}
+      totals = actionSums.sum(axis=0)
+      for timeIndex, key in enumerate(timeRanges.keys()):
+         retVal[key] = float(totals[timeIndex])
       return retVal
    
    #############################################################################
 
-   def plotActionBreakdown(self, timeRanges, action: str, categories = []):
+   def getCategorySumsByTimeRange(self, timeRanges, action: str, categories = []):
+      # Data for plotActionBreakdown (PlotHelpers stacked bar plot).
+      import numpy as np
+      cols = self.__getColumnsFor(timeRanges)
+      actionSums = cols.getActionSums(cols.getGroupedSums(timeRanges), action)
 
-      categorySumsByTimeRange = {} # Dict of lists. Each dict key is a category. Each items is a list of sums in the given time range.
+      # Add each category's sums to its row (one row per category, or a single 'all' row).
       if len(categories) > 0:
-         for catName in categories:
-            categorySumsByTimeRange[catName] = [] # Initialize to an empty list
-            for i in range(len(timeRanges.items())):
-               categorySumsByTimeRange[catName].append(0)
+         rowNames = list(categories)
+         rows = cols.getCategoryRows(rowNames)
       else:
-         categorySumsByTimeRange['all'] = [] # Initialize to an empty list
-         for i in range(len(timeRanges.items())):
-            categorySumsByTimeRange['all'].append(0)
-
-      timeIndex = 0
-      labels = []
-      for key, thisTimeRange in timeRanges.items():
-         # Filter out non-matching transactions
-         transList = self.transList
-         transList = self.__filterByDateRange(transList, thisTimeRange[0], thisTimeRange[1])
-         transList = self.__filterByAction(transList, action)
-         if len(categories) > 0:
-            for trans in transList:
-               if trans['category'] in categories:
-                  categorySumsByTimeRange[trans['category']][timeIndex] += float(trans['raw']['amount'])
-               elif 'else' in categories: # group all other categories together
-                  categorySumsByTimeRange['else'][timeIndex] += float(trans['raw']['amount'])
-         else:
-            # Take all 
-            for trans in transList:
-               categorySumsByTimeRange['all'][timeIndex] += float(trans['raw']['amount'])
-
-         timeIndex += 1
-         labels.append(key)
+         rowNames = ['all']
+         rows = np.zeros(len(cols.categoryNames) + 1, dtype=np.int32)
+      sums = np.zeros((len(rowNames), len(timeRanges)))
+      np.add.at(sums, rows[rows >= 0], actionSums[rows >= 0])
 
       if action == "expense":
-         # expenses are negative. Negate them to be positive.
-         for key, val in categorySumsByTimeRange.items():
-            for i in range(len(categorySumsByTimeRange[key])):
-               categorySumsByTimeRange[key][i] = -categorySumsByTimeRange[key][i]
+         sums = -sums # expenses are negative. Negate them to be positive.
+
+      categorySumsByTimeRange = {} # Dict of lists. Each dict key is a category. Each items is a list of sums in the given time range.
+      for row, rowName in enumerate(rowNames):
+         categorySumsByTimeRange[rowName] = sums[row].tolist()
+      return categorySumsByTimeRange
+
+   #############################################################################
 
-      PlotHelpers.showStackedBarPlot(categorySumsByTimeRange, labels)
+   def plotActionBreakdown(self, timeRanges, action: str, categories = [], path: str = None):
+      # Shows the plot, or saves it to 'path' (see PlotHelpers.savePlot).
+      import PlotHelpers
+      PlotHelpers.showStackedBarPlot(self.getCategorySumsByTimeRange(timeRanges, action, categories), list(timeRanges.keys()), path)
 
    #############################################################################
 
-   def plotActions(self, timeRanges, actions = []):
+   def getActionSumsByTimeRange(self, timeRanges, actions = []):
+      # Data for plotActions (PlotHelpers bar plot).
       if len(actions) == 0:
          actions = self.validActions
 
+      cols = self.__getColumnsFor(timeRanges)
+      groupedSums = cols.getGroupedSums(timeRanges)
       actionSumsBytTimeRange = {} # Dict of lists. Each dict key is a action. Each items is a list of sums in the given time range.
-
       for actionName in actions:
-         actionSumsBytTimeRange[actionName] = [] # Initialize to an empty list
-         for i in range(len(timeRanges.items())):
-            actionSumsBytTimeRange[actionName].append(0)
+         totals = cols.getActionSums(groupedSums, actionName).sum(axis=0)
+         if actionName == "expense":
+            totals = -totals # expenses are negative. Negate them to be positive.
+         actionSumsBytTimeRange[actionName] = totals.tolist()
+      return actionSumsBytTimeRange
+
+   #############################################################################
+
+   def plotActions(self, timeRanges, actions = [], path: str = None):
+      # Shows the plot, or saves it to 'path' (see PlotHelpers.savePlot).
+      import PlotHelpers
+      PlotHelpers.showBarPlotAlt(self.getActionSumsByTimeRange(timeRanges, actions), list(timeRanges.keys()), path)
 
-      timeIndex = 0
-      labels = []
-      for key, thisTimeRange in timeRanges.items():
-         for actionName in actions:
-            # Filter out non-matching transactions
-            transList = self.transList
-            transList = self.__filterByDateRange(transList, thisTimeRange[0], thisTimeRange[1])
-            transList = self.__filterByAction(transList, actionName)
-            if actionName == "expense":
-               for trans in transList:
-                  actionSumsBytTimeRange[actionName][timeIndex] -= float(trans['raw']['amount']) # expenses are negative. Negate them to be positive.
-            else:
-               for trans in transList:
-                  actionSumsBytTimeRange[actionName][timeIndex] += float(trans['raw']['amount'])
+   #############################################################################
 
-         timeIndex += 1
-         labels.append(key)
+   def __recordPrune(self, getColumnsMask, dateRange = None):
+      self.__columnsMasks.append(getColumnsMask)
+      if dateRange != None:
+         self.__datePrunes.append(dateRange)
+      self.__aggregateColumns = None
+
+   #############################################################################
 
-      PlotHelpers.showBarPlotAlt(actionSumsBytTimeRange, labels)
+   def __prune(self, filterTransList, getColumnsMask):
+      # filterTransList - Gets the transactions to keep from a transactions list. getColumnsMask - Same, for columns.
+      self.__recordPrune(getColumnsMask)
+      if self.__transList == None and self.snapshot != None:
+         # Not loaded, prune the snapshot's columns now and the transactions if they are ever loaded.
+         self.__pendingPrunes.append(filterTransList)
+         cols = self.getColumns()
+         self.__columns = cols.getSubset(getColumnsMask(cols))
+         return
+      self.__columns = None
+      if self.__transList != None:
+         self.transList = filterTransList(self.transList)
 
    #############################################################################
 
@@ -262,7 +497,13 @@ class AllTransactions(object):
    #############################################################################
 
    def pruneByDateRange(self, startInclusive: datetime = None, stopExclusive: datetime = None): # Permanent version of __filterByDateRange
-      self.transList = self.__filterByDateRange(self.transList, startInclusive, stopExclusive)
+      if self.database != None:
+         if startInclusive != None:
+            self.database.addFilter("date >= ?", [startInclusive.strftime(TRANSACTION_DATE_FORMAT)])
+         if stopExclusive != None:
+            self.database.addFilter("date < ?", [stopExclusive.strftime(TRANSACTION_DATE_FORMAT)])
+      self.__datePrunes.append([startInclusive, stopExclusive])
+      self.__prune(lambda transList: self.__filterByDateRange(transList, startInclusive, stopExclusive), lambda cols: cols.getDateRangeMask(startInclusive, stopExclusive))
 
    #############################################################################
 
@@ -276,7 +517,14 @@ class AllTransactions(object):
    #############################################################################
 
    def pruneByDateAction(self, action: str): # Permanent version of __filterByAction
-      self.transList = self.__filterByAction(self.transList, action)
+      self.__pruneByActions([action])
+
+   #############################################################################
+
+   def __pruneByActions(self, actions):
+      if self.database != None:
+         self.database.addFilter("action IN (" + ", ".join(["?"] * len(actions)) + ")", list(actions))
+      self.__prune(lambda transList: [trans for trans in transList if trans['action'] in actions], lambda cols: cols.getActionsMask(actions))
 
    #############################################################################
 
@@ -290,7 +538,9 @@ class AllTransactions(object):
    #############################################################################
 
    def pruneByCategories(self, categories): # Permanent version of __filterByCategories
-      self.transList = self.__filterByCategories(self.transList, categories)
+      if self.database != None:
+         self.database.addFilter("category IN (" + ", ".join(["?"] * len(categories)) + ")", list(categories))
+      self.__prune(lambda transList: self.__filterByCategories(transList, categories), lambda cols: cols.getCategoriesMask(categories))
                
    #############################################################################
 
@@ -300,31 +550,12 @@ class AllTransactions(object):
          expCatDict = json.load(f)
          transList = self.__filterByAction(self.transList, "expense")
          categories = expCatDict["categories"]
+         rules = TransactionRules(expCatDict['rules'], compareAmounts=True)
 
          for trans in transList:
-            ruleMatch = False
-            expenseCat = defaultCat
-            for rule in expCatDict['rules']:
-               checks = rule[0]
-               cat = rule[1]
-               ruleMatch = True # start True, must pass each check
-               for check in checks:
-                  transKey, transMatchStr = list(check.items())[0]
-                  transVal = trans['raw'][transKey]
-                  if transKey == 'amount': # Amount is special, can do greater than, less than, equal, etc
-                     cmd, val = transMatchStr.split(' ')
-                     amount = -float(transVal) # expenses are negative values so negate
-                     val = float(val)
-                     if cmd == '>' and not (amount > val): ruleMatch = False
-                     elif  cmd == '>=' and not (amount >= val): ruleMatch = False
-                     elif  cmd == '==' and not (amount == val): ruleMatch = False
-                     elif  cmd == '<=' and not (amount <= val): ruleMatch = False
-                     elif  cmd == '<' and not (amount < val): ruleMatch = False
-                  elif not re.match(transMatchStr, transVal):
-                     ruleMatch = False
-               if ruleMatch:
-                  expenseCat = cat
-                  break
+            expenseCat = rules.getMatch(trans['raw'])
+            if expenseCat == None:
+               expenseCat = defaultCat
 
             # Update the category associated with this expense.
             try:
@@ -349,32 +580,28 @@ class AllTransactions(object):
 
    def __askUserForCategory(self, trans, categories):
       retVal = None
-      while retVal == None:
-         print(f"Need to categorize: {trans['name']} - type: {trans['raw']['type']} | payee: {trans['raw']['payee']} | date: {trans['raw']['date']} | amount: {trans['raw']['amount']}.")
-         selectStr = "Select the number that matches the category: "
-         selectNum = 0
-         selectDict = {}
-         for cat in categories:
-            selectStr += f"{cat}({selectNum})', "
-            selectDict[selectNum] = cat
-            selectNum += 1
-
-         val = input(selectStr + " > ")
-         try:
-             if int(val) >= 0 and int(val) < selectNum:
-                retVal = selectDict[int(val)]
-         except:
-            pass
-         if (retVal == None): print("Invalid selection. Try again.")
+      with timings.stage('prompts'):
+         while retVal == None:
+            print(f"Need to categorize: {trans['name']} - type: {trans['raw']['type']} | payee: {trans['raw']['payee']} | date: {trans['raw']['date']} | amount: {trans['raw']['amount']}.")
+            selectStr = "Select the number that matches the category: "
+            selectNum = 0
+            selectDict = {}
+            for cat in categories:
+               selectStr += f"{cat}({selectNum})', "
+               selectDict[selectNum] = cat
+               selectNum += 1
+
+            val = input(selectStr + " > ")
+            try:
+                if int(val) >= 0 and int(val) < selectNum:
+                   retVal = selectDict[int(val)]
+            except:
+               pass
+            if (retVal == None): print("Invalid selection. Try again.")
       return retVal
 
    #############################################################################
 
    def removeCategory(self, categoryToReCategorize):
       # Remove the category from any transactions that have 'categoryToRemove' as their category
-      for trans in self.transList:
-         try:
-            if trans["category"] == categoryToReCategorize:
-               trans.pop("category") # remove category from the transaction entry
-         except:
-            pass # category didn't exist in the transaction entry, so nothing to do
+      self.__makeChange({"op": "removeCategory", "category": categoryToReCategorize})
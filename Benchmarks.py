@@ -0,0 +1,548 @@
+import io
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+import subprocess
+import importlib.util
+from datetime import datetime, timedelta
+from AllTransactions import AllTransactions
+from OfxSorter import OfxSorter
+from StockStats import getProfitOverTime
+from TransactionRules import TransactionRules
+from TransactionRecord import TransactionRecord
+from CostBasis import LOT_METHODS, getCostBasisOverTime
+from PriceStore import PriceStore, HttpPriceSource, ConcurrentPriceSource, StubPriceServer
+from FinancialHelpers import *
+
+################################################################################
+
+def makeTransactions(count: int, seed: int = 0):
+   # Synthetic transactions in the same format as the transactions json.
+   rand = random.Random(seed)
+   payees = ["AMAZON MKTPLACE", "SAFEWAY #1234", "SHELL OIL 5555", "NETFLIX.COM", "PAYROLL ACME CORP", "TRANSFER TO SAVINGS", "COSTCO WHSE #0099", "STARBUCKS STORE"]
+   categories = ["food", "gas", "shopping", "fun", "bills"]
+   start = datetime(2010, 1, 1)
+   transList = []
+   for i in range(count):
+      date = start + timedelta(days=rand.randint(0, 15*365))
+      action = rand.choice(["expense", "expense", "expense", "income", "move"])
+      amount = rand.uniform(1, 500) * (-1 if action == "expense" else 1)
+      raw = {}
+      raw["payee"] = rand.choice(payees)
+      raw["type"] = "debit" if amount < 0 else "credit"
+      raw["date"] = date.strftime(TRANSACTION_DATE_FORMAT)
+      raw["user_date"] = "None"
+      raw["amount"] = f"{amount:.2f}"
+      raw["id"] = str(i)
+      raw["memo"] = ""
+      raw["sic"] = "None"
+      raw["mcc"] = ""
+      raw["checknum"] = "None"
+      trans = {"action": action, "type": "checking", "name": "Checking", "raw": raw}
+      if action == "expense":
+         trans["category"] = rand.choice(categories)
+      transList.append(trans)
+   return transList
+
+################################################################################
+
+def makeExpenseRules(count: int, seed: int = 0):
+   # Synthetic expense rules, mostly literal payee prefixes with a few amount checks and free form regexes.
+   rand = random.Random(seed)
+   rules = []
+   for i in range(count):
+      checks = [{"payee": f"MERCHANT {i:05d}"}]
+      kind = rand.random()
+      if kind < 0.1:
+         checks = [{"payee": f".*STORE {i:05d}"}]
+      elif kind < 0.3:
+         checks.append({"amount": rand.choice(["> 50", "<= 50", ">= 100"])})
+      rules.append([checks, f"category{i % 20}"])
+   return {"categories": [f"category{i}" for i in range(20)], "rules": rules}
+
+################################################################################
+
+def makeRuleTransactions(count: int, ruleCount: int, seed: int = 0):
+   # Synthetic transactions whose payees hit (or miss) the rules from makeExpenseRules.
+   rand = random.Random(seed)
+   transList = makeTransactions(count, seed)
+   for trans in transList:
+      kind = rand.random()
+      merchant = rand.randrange(ruleCount * 2) # About half don't match any rule.
+      if kind < 0.9:
+         trans['raw']['payee'] = f"MERCHANT {merchant:05d} #{rand.randrange(1000)}"
+      else:
+         trans['raw']['payee'] = f"WEB STORE {merchant:05d}"
+   return transList
+
+################################################################################
+
+def makeOfxFile(path: str, rawList):
+   # SGML OFX (version 1) bank statement with the raw transactions (TRANSACTION_KEYS dicts) in it.
+   header = "OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\nSECURITY:NONE\nENCODING:USASCII\nCHARSET:1252\nCOMPRESSION:NONE\nOLDFILEUID:NONE\nNEWFILEUID:NONE\n"
+   lines = [header + "<OFX><SIGNONMSGSRSV1><SONRS><STATUS><CODE>0<SEVERITY>INFO</STATUS><DTSERVER>20250101<LANGUAGE>ENG</SONRS></SIGNONMSGSRSV1>",
+            "<BANKMSGSRSV1><STMTTRNRS><TRNUID>1<STATUS><CODE>0<SEVERITY>INFO</STATUS><STMTRS><CURDEF>USD",
+            "<BANKACCTFROM><BANKID>1<ACCTID>1234<ACCTTYPE>CHECKING</BANKACCTFROM><BANKTRANLIST><DTSTART>20100101<DTEND>20250101"]
+   for raw in rawList:
+      date = parseTransDateTime(raw["date"])
+      lines.append(f"<STMTTRN><TRNTYPE>{raw['type'].upper()}<DTPOSTED>{date.strftime('%Y%m%d')}<TRNAMT>{raw['amount']}<FITID>{raw['id']}<NAME>{raw['payee']}<MEMO>memo {raw['id']}</STMTTRN>")
+   lines.append("</BANKTRANLIST><LEDGERBAL><BALAMT>0.00<DTASOF>20250101</LEDGERBAL></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>")
+   with open(path, 'w') as f:
+      f.write("\n".join(lines))
+
+################################################################################
+
+def makeOfxDocs(workDir: str, count: int, fileCount: int, ruleCount: int, seed: int = 0):
+   # 'fileCount' OFX files with 'count' transactions between them (payees from makeRuleTransactions) in
+   # <workDir>/ofx, the docs json for them and the expenses json (makeExpenseRules). Returns [docs json, expenses json].
+   ofxDir = os.path.join(workDir, "ofx")
+   os.makedirs(ofxDir, exist_ok=True)
+   rawList = [trans['raw'] for trans in makeRuleTransactions(count, ruleCount, seed)]
+   for i in range(fileCount):
+      makeOfxFile(os.path.join(ofxDir, f"statement{i:04d}.ofx"), rawList[i::fileCount])
+
+   # Every transaction matches a docs rule (the last one matches anything), so nothing asks for an action.
+   docsEntry = {"dir": "ofx", "type": "checking", "name": "Checking", "rules": [[[{"payee": "PAYROLL"}], "income"], [[{"payee": "TRANSFER"}], "move"], [[{"payee": ".*"}], "expense"]]}
+   pathToDocsJson = os.path.join(workDir, "docs.json")
+   with open(pathToDocsJson, 'w') as f:
+      json.dump([docsEntry], f)
+   pathToExpensesJson = os.path.join(workDir, "expenses.json")
+   with open(pathToExpensesJson, 'w') as f:
+      json.dump(makeExpenseRules(ruleCount, seed), f)
+   return [pathToDocsJson, pathToExpensesJson]
+
+################################################################################
+
+def makeTrades(count: int, symbolCount: int = 20, seed: int = 0):
+   # Synthetic trades (same format as the StockStats trades json) and daily closes ({date: {symbol: close}}) for
+   # every weekday they span. Sells never sell more shares than are held and name the lot of one of the last few buys.
+   rand = random.Random(seed)
+   symbols = [f"SYM{i:02d}" for i in range(symbolCount)]
+   start = datetime(2010, 1, 1)
+   history = {}
+   closes = {symbol: rand.uniform(10, 500) for symbol in symbols}
+   for day in range(15*365):
+      date = start + timedelta(days=day)
+      if date.weekday() < 5:
+         closes = {symbol: max(1.0, close * rand.uniform(0.97, 1.03)) for symbol, close in closes.items()}
+         history[date] = dict(closes)
+   days = list(history.keys())
+
+   trades = []
+   held = {symbol: 0 for symbol in symbols}
+   buyDates = {symbol: [] for symbol in symbols}
+   for date in sorted([rand.choice(days) for i in range(count)]):
+      symbol = rand.choice(symbols)
+      trade = {"Date": date.strftime("%Y-%m-%d"), "Symbol": symbol, "Trade": "Buy", "Shares": str(rand.randint(1, 100))}
+      if held[symbol] > 0 and rand.random() < 0.4:
+         trade["Trade"] = "Sell"
+         trade["Shares"] = str(rand.randint(1, held[symbol]))
+         trade["Lot"] = rand.choice(buyDates[symbol][-5:]) # Recent buys, more likely to still be open.
+         held[symbol] -= int(trade["Shares"])
+      else:
+         held[symbol] += int(trade["Shares"])
+         buyDates[symbol].append(trade["Date"])
+      trade["Cost"] = f"{history[date][symbol]:.2f}"
+      trade["Total"] = f"{int(trade['Shares']) * float(trade['Cost']):.2f}"
+      trades.append(trade)
+   return [trades, history]
+
+################################################################################
+
+def timeIt(func, repeat: int = 3):
+   # Best of 'repeat' runs, in seconds.
+   best = None
+   for i in range(repeat):
+      start = time.perf_counter()
+      func()
+      elapsed = time.perf_counter() - start
+      best = elapsed if best == None or elapsed < best else best
+   return best
+
+################################################################################
+
+def printResult(name: str, seconds: float, baseSeconds: float = None):
+   speedup = f" ({baseSeconds / seconds:0.1f}x)" if baseSeconds != None and seconds > 0 else ""
+   print(f"   {name:<40} {seconds*1000.0:10.2f} ms{speedup}")
+
+################################################################################
+
+failedChecks = [] # Messages of the checks that failed, the benchmarks exit with 1 if there are any.
+
+def printError(message: str):
+   failedChecks.append(message)
+   print(f"   ERROR: {message}")
+
+################################################################################
+
+def benchDates(count: int, workDir: str):
+   print(f"Parsing transaction dates ({count} transactions)")
+   pathToTransJson = os.path.join(workDir, "trans.json")
+   with open(pathToTransJson, 'w') as f:
+      json.dump(makeTransactions(count), f)
+   allTrans = AllTransactions(pathToTransJson)
+
+   strptimeTime = timeIt(lambda: [datetime.strptime(trans['raw']['date'], TRANSACTION_DATE_FORMAT) for trans in allTrans.transList])
+   printResult("strptime", strptimeTime)
+   printResult("parseTransDateTime", timeIt(lambda: [parseTransDateTime(trans['raw']['date']) for trans in allTrans.transList]), strptimeTime)
+   printResult("getTransActionDateTime (cached)", timeIt(lambda: [allTrans.getTransActionDateTime(trans) for trans in allTrans.transList]), strptimeTime)
+
+################################################################################
+
+def getPeakMemory(func):
+   # Peak memory (bytes) allocated while running func.
+   tracemalloc.start()
+   func()
+   peak = tracemalloc.get_traced_memory()[1]
+   tracemalloc.stop()
+   return peak
+
+################################################################################
+
+def benchLoad(count: int, workDir: str):
+   print(f"Loading one year of transactions ({count} transactions in the json)")
+   pathToTransJson = os.path.join(workDir, "trans.json")
+   with open(pathToTransJson, 'w') as f:
+      json.dump(makeTransactions(count), f)
+   start = datetime(2015, 1, 1)
+   stop = datetime(2016, 1, 1)
+
+   def loadThenPrune():
+      allTrans = AllTransactions(pathToTransJson)
+      allTrans.pruneByDateRange(start, stop)
+   def loadStreaming():
+      AllTransactions(pathToTransJson, startInclusive=start, stopExclusive=stop)
+
+   fullTime = timeIt(loadThenPrune)
+   printResult("load then pruneByDateRange", fullTime)
+   printResult("load with a date range", timeIt(loadStreaming), fullTime)
+   print(f"   Peak memory: {getPeakMemory(loadThenPrune) / 1e6:0.1f} MB vs {getPeakMemory(loadStreaming) / 1e6:0.1f} MB")
+   checkJsonListChunks(workDir)
+
+################################################################################
+
+def checkJsonListChunks(workDir: str):
+   # iterJsonList has to decode the same as json.load however the file is cut into chunks (i.e. numbers split
+   # between chunks, '-1.' then '5').
+   lists = [[-1.5, 2], [{}, -15000000000.0], [1e5, 2e-3, -0.25, 12345678901234567890], [True, False, None, "a,]", [1.5], {"x": -2.5e3}], []]
+   lists.append(makeTransactions(20) + random.Random(0).sample(range(-10**9, 10**9), 20) + [0.001 * i for i in range(-20, 20)])
+   path = os.path.join(workDir, "chunks.json")
+   for items in lists:
+      with open(path, 'w') as f:
+         json.dump(items, f, indent=(None if len(items) % 2 == 0 else 1))
+      with open(path, 'r') as f:
+         expected = json.load(f)
+      for chunkSize in [1, 2, 3, 5, 7, 64]:
+         try:
+            matches = list(iterJsonList(path, chunkSize)) == expected
+         except ValueError:
+            matches = False
+         if not matches:
+            printError(f"iterJsonList with {chunkSize} character chunks doesn't match json.load for {json.dumps(items)[:40]}")
+
+################################################################################
+
+def getRetainedMemory(func):
+   # Memory (bytes) still allocated for what func returns.
+   tracemalloc.start()
+   result = func()
+   current = tracemalloc.get_traced_memory()[0]
+   tracemalloc.stop()
+   return current
+
+################################################################################
+
+def benchRecords(count: int, workDir: str):
+   print(f"Storing transactions as records ({count} transactions)")
+   pathToTransJson = os.path.join(workDir, "trans.json")
+   with open(pathToTransJson, 'w') as f:
+      json.dump(makeTransactions(count), f)
+
+   def loadDicts():
+      return list(iterJsonList(pathToTransJson))
+   def loadRecords():
+      return [TransactionRecord(trans) for trans in iterJsonList(pathToTransJson)]
+
+   dictTime = timeIt(loadDicts)
+   printResult("load as dicts", dictTime)
+   printResult("load as records", timeIt(loadRecords), dictTime)
+   print(f"   Memory: {getRetainedMemory(loadDicts) / 1e6:0.1f} MB vs {getRetainedMemory(loadRecords) / 1e6:0.1f} MB")
+   if [trans.toDict() for trans in loadRecords()] != loadDicts():
+      printError("records don't convert back to the same json")
+
+################################################################################
+
+def benchSnapshot(count: int, workDir: str):
+   print(f"Monthly expense breakdown from a fresh start ({count} transactions)")
+   pathToTransJson = os.path.join(workDir, "trans.json")
+   with open(pathToTransJson, 'w') as f:
+      json.dump(makeTransactions(count), f)
+
+   def breakdown(snapshot: bool):
+      AllTransactions(pathToTransJson, snapshot=snapshot).getActionMonthlyBreakdown('expense')
+
+   jsonTime = timeIt(lambda: breakdown(False))
+   printResult("from the json", jsonTime)
+   breakdown(True) # Writes the snapshot.
+   printResult("from the snapshot", timeIt(lambda: breakdown(True)), jsonTime)
+
+################################################################################
+
+def benchLots(count: int):
+   print(f"Cost basis and realized / unrealized gains over time ({count} trades)")
+   trades, history = makeTrades(count)
+   for method in LOT_METHODS:
+      printResult(f"getCostBasisOverTime ({method})", timeIt(lambda: getCostBasisOverTime(trades, history, method)))
+
+      # Realized + unrealized gain has to be the value of what is held minus what was paid (net of what was sold).
+      days, costBasis, realized, unrealized = getCostBasisOverTime(trades, history, method)
+      held = {}
+      paid = 0.0
+      for trade in trades:
+         shares = float(trade["Shares"]) * (-1 if trade["Trade"] == "Sell" else 1)
+         held[trade["Symbol"]] = held.get(trade["Symbol"], 0) + shares
+         paid += shares * float(trade["Cost"])
+      value = sum([shares * history[days[-1]][symbol] for symbol, shares in held.items()])
+      if abs(realized[-1] + unrealized[-1] - (value - paid)) > 1e-6 * max(1.0, abs(value)):
+         printError(f"realized + unrealized gain ({realized[-1] + unrealized[-1]}) isn't the total gain ({value - paid}) with {method}")
+
+################################################################################
+
+def benchPrices(symbolCount: int, delay: float, jobs: int):
+   print(f"Downloading prices from a local stub server ({symbolCount} symbols, {delay} s per request, every 10th request fails)")
+   trades, history = makeTrades(100, symbolCount)
+   prices = {}
+   for day, closes in history.items():
+      for symbol, close in closes.items():
+         prices.setdefault(symbol, {})[day.strftime("%Y-%m-%d")] = close
+   symbols = sorted(prices.keys())
+
+   with StubPriceServer(prices, delay, failEvery=10) as server:
+      def download(jobs: int):
+         source = ConcurrentPriceSource(HttpPriceSource(server.url), jobs, retries=3, backoff=delay)
+         history = PriceStore(None, source).getHistory(symbols, "2010-01-01", "2025-01-01")
+         return [source, history]
+
+      sequentialTime = timeIt(lambda: download(1), 1)
+      printResult("1 at a time", sequentialTime)
+      printResult(f"{jobs} at a time", timeIt(lambda: download(jobs), 1), sequentialTime)
+      requests = server.requests
+      source, downloaded = download(jobs)
+      slowest = max(source.timings.items(), key=lambda item: item[1][0])
+      print(f"   Slowest symbol: {slowest[0]} {slowest[1][0]*1000.0:0.2f} ms ({slowest[1][1]} attempt(s)), {server.requests - requests} requests")
+      if {day: closes for day, closes in history.items() if day < datetime(2025, 1, 1)} != downloaded:
+         printError("the downloaded prices don't match the server's")
+
+################################################################################
+
+def benchRules(count: int, ruleCount: int):
+   print(f"Matching expense rules ({ruleCount} rules x {count} transactions)")
+   rules = TransactionRules(makeExpenseRules(ruleCount)['rules'], compareAmounts=True)
+   rawList = [trans['raw'] for trans in makeRuleTransactions(count, ruleCount)]
+
+   # Every rule in order is slow, so only time a slice of the transactions and scale it up.
+   sliceCount = min(count, 5000)
+   sequentialTime = timeIt(lambda: [rules.getMatchSequential(raw) for raw in rawList[:sliceCount]], 1) * count / sliceCount
+   printResult("getMatchSequential (estimated)", sequentialTime)
+   printResult("getMatch", timeIt(lambda: [rules.getMatch(raw) for raw in rawList], 1), sequentialTime)
+
+   mismatches = sum([1 for raw in rawList[:sliceCount] if rules.getMatch(raw) != rules.getMatchSequential(raw)])
+   if mismatches > 0:
+      printError(f"{mismatches} transaction(s) matched a different rule")
+
+################################################################################
+
+SUITE_STAGES = ["importOfx", "applyRulesToTransactions", "categorizeExpenses", "getActionBreakdown", "saveTransactions", "makeTransactionSpreadsheet", "getProfitOverTime"]
+SUITE_MIN_REGRESSION = 0.005 # Seconds, slower than the baseline by less than this is noise.
+
+################################################################################
+
+def runSuitePipeline(workDir: str, pathToDocsJson: str, pathToExpensesJson: str, trades, history):
+   # Import the OFX files into a new transactions json, categorize, report, save, export, then the profit of the
+   # trades. Returns {stage: seconds} (SUITE_STAGES).
+   times = {}
+   def timeStage(name: str, func):
+      start = time.perf_counter()
+      result = func()
+      times[name] = time.perf_counter() - start
+      return result
+
+   pathToTransJson = os.path.join(workDir, "trans.json")
+   for fileName in os.listdir(workDir):
+      if fileName.startswith("trans"):
+         os.remove(os.path.join(workDir, fileName)) # Start from nothing (the json, its backups and the spreadsheet).
+   allTrans = AllTransactions(pathToTransJson)
+   with open(pathToDocsJson, 'r') as f:
+      docsEntry = json.load(f)[0]
+   ofxDir = os.path.join(os.path.dirname(pathToDocsJson), docsEntry["dir"])
+   rules = TransactionRules(docsEntry["rules"])
+   sorters = [OfxSorter(os.path.join(ofxDir, fileName), allTrans, docsEntry, rules) for fileName in sorted(os.listdir(ofxDir))]
+
+   def importOfx():
+      for sorter in sorters:
+         sorter.importOfx()
+   def applyRules():
+      for sorter in sorters:
+         sorter.applyRulesToTransactions()
+
+   timeStage("importOfx", importOfx)
+   timeStage("applyRulesToTransactions", applyRules)
+   timeStage("categorizeExpenses", lambda: allTrans.categorizeExpenses(pathToExpensesJson, defaultCat='other'))
+   months = allTrans.getActionTimeRanges('expense')
+   timeStage("getActionBreakdown", lambda: allTrans.getActionBreakdown(months, 'expense'))
+   timeStage("saveTransactions", allTrans.saveTransactions)
+   timeStage("makeTransactionSpreadsheet", lambda: allTrans.makeTransactionSpreadsheet(os.path.join(workDir, "trans.xlsx")))
+   timeStage("getProfitOverTime", lambda: getProfitOverTime(trades, history))
+   return times
+
+################################################################################
+
+def runSuite(sizes, workDir: str, fileCount: int, ruleCount: int, repeat: int = 3):
+   # Times each stage (best of 'repeat' runs of the whole pipeline) for each size, 'size' transactions in 'fileCount'
+   # OFX files and size / 100 trades. Returns {size (as a string, like the baseline json): {stage: seconds}}.
+   results = {}
+   for size in sizes:
+      sizeDir = os.path.join(workDir, f"suite{size}")
+      os.makedirs(sizeDir, exist_ok=True)
+      pathToDocsJson, pathToExpensesJson = makeOfxDocs(sizeDir, size, fileCount, ruleCount)
+      trades, history = makeTrades(max(10, size // 100))
+      best = {}
+      for i in range(repeat):
+         with contextlib.redirect_stdout(io.StringIO()): # The pipeline prints what it saves / recategorizes.
+            times = runSuitePipeline(sizeDir, pathToDocsJson, pathToExpensesJson, trades, history)
+         best = {stage: min(seconds, best.get(stage, seconds)) for stage, seconds in times.items()}
+      results[str(size)] = best
+      print(f"   {size} transactions done ({sum(best.values()):0.2f} s)")
+   return results
+
+################################################################################
+
+def printScaling(results):
+   # Time per stage for each size, and how it grows between sizes (the exponent k in time ~ size^k).
+   sizes = sorted(results.keys(), key=int)
+   print(f"   {'stage':<28}" + "".join([f"{size:>12}" for size in sizes]) + "   scaling")
+   for stage in SUITE_STAGES:
+      seconds = [results[size].get(stage) for size in sizes]
+      exponents = []
+      for i in range(1, len(sizes)):
+         if seconds[i-1] and seconds[i]:
+            exponents.append(f"n^{math.log(seconds[i] / seconds[i-1]) / math.log(int(sizes[i]) / int(sizes[i-1])):0.2f}")
+      print(f"   {stage:<28}" + "".join([f"{value*1000.0:9.1f} ms" if value != None else f"{'-':>12}" for value in seconds]) + "   " + ", ".join(exponents))
+
+################################################################################
+
+def getRegressions(results, baseline, tolerance: float):
+   # [size, stage, seconds, baseline seconds] for the stages more than 'tolerance' (a fraction) slower than the
+   # baseline, sizes / stages that aren't in the baseline are skipped.
+   regressions = []
+   for size, times in results.items():
+      for stage, seconds in times.items():
+         baseSeconds = baseline.get(size, {}).get(stage)
+         if baseSeconds != None and seconds > baseSeconds * (1.0 + tolerance) and seconds - baseSeconds > SUITE_MIN_REGRESSION:
+            regressions.append([size, stage, seconds, baseSeconds])
+   return regressions
+
+################################################################################
+
+CLI_MODULES = ["OfxSorter", "FinancialDocsImport", "FinancialExport", "ReCategorize", "StockStats"]
+HEAVY_MODULES = ["numpy", "pandas", "matplotlib.pyplot", "yfinance"]
+
+################################################################################
+
+def getImportTime(module: str, preload = []):
+   # [seconds, HEAVY_MODULES loaded] to import 'preload' then 'module' in a new interpreter (so nothing is imported yet).
+   code = "import sys, time, json\nstart = time.perf_counter()\n"
+   code += "".join([f"import {name}\n" for name in preload + [module]])
+   code += f"print(json.dumps([time.perf_counter() - start, [name for name in {HEAVY_MODULES!r} if name in sys.modules]]))"
+   output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout
+   return json.loads(output)
+
+################################################################################
+
+def benchImports(repeat: int = 5):
+   # Startup of each command line tool (importing it), compared with also importing the heavy modules up front.
+   heavy = [name for name in HEAVY_MODULES if importlib.util.find_spec(name.split('.')[0]) != None]
+   print(f"Importing the command line tools (best of {repeat}, eager = {', '.join(heavy)} imported first)")
+   for module in CLI_MODULES:
+      getImportTime(module) # Writes the .pyc files.
+      lazyTime = min([getImportTime(module)[0] for i in range(repeat)])
+      eagerTime = min([getImportTime(module, heavy)[0] for i in range(repeat)])
+      loaded = getImportTime(module)[1]
+      printResult(f"{module} (eager)", eagerTime)
+      printResult(f"{module}", lazyTime, eagerTime)
+      print(f"      loads: {', '.join(loaded) if len(loaded) > 0 else 'none of ' + ', '.join(HEAVY_MODULES)}")
+
+################################################################################
+
+# Main start
+if __name__== "__main__":
+   parser = argparse.ArgumentParser()
+   parser.add_argument("-n", "--count", type=int, default=100000, help="Number of synthetic transactions.")
+   parser.add_argument("-r", "--rules", type=int, default=1000, help="Number of synthetic rules.")
+   parser.add_argument("--dates", action='store_true', help="Benchmark parsing transaction dates.")
+   parser.add_argument("--match", action='store_true', help="Benchmark matching transactions against the expense rules.")
+   parser.add_argument("--load", action='store_true', help="Benchmark loading part of the transactions json.")
+   parser.add_argument("--snapshot", action='store_true', help="Benchmark reports from the binary snapshot instead of the json.")
+   parser.add_argument("--lots", action='store_true', help="Benchmark tracking the cost basis of the lots of synthetic trades (uses --trades).")
+   parser.add_argument("-t", "--trades", type=int, default=50000, help="Number of synthetic trades.")
+   parser.add_argument("--prices", action='store_true', help="Benchmark downloading the prices of many symbols from a local stub server.")
+   parser.add_argument("--price_jobs", type=int, default=8, help="Number of symbols to download at the same time for --prices.")
+   parser.add_argument("--records", action='store_true', help="Benchmark storing transactions as records instead of dicts.")
+   parser.add_argument("--imports", action='store_true', help="Benchmark how long each command line tool takes to import (its startup time).")
+   parser.add_argument("--suite", action='store_true', help="Time import, categorization, reports, saving, export and stock profit at each of --sizes.")
+   parser.add_argument("--sizes", default="1000,5000,20000", help="Number of transactions for each run of --suite (separated by commas). Each run also has size / 100 trades.")
+   parser.add_argument("--ofx_files", type=int, default=10, help="Number of OFX files the --suite transactions are split between.")
+   parser.add_argument("--repeat", type=int, default=3, help="Runs of each --suite size (the best time of each stage is kept).")
+   parser.add_argument("--baseline", help="Json of --suite times to compare against, fails if any stage is slower by more than --tolerance. Times depend on the machine, so there isn't one in the repo: if the json doesn't exist the times of this run are saved to it, to compare the later runs on the same machine against.")
+   parser.add_argument("--tolerance", type=float, default=0.25, help="Fraction a --suite stage can be slower than the baseline.")
+   parser.add_argument("--save_baseline", help="Save the --suite times to this json (i.e. to be the --baseline of later runs).")
+   args = parser.parse_args()
+
+   with tempfile.TemporaryDirectory() as workDir:
+      if args.dates:
+         benchDates(args.count, workDir)
+      if args.match:
+         benchRules(args.count, args.rules)
+      if args.load:
+         benchLoad(args.count, workDir)
+      if args.records:
+         benchRecords(args.count, workDir)
+      if args.snapshot:
+         benchSnapshot(args.count, workDir)
+      if args.lots:
+         benchLots(args.trades)
+      if args.prices:
+         benchPrices(40, 0.1, args.price_jobs)
+      if args.imports:
+         benchImports()
+      if args.suite:
+         sizes = [int(size) for size in args.sizes.split(',')]
+         print(f"Benchmark suite ({', '.join(map(str, sizes))} transactions in {args.ofx_files} OFX files, {args.rules} rules)")
+         results = runSuite(sizes, workDir, args.ofx_files, args.rules, args.repeat)
+         printScaling(results)
+         if args.save_baseline != None:
+            with open(args.save_baseline, 'w') as f:
+               json.dump(results, f, indent=1)
+         if args.baseline != None and not os.path.isfile(args.baseline):
+            with open(args.baseline, 'w') as f:
+               json.dump(results, f, indent=1)
+            print(f"   No baseline yet, saved these times to {args.baseline}")
+         elif args.baseline != None:
+            with open(args.baseline, 'r') as f:
+               regressions = getRegressions(results, json.load(f), args.tolerance)
+            for size, stage, seconds, baseSeconds in regressions:
+               print(f"   REGRESSION: {stage} ({size} transactions) {seconds*1000.0:0.1f} ms vs {baseSeconds*1000.0:0.1f} ms in the baseline")
+               failedChecks.append(f"{stage} regressed")
+            if len(regressions) == 0:
+               print(f"   No regressions against {args.baseline}")
+
+   if len(failedChecks) > 0:
+      print(f"{len(failedChecks)} check(s) failed")
+      sys.exit(1)
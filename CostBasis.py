@@ -0,0 +1,179 @@
+from collections import deque
+import numpy as np
+from PriceStore import getCloseMatrix, getHoldingsValue
+
+LOT_METHODS = ["fifo", "lifo", "specific"]
+SHARE_EPSILON = 1e-9 # Fewer shares than this left in a lot (float rounding of fractional shares) is a closed lot.
+
+################################################################################
+
+class Lot(object):
+    """Shares bought in one trade that haven't been sold yet."""
+    __slots__ = ["symbol", "date", "lotId", "shares", "costPer"]
+
+    def __init__(self, symbol: str, date: str, lotId: str, shares: float, costPer: float):
+        self.symbol = symbol
+        self.date = date
+        self.lotId = lotId
+        self.shares = shares
+        self.costPer = costPer
+
+    def __repr__(self):
+        return f"Lot({self.symbol}, {self.date}, {self.lotId}, {self.shares}, {self.costPer})"
+
+################################################################################
+
+class LotTracker(object):
+    """
+    Open lots per symbol, updated one trade at a time (in date order). A buy opens a lot, a sell closes shares from
+    the open lots in the order of the lot method:
+        fifo     - Oldest lot first.
+        lifo     - Newest lot first.
+        specific - The lots named by the sell's "Lot" (the buys with that "Lot", or that "Date" if they don't have a
+                   "Lot"), then oldest lot first.
+
+    Each symbol's lots are a deque in buy order, so fifo / lifo only touch the ends. Lots sold from the middle
+    (specific) are emptied in place and dropped once they reach an end. The shares, cost basis and realized gain of
+    each symbol are running totals, so nothing is summed over the lots.
+    """
+
+    def __init__(self, method: str = "fifo"):
+        if method not in LOT_METHODS:
+            raise ValueError(f"Unknown lot method: {method} (expected one of {LOT_METHODS})")
+        self.method = method
+        self.lots = {} # Symbol -> deque of Lots, oldest first.
+        self.lotsById = {} # (symbol, lot id) -> Lots with that id (only for 'specific').
+        self.shares = {} # Symbol -> shares held.
+        self.costBasis = {} # Symbol -> cost of the shares held.
+        self.realized = {} # Symbol -> realized gain.
+
+    ############################################################################
+
+    def addTrade(self, trade: dict):
+        """
+        Parameters
+        ----------
+        trade : dict
+            A trade from the trades json ({"Date", "Symbol", "Trade", "Shares", "Cost", ...}), trades must be added
+            in date order.
+
+        Returns
+        -------
+        list
+            [change in shares held, change in cost basis, realized gain] from the trade.
+        """
+        symbol = trade["Symbol"]
+        shares = float(trade["Shares"])
+        costPer = float(trade["Cost"])
+        if symbol not in self.lots:
+            self.lots[symbol] = deque()
+            self.shares[symbol] = 0.0
+            self.costBasis[symbol] = 0.0
+            self.realized[symbol] = 0.0
+
+        if trade["Trade"].lower() != "sell":
+            lot = Lot(symbol, trade["Date"], str(trade.get("Lot", trade["Date"])), shares, costPer)
+            self.lots[symbol].append(lot)
+            if self.method == "specific":
+                self.lotsById.setdefault((symbol, lot.lotId), []).append(lot)
+            self.shares[symbol] += shares
+            self.costBasis[symbol] += shares * costPer
+            return [shares, shares * costPer, 0.0]
+
+        if shares > self.shares[symbol] + SHARE_EPSILON:
+            raise ValueError(f"{trade['Date']}: Selling {shares} shares of {symbol}, only {self.shares[symbol]} are held.")
+        soldCost = 0.0
+        remaining = shares
+        if self.method == "specific" and trade.get("Lot") != None:
+            key = (symbol, str(trade["Lot"]))
+            for lot in self.lotsById.get(key, []):
+                if remaining <= SHARE_EPSILON:
+                    break
+                sold = min(remaining, lot.shares)
+                soldCost += sold * lot.costPer
+                lot.shares -= sold
+                remaining -= sold
+            if key in self.lotsById:
+                self.lotsById[key] = [lot for lot in self.lotsById[key] if lot.shares > SHARE_EPSILON]
+        lots = self.lots[symbol]
+        while remaining > SHARE_EPSILON:
+            self.__dropClosedLots(lots)
+            lot = lots[-1] if self.method == "lifo" else lots[0]
+            sold = min(remaining, lot.shares)
+            soldCost += sold * lot.costPer
+            lot.shares -= sold
+            remaining -= sold
+        self.__dropClosedLots(lots)
+
+        realized = shares * costPer - soldCost
+        self.shares[symbol] -= shares
+        self.costBasis[symbol] -= soldCost
+        self.realized[symbol] += realized
+        return [-shares, -soldCost, realized]
+
+    ############################################################################
+
+    def __dropClosedLots(self, lots: deque):
+        while len(lots) > 0 and lots[0].shares <= SHARE_EPSILON:
+            lots.popleft()
+        while len(lots) > 0 and lots[-1].shares <= SHARE_EPSILON:
+            lots.pop()
+
+    ############################################################################
+
+    def getOpenLots(self, symbol: str):
+        """The lots of 'symbol' that still have shares, oldest first."""
+        return [lot for lot in self.lots.get(symbol, []) if lot.shares > SHARE_EPSILON]
+
+    def getSymbols(self):
+        return list(self.lots.keys())
+
+################################################################################
+
+def getCostBasisOverTime(trades, stockHistory: dict, method: str = "fifo", tracker: LotTracker = None):
+    """
+    Cost basis, realized gain and unrealized gain for every day from the first trade on. The trades go through a
+    LotTracker once, in date order (trades on the same day in the order they are in), then each trade's changes
+    count from its first trading day on (cumulative sums, same as StockStats.getPortfolioOverTime).
+
+    Parameters
+    ----------
+    trades : list
+        Trades from the trades json.
+    stockHistory : dict
+        {date: {symbol: close}}, i.e. a StockStats.StockHistory.
+    method : str
+        Lot method, one of LOT_METHODS (ignored when a tracker is passed in).
+    tracker : LotTracker
+        Tracker to add the trades to (i.e. to look at the open lots afterwards), a new one if None.
+
+    Returns
+    -------
+    list
+        [days, costBasis, realized, unrealized], realized is the total realized gain up to that day.
+    """
+    tracker = tracker if tracker != None else LotTracker(method)
+    days = stockHistory.getDays() if hasattr(stockHistory, "getDays") else sorted(stockHistory)
+    orderedTrades = sorted(trades, key=lambda trade: trade["Date"]) # "YYYY-MM-DD" sorts by date, ties stay in order.
+    changes = np.array([tracker.addTrade(trade) for trade in orderedTrades], dtype=np.float64).reshape(-1, 3)
+    if len(days) == 0 or len(trades) == 0:
+        return [[], [], [], []]
+
+    symbols = tracker.getSymbols()
+    symbolIndexes = {symbol: i for i, symbol in enumerate(symbols)}
+    prices = getCloseMatrix(stockHistory, days, symbols)
+
+    dayStamps = np.array([np.datetime64(day, 's') for day in days])
+    tradeDates = np.array([np.datetime64(trade["Date"], 's') for trade in orderedTrades])
+    startIndexes = np.searchsorted(dayStamps, tradeDates, side='left')
+    tradeSymbols = np.array([symbolIndexes[trade["Symbol"]] for trade in orderedTrades])
+    active = startIndexes < len(days) # Trades after the last day never count.
+
+    shareChanges = np.zeros((len(days), len(symbols)))
+    np.add.at(shareChanges, (startIndexes[active], tradeSymbols[active]), changes[active, 0])
+    value = getHoldingsValue(np.cumsum(shareChanges, axis=0), prices, days, symbols)
+    costBasis = np.cumsum(np.bincount(startIndexes[active], changes[active, 1], len(days)))
+    realized = np.cumsum(np.bincount(startIndexes[active], changes[active, 2], len(days)))
+
+    first = startIndexes.min()
+    return [days[first:], costBasis[first:].tolist(), realized[first:].tolist(), (value - costBasis)[first:].tolist()]
@@ -1,8 +1,8 @@
-import os
-import json
 import argparse
 from AllTransactions import AllTransactions
-from OfxSorter import OfxSorter
+from OfxSorter import importDocs
+from ImportManifest import ImportManifest
+from Timings import timings
 
 ################################################################################
 
@@ -12,27 +12,33 @@ if __name__== "__main__":
    parser.add_argument("-d", "--docs", required=True, help="Json that describes the documents to read.")
    parser.add_argument("-t", "--trans", required=True, help="Json contains all the previous parsed transactions.")
    parser.add_argument("-e", "--expenses", required=True, help="Json that defines how to categorize expenses.")
+   parser.add_argument("-f", "--force", action='store_true', help="Re-import documents even if they were already imported.")
+   parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of processes to use for parsing documents.")
+   parser.add_argument("--journal", action='store_true', help="Save changes to an append only journal instead of rewriting the transactions json (the journal is used from then on).")
+   parser.add_argument("--no_aggregates", action='store_true', help="Don't keep the saved monthly sums per action / category up to date.")
+   parser.add_argument("--streaming", action='store_true', help="Read the transactions straight out of the documents instead of with the full OFX parser (falls back to it when needed).")
+   parser.add_argument("--timings", help="Save the wall / CPU time of each stage, counts of the work done and the peak memory to this json.")
+   parser.add_argument("--profile", help="Profile the run with cProfile and save the stats to this file (i.e. for pstats or snakeviz).")
    args = parser.parse_args()
+   timings.start(args.timings, args.profile)
 
    # Import transactions from the json file.
-   allTrans = AllTransactions(args.trans)
+   timings.startStage("load")
+   allTrans = AllTransactions(args.trans, args.journal, aggregates=not args.no_aggregates)
+   manifest = ImportManifest(args.trans)
+
+   # Parse the documents that contain transactions (skipping the ones that were already imported).
+   timings.startStage("importDocs")
+   importDocs(args.docs, allTrans, manifest, args.force, args.jobs, args.streaming)
 
-   # Parse the documents that contain transactions.
-   with open(args.docs, 'r') as f:
-      docsEntries = json.load(f)
-      for docsEntry in docsEntries:
-         fullDir = os.path.join(os.path.dirname(args.docs), docsEntry["dir"])
-         for fileName in os.listdir(fullDir):
-            fileName = os.path.join(fullDir, fileName)
-            if os.path.isfile(fileName):
-               ext = os.path.splitext(fileName)[1].lower()
-               if ext == '.ofx' or ext == '.qfx' or ext == '.qbo':
-                  ofx = OfxSorter(fileName, allTrans, docsEntry)
-                  ofx.importOfx()
-                  ofx.applyRulesToTransactions()
-   
    # Categorize expenses based on the expenses json file.
+   timings.startStage("categorizeExpenses")
    allTrans.categorizeExpenses(args.expenses)
 
    # Save transactions before exiting.
-   allTrans.saveTransactions()
\ No newline at end of file
+   timings.startStage("save")
+   allTrans.saveTransactions()
+   manifest.saveManifest()
+   timings.counts['transactionsAdded'] += allTrans.transactionsAdded
+   timings.counts['transactionsModified'] += allTrans.transactionsModified
+   timings.finish(args.timings, args.profile, "FinancialDocsImport.py", vars(args))
\ No newline at end of file
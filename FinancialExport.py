@@ -3,6 +3,9 @@ import argparse
 from datetime import datetime, timedelta
 from AllTransactions import AllTransactions
 from FinancialHelpers import *
+import PlotHelpers
+from TransactionExport import EXPORT_FORMATS
+from Timings import timings
 
 ################################################################################
 
@@ -18,6 +21,27 @@ def getDateTimeFromCmdLineArg(arg: str):
 
 ################################################################################
 
+def getReportPlots(allTrans: AllTransactions, reportDir: str, fileFormat: str = 'png', categories = []):
+   # The plots of the report pack ([kind, dataDict, barGroupLabels, path, title], see PlotHelpers.renderPlot):
+   # expenses by category and all the actions, by year for the whole range then by month for each year.
+   plots = []
+   months = allTrans.getActionTimeRanges('expense')
+   if len(months) == 0:
+      return plots
+
+   def addPlots(name: str, timeRanges):
+      labels = list(timeRanges.keys())
+      plots.append(['stackedBar', allTrans.getCategorySumsByTimeRange(timeRanges, 'expense', categories), labels, os.path.join(reportDir, f"expenses_{name}.{fileFormat}"), f"Expenses ({name})"])
+      plots.append(['barAlt', allTrans.getActionSumsByTimeRange(timeRanges), labels, os.path.join(reportDir, f"actions_{name}.{fileFormat}"), f"Actions ({name})"])
+
+   years = allTrans.getActionTimeRanges('expense', True)
+   addPlots("years", years)
+   for year, [yearStart, yearEnd] in years.items():
+      addPlots(year, {key: timeRange for key, timeRange in months.items() if timeRange[0].year == yearStart.year})
+   return plots
+
+################################################################################
+
 # Main start
 if __name__== "__main__":
    def list_of_strings(arg):
@@ -29,19 +53,31 @@ if __name__== "__main__":
    parser.add_argument("-E", "--end", help="Time Range End (inclusive). Format is YY (for year only), YY:MM (year and month), YY:MM:DD (down to the day).")
    parser.add_argument("-Y", "--years", type=float, help="How many years in the range.")
    parser.add_argument("-M", "--months", type=float, help="How many month in the range.")
-   parser.add_argument("-x", "--excel", help="Path to save spreadsheet to.")
+   parser.add_argument("-x", "--excel", help="Path to save spreadsheet to (.xlsx, .csv, .parquet or .feather).")
+   parser.add_argument("--excel_format", default='xlsx', choices=EXPORT_FORMATS, help="Spreadsheet format when --excel is a directory.")
    parser.add_argument("-e", "--expenses_plot", action='store_true', help="Plot expenses.")
    parser.add_argument("-a", "--actions_plot", action='store_true', help="Plot expenses.")
    parser.add_argument("--plot_years", action='store_true', help="Plot by year (rather than by month).")
    parser.add_argument('--categories', default=[], type=list_of_strings, help="Categories to plot (separated by commas, without spaces)")
+   parser.add_argument("--as_of", help="Use the transactions as they were at this time (needs a transactions journal). Same format as --start.")
+   parser.add_argument("--report_dir", help="Render the report pack (expenses / actions plots by year, and by month for each year) to this directory, without showing anything.")
+   parser.add_argument("--report_format", default='png', choices=PlotHelpers.PLOT_FILE_FORMATS, help="File format of the report pack plots.")
+   parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of processes to use for rendering the report pack.")
+   parser.add_argument("--no_snapshot", action='store_true', help="Don't use (or write) the binary snapshot of the transactions json.")
+   parser.add_argument("--no_aggregates", action='store_true', help="Don't use (or write) the saved monthly sums per action / category, sum up every transaction instead.")
+   parser.add_argument("--timings", help="Save the wall / CPU time of each stage, counts of the work done and the peak memory to this json.")
+   parser.add_argument("--profile", help="Profile the run with cProfile and save the stats to this file (i.e. for pstats or snakeviz).")
 
    args = parser.parse_args()
+   timings.start(args.timings, args.profile)
 
    # Convert absolute time args to datetime.
    if args.end != None:
       args.end = getDateTimeFromCmdLineArg(args.end) # Convert to datetime
    if args.start != None:
       args.start = getDateTimeFromCmdLineArg(args.start) # Convert to datetime
+   if args.as_of != None:
+      args.as_of = getDateTimeFromCmdLineArg(args.as_of) # Convert to datetime
 
    # If neither start nor end is specified, assume end is right now.
    if args.end == None and args.start == None:
@@ -62,30 +98,34 @@ if __name__== "__main__":
          args.start = args.end - timedelta(days=(args.months*365.24/12.0))
 
    # Import transactions from the json file.
-   allTrans = AllTransactions(args.trans)
-   allTrans.pruneByDateRange(args.start, args.end)
+   timings.startStage("load")
+   allTrans = AllTransactions(args.trans, asOf=args.as_of, startInclusive=args.start, stopExclusive=args.end, snapshot=not args.no_snapshot, aggregates=not args.no_aggregates)
 
    if args.excel != None:
       # If just a directory is specified generated the file name.
-      path = args.excel if not os.path.isdir(args.excel) else os.path.join(args.excel, "transactions_" + getUniqueFileNameTimeStr() + ".xlsx")
+      path = args.excel if not os.path.isdir(args.excel) else os.path.join(args.excel, "transactions_" + getUniqueFileNameTimeStr() + "." + args.excel_format)
+      timings.startStage("spreadsheet")
       allTrans.makeTransactionSpreadsheet(path)
 
    # Plot expenses by category
    if args.expenses_plot:
-      stats = allTrans.getActionStats('expense')
-      if not args.plot_years:
-         months = getMonthsInRange(stats['oldest'], stats['newest'])
-         allTrans.plotActionBreakdown(months, 'expense', args.categories)
-      else:
-         years = getYearsInRange(stats['oldest'], stats['newest'])
-         allTrans.plotActionBreakdown(years, 'expense', args.categories)
+      timings.startStage("expensesPlot")
+      allTrans.plotActionBreakdown(allTrans.getActionTimeRanges('expense', args.plot_years), 'expense', args.categories)
 
    # Plot actions by category
    if args.actions_plot:
-      stats = allTrans.getActionStats('expense') # there should always be expenses every month, so this is a good enough way to determine time frame.
-      if not args.plot_years:
-         months = getMonthsInRange(stats['oldest'], stats['newest'])
-         allTrans.plotActions(months, args.categories)
-      else:
-         years = getYearsInRange(stats['oldest'], stats['newest'])
-         allTrans.plotActions(years, args.categories)
\ No newline at end of file
+      timings.startStage("actionsPlot")
+      # there should always be expenses every month, so this is a good enough way to determine time frame.
+      allTrans.plotActions(allTrans.getActionTimeRanges('expense', args.plot_years), args.categories)
+
+   # Render the report pack to files
+   if args.report_dir != None:
+      os.makedirs(args.report_dir, exist_ok=True)
+      timings.startStage("reportData")
+      plots = getReportPlots(allTrans, args.report_dir, args.report_format, args.categories)
+      timings.startStage("reportRender")
+      paths = PlotHelpers.renderPlots(plots, args.jobs)
+      timings.counts['plotsRendered'] += len(paths)
+      print(f"Report pack: {len(paths)} plot(s) saved to {args.report_dir}")
+
+   timings.finish(args.timings, args.profile, "FinancialExport.py", vars(args))
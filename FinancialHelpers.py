@@ -1,8 +1,98 @@
+import os
+import json
 from datetime import datetime
 
 ################################################################################
 
 TRANSACTION_KEYS = ["payee", "type", "date", "user_date", "amount", "id", "memo", "sic", "mcc", "checknum"]
+TRANSACTION_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+################################################################################
+
+def getRawKey(rawTrans: dict):
+   # Hashable key for a 'raw' transaction dict. Two 'raw' dicts have the same key exactly when they compare equal.
+   return frozenset(rawTrans.items())
+
+################################################################################
+
+def parseTransDateTime(dateStr: str) -> datetime:
+   # Transaction dates are always 'YYYY-MM-DD HH:MM:SS' (str() of a datetime). Check the layout and
+   # use fromisoformat for it, which is much faster than strptime. Anything else goes through strptime.
+   if len(dateStr) == 19 and dateStr[4] == '-' and dateStr[7] == '-' and dateStr[10] == ' ' and dateStr[13] == ':' and dateStr[16] == ':':
+      try:
+         return datetime.fromisoformat(dateStr)
+      except ValueError:
+         pass
+   return datetime.strptime(dateStr, TRANSACTION_DATE_FORMAT)
+
+################################################################################
+
+def isJsonLinesPath(path: str):
+   return os.path.splitext(path)[1].lower() == '.jsonl'
+
+################################################################################
+
+def iterJsonList(path: str, chunkSize: int = 1 << 20):
+   # Yield the objects in a json list one at a time, decoding the file a chunk at a time instead of all at once.
+   # JSON Lines files (.jsonl) are read one line (object) at a time.
+   with open(path, 'r') as f:
+      if isJsonLinesPath(path):
+         for line in f:
+            if line.strip() != '':
+               yield json.loads(line)
+         return
+
+      decoder = json.JSONDecoder()
+      buffer = ''
+      pos = 0
+      endOfFile = False
+      inList = False
+      while True:
+         # Skip to the start of the next value.
+         while pos < len(buffer) and (buffer[pos].isspace() or (inList and buffer[pos] == ',')):
+            pos += 1
+         if pos < len(buffer) and not inList:
+            if buffer[pos] != '[':
+               raise ValueError(f"Expected a json list in {path}")
+            inList = True
+            pos += 1
+            continue
+         if pos < len(buffer) and buffer[pos] == ']':
+            return
+
+         # Decode the next value, reading more of the file if it isn't all in the buffer yet.
+         decoded = False
+         if pos < len(buffer):
+            try:
+               obj, end = decoder.raw_decode(buffer, pos)
+               # A value might be cut off at the end of the buffer. A number can also be cut off before that (i.e. the
+               # buffer ends with '-1.' or '2e'), it is only complete if a ',', ']' or white space follows it.
+               decoded = endOfFile or (end < len(buffer) and (type(obj) not in (int, float) or buffer[end] in ',]' or buffer[end].isspace()))
+            except json.JSONDecodeError:
+               if endOfFile:
+                  raise
+         if decoded:
+            pos = end
+            yield obj
+            continue
+
+         if endOfFile:
+            raise ValueError(f"Unexpected end of json list in {path}")
+         chunk = f.read(chunkSize)
+         endOfFile = chunk == ''
+         buffer = buffer[pos:] + chunk
+         pos = 0
+
+################################################################################
+
+def writeJsonList(path: str, items):
+   # Write a list in the format that matches the path (json list, or one object per line for JSON Lines).
+   with open(path, 'w') as f:
+      if isJsonLinesPath(path):
+         for item in items:
+            f.write(json.dumps(item) + "\n")
+      else:
+         json.dump(items, f)
 
 ################################################################################
 
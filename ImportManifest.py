@@ -0,0 +1,83 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+
+################################################################################
+################################################################################
+################################################################################
+
+class ImportManifest(object):
+   def __init__(self, pathToTransJson: str):
+      # The manifest lives next to the transactions json.
+      self.pathToManifest = os.path.splitext(pathToTransJson)[0] + "_imports.json"
+      self.entries = {}
+      try:
+         with open(self.pathToManifest, 'r') as f:
+            for entry in json.load(f):
+               self.entries[entry["path"]] = entry
+      except:
+         pass
+      self.changed = False
+
+   #############################################################################
+
+   def __getKey(self, path: str):
+      # Store paths relative to the manifest so the whole folder can be moved.
+      try:
+         return os.path.relpath(os.path.abspath(path), os.path.dirname(os.path.abspath(self.pathToManifest)))
+      except:
+         return os.path.abspath(path) # Different drives, no relative path.
+
+   #############################################################################
+
+   def __getFileHash(self, path: str):
+      sha = hashlib.sha256()
+      with open(path, 'rb') as f:
+         for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+      return sha.hexdigest()
+
+   #############################################################################
+
+   def isImported(self, path: str):
+      entry = self.entries.get(self.__getKey(path))
+      if entry == None:
+         return False
+
+      # Size and modified time match, assume the file hasn't changed (no need to open it).
+      fileStat = os.stat(path)
+      if entry["size"] != fileStat.st_size:
+         return False
+      if entry["mtime"] == fileStat.st_mtime:
+         return True
+
+      # File was touched, check if the contents actually changed.
+      if self.__getFileHash(path) != entry["hash"]:
+         return False
+      entry["mtime"] = fileStat.st_mtime
+      self.changed = True
+      return True
+
+   #############################################################################
+
+   def recordImport(self, path: str, transactionCount: int):
+      key = self.__getKey(path)
+      fileStat = os.stat(path)
+      entry = {}
+      entry["path"] = key
+      entry["size"] = fileStat.st_size
+      entry["mtime"] = fileStat.st_mtime
+      entry["hash"] = self.__getFileHash(path)
+      entry["transactions"] = transactionCount
+      entry["imported"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+      self.entries[key] = entry
+      self.changed = True
+
+   #############################################################################
+
+   def saveManifest(self):
+      if self.changed:
+         with open(self.pathToManifest, 'w') as f:
+            json.dump([self.entries[key] for key in sorted(self.entries.keys())], f, indent=1)
+         self.changed = False
@@ -1,62 +1,84 @@
 import os
+import io
 from ofxparse import OfxParser
 from ofxparse import Transaction
-import codecs
-import pandas as pd
 import argparse
 import json
-import re
+from concurrent.futures import ProcessPoolExecutor
 from AllTransactions import AllTransactions
+from ImportManifest import ImportManifest
+from TransactionRules import TransactionRules
+from OfxStream import iterOfxTransactions
+from TransactionExport import exportTransactions, EXPORT_FORMATS
+from Timings import timings
 from FinancialHelpers import *
 
+################################################################################
+
+# Certain strings in the header need to start on new lines to be parsed by OfxParser. These are the strings.
+OFX_NEW_LINE_STRS = ["DATA:", "VERSION:", "SECURITY:", "ENCODING:", "CHARSET:", "COMPRESSION:", "OLDFILEUID:", "NEWFILEUID:", "<OFX>"]
+
+################################################################################
+
+def getFixedOfx(ofx: str):
+   # Add a new line before each of OFX_NEW_LINE_STRS (if there isn't already a new line before it). Only the
+   # header (up to the first '<OFX>') is searched, the rest of the file is passed through as is.
+   newLine = "\r\n" if "\r\n" in ofx else "\n"
+   headerEnd = ofx.find("<OFX>")
+   headerEnd = len(ofx) if headerEnd < 0 else headerEnd + len("<OFX>")
+   header = ofx[:headerEnd]
+   for searchStr in OFX_NEW_LINE_STRS:
+      pos = header.find(searchStr)
+      if pos > 0 and header[pos-1] != "\n":
+         header = header[:pos] + newLine + header[pos:]
+   return header + ofx[headerEnd:] if len(header) != headerEnd else ofx
+
 ################################################################################
 ################################################################################
 ################################################################################
 
 class OfxSorter(object):
-   def __init__(self, pathToOfxFile: str, storedTrans: AllTransactions, docsEntry):
+   def __init__(self, pathToOfxFile: str, storedTrans: AllTransactions, docsEntry, rules: TransactionRules = None):
+      # rules - docsEntry's rules, already compiled (i.e. once for all the files of the docsEntry, see importDocs).
       self.pathToOfxFile = pathToOfxFile
       self.storedTrans = storedTrans
       self.docsEntry = docsEntry
+      self.rules = rules
+      if rules == None and docsEntry != None:
+         self.rules = TransactionRules(docsEntry["rules"])
 
    #############################################################################
 
-   def importOfx(self):
-      self.fixOfxFile(self.pathToOfxFile)
-      with codecs.open(self.pathToOfxFile) as fileobj:
-         self.ofxObj = OfxParser.parse(fileobj)
+   def importOfx(self, transactions = None, streaming: bool = False):
+      # 'transactions' can be passed in if the file was already parsed (i.e. by parseOfxFile in a worker process).
+      # streaming - Get the transactions with iterOfxTransactions instead of OfxParser (falls back to OfxParser for
+      #             anything it doesn't handle). Only OfxParser sets 'ofxObj'.
+      if transactions == None and streaming:
+         try:
+            with open(self.pathToOfxFile, 'r') as fileobj:
+               transactions = list(iterOfxTransactions(fileobj))
+         except ValueError:
+            transactions = None
+      if transactions == None:
+         # The header is fixed up in memory, the file is only read once (and never changed).
+         with open(self.pathToOfxFile, 'r') as fileobj:
+            ofx = fileobj.read()
+         self.ofxObj = OfxParser.parse(io.StringIO(getFixedOfx(ofx)))
+         transactions = [self.getTransactionDict(transaction) for transaction in self.ofxObj.account.statement.transactions]
+      self.transactions = transactions
 
    #############################################################################
 
    def fixOfxFile(self, path):
-      # Define the function that will add a new line before the search str (in there isn't already a new line before it)
-      def startFirstEntryOnNewLine(inStr: str, searchStr: str):
-         try:
-            newLine = "\r\n" if inStr.find("\r\n") >= 0 else "\n"
-            pos = inStr.find(searchStr)
-            if pos > 0:
-               if inStr[pos-1] != "\n":
-                  inStr = inStr[:pos] + newLine + inStr[pos:]
-         except:
-            pass
-         return inStr
-
-      # Read the file.
-      fileId = open(path, 'r')
-      ofx = fileId.read()
-      fileId.close()
-
-      # Certain strings in the header need to start on new lines to be parsed by OfxParser. These are the strings.
-      needToStartOnNewLineStrs = ["DATA:", "VERSION:", "SECURITY:", "ENCODING:", "CHARSET:", "COMPRESSION:", "OLDFILEUID:", "NEWFILEUID:", "<OFX>"]
-      fixed = ofx
-      for searchStr in needToStartOnNewLineStrs:
-         fixed = startFirstEntryOnNewLine(fixed, searchStr)
+      # Fix the header of the file on disk (see getFixedOfx). Importing doesn't need this, it fixes the header in memory.
+      with open(path, 'r') as fileId:
+         ofx = fileId.read()
 
       # Save the file (only if it is changing).
+      fixed = getFixedOfx(ofx)
       if fixed != ofx:
-         fileId = open(path, 'w')
-         fileId.write(fixed)
-         fileId.close()
+         with open(path, 'w') as fileId:
+            fileId.write(fixed)
 
    #############################################################################
 
@@ -85,92 +107,106 @@ class OfxSorter(object):
    
    #############################################################################
 
-   def transactionsToExcel(self):
-      # Function for adding to the dictionary.
-      def transToPandaDict(theDict, dictKey: str, num: int, val: str):
-         try:
-            if dictKey == "amount":
-               theDict[dictKey][num] = float(val)
-            else:
-               theDict[dictKey][num] = val
-         except:
-            pass
-      
-      # Initialize the dictionary
-      transDicts = {}
-      for key in TRANSACTION_KEYS:
-         transDicts[key] = {}
-
-      # Fill in the dictionary
-      account = self.ofxObj.account
-      statement = account.statement
-      transNum = 0
-      for transaction in statement.transactions:
-         for key in TRANSACTION_KEYS:
-            transToPandaDict(transDicts, key, transNum, self.getTransactionVal(transaction, key))
-         transNum += 1
-
-      # Save as Excel Spreadsheet via Pandas
-      transData = pd.DataFrame(transDicts)
-      transExcelPath = os.path.splitext(self.pathToOfxFile)[0] + "_" + getUniqueFileNameTimeStr() + ".xlsx"
-      transData.to_excel(transExcelPath)
+   def transactionsToExcel(self, exportFormat: str = 'xlsx'):
+      # Spreadsheet of the transactions in the OFX file (from self.transactions, so after either parser), next to it.
+      # exportFormat is one of TransactionExport.EXPORT_FORMATS.
+      transExcelPath = os.path.splitext(self.pathToOfxFile)[0] + "_" + getUniqueFileNameTimeStr() + "." + exportFormat
+      exportTransactions(self.transactions, transExcelPath, rawKey=None)
 
    #############################################################################
 
    def applyRulesToTransactions(self):
-      account = self.ofxObj.account
-      statement = account.statement
-      rulesList = self.docsEntry["rules"]
-      for transaction in statement.transactions:
-         transactionDict = self.getTransactionDict(transaction)
-
+      for transactionDict in self.transactions:
          # Check transaction against all the rules for categorizing them.
-         ruleMatch = False
-         for rule in rulesList:
-            checks = rule[0]
-            action = rule[1]
-            ruleMatch = True # start True, must pass each check
-            for check in checks:
-               transKey, transMatchStr = list(check.items())[0]
-               transVal = transactionDict[transKey]
-               if not re.match(transMatchStr, transVal):
-                  ruleMatch = False
-            if ruleMatch:
-               break
+         action = self.rules.getMatch(transactionDict)
+         ruleMatch = action != None
          
          alreadyCategorized = self.storedTrans.isInList(transactionDict)
          if not alreadyCategorized:
             if (ruleMatch and action == 'ask') or not ruleMatch:
-               action = self.getAction(transaction, self.docsEntry["name"])
+               action = self.getAction(transactionDict, self.docsEntry["name"])
             self.storedTrans.addTransaction(transactionDict, self.docsEntry, action)
          else:
             # Transaction has been categorized. Check for changes.
             if ruleMatch and action != 'ask' and self.storedTrans.isMetaDataDifferent(transactionDict, self.docsEntry, action):
-               print(f"Meta Data Doesn't match: {self.docsEntry["name"]} - type: {transaction.type} | payee: {transaction.payee} | date: {transaction.date} | amount: {transaction.amount}")
+               print(f"Meta Data Doesn't match: {self.docsEntry['name']} - type: {transactionDict['type']} | payee: {transactionDict['payee']} | date: {transactionDict['date']} | amount: {transactionDict['amount']}")
                # self.storedTrans.modTransaction(transactionDict, self.docsEntry, action)
             
             if not self.storedTrans.isMetaDataActionValid(transactionDict):
-               print(f"Bad Action: {self.docsEntry["name"]} - type: {transaction.type} | payee: {transaction.payee} | date: {transaction.date} | amount: {transaction.amount}")
+               print(f"Bad Action: {self.docsEntry['name']} - type: {transactionDict['type']} | payee: {transactionDict['payee']} | date: {transactionDict['date']} | amount: {transactionDict['amount']}")
                # if (ruleMatch and action == 'ask') or not ruleMatch:
-               #    action = self.getAction(transaction, self.docsEntry["name"])
+               #    action = self.getAction(transactionDict, self.docsEntry["name"])
                # self.storedTrans.modTransaction(transactionDict, self.docsEntry, action)
             pass
 
    #############################################################################
 
-   def getAction(self, transaction: Transaction, name: str):
+   def getAction(self, transactionDict, name: str):
       action = None
-      while action == None:
-         print(f"Need to label transaction: {name} - type: {transaction.type} | payee: {transaction.payee} | date: {transaction.date} | amount: {transaction.amount}.")
-         val = input("Select 'm' for moving money, 'i' for income, 'e' for expense > ")
-         if val == 'm': action = 'move'
-         elif val == 'i': action = 'income'
-         elif val == 'e': action = 'expense'
-         else: print("Invalid selection. Try again.")
+      with timings.stage('prompts'):
+         while action == None:
+            print(f"Need to label transaction: {name} - type: {transactionDict['type']} | payee: {transactionDict['payee']} | date: {transactionDict['date']} | amount: {transactionDict['amount']}.")
+            val = input("Select 'm' for moving money, 'i' for income, 'e' for expense > ")
+            if val == 'm': action = 'move'
+            elif val == 'i': action = 'income'
+            elif val == 'e': action = 'expense'
+            else: print("Invalid selection. Try again.")
       return action
 
 ################################################################################
 
+def parseOfxFile(pathToOfxFile: str, streaming: bool = False):
+   # Parse a single file into plain transaction dicts. This can run in a worker process, the rules are never needed there.
+   ofx = OfxSorter(pathToOfxFile, None, None)
+   ofx.importOfx(streaming=streaming)
+   return ofx.transactions
+
+################################################################################
+
+def importDocs(pathToDocsJson: str, storedTrans: AllTransactions, manifest: ImportManifest = None, force: bool = False, jobs: int = 1, streaming: bool = False):
+   # Import all the OFX / QFX / QBO files in the directories described by the docs json.
+   # Files that the manifest says were already imported (and haven't changed since) are skipped, unless forced.
+   filesToImport = [] # List of [path, docsEntry, compiled rules of the docsEntry]
+   filesSkipped = 0
+   with open(pathToDocsJson, 'r') as f:
+      docsEntries = json.load(f)
+      for docsEntry in docsEntries:
+         rules = None # Compiled once the docsEntry has a file to import.
+         fullDir = os.path.join(os.path.dirname(pathToDocsJson), docsEntry["dir"])
+         for fileName in sorted(os.listdir(fullDir)):
+            fileName = os.path.join(fullDir, fileName)
+            if os.path.isfile(fileName):
+               ext = os.path.splitext(fileName)[1].lower()
+               if ext == '.ofx' or ext == '.qfx' or ext == '.qbo':
+                  if manifest != None and not force and manifest.isImported(fileName):
+                     filesSkipped += 1
+                  else:
+                     rules = rules if rules != None else TransactionRules(docsEntry["rules"])
+                     filesToImport.append([fileName, docsEntry, rules])
+
+   # Parsing can be spread across processes, but the parsed transactions are applied to 'storedTrans'
+   # here, one file at a time in the order above, so the result is the same as parsing serially.
+   paths = [fileToImport[0] for fileToImport in filesToImport]
+   pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 and len(paths) > 1 else None
+   try:
+      streamingArgs = [streaming] * len(paths)
+      parsedFiles = pool.map(parseOfxFile, paths, streamingArgs) if pool != None else map(parseOfxFile, paths, streamingArgs)
+      for [fileName, docsEntry, rules], transactions in zip(filesToImport, parsedFiles):
+         ofx = OfxSorter(fileName, storedTrans, docsEntry, rules)
+         ofx.importOfx(transactions)
+         ofx.applyRulesToTransactions()
+         if manifest != None:
+            manifest.recordImport(fileName, len(transactions))
+         timings.counts['filesParsed'] += 1
+         timings.counts['transactionsParsed'] += len(transactions)
+   finally:
+      if pool != None:
+         pool.shutdown()
+   timings.counts['filesSkipped'] += filesSkipped
+   print(f"Importing Documents: {len(filesToImport)} File(s) imported, {filesSkipped} File(s) skipped (already imported)")
+
+################################################################################
+
 # Main start
 if __name__== "__main__":
 
@@ -181,39 +217,47 @@ if __name__== "__main__":
    parser.add_argument("-d", "--docs", help="Json that describes the documents to read.")
    parser.add_argument("-t", "--trans", help="Json contains all the previous parsed transactions.")
    parser.add_argument("-e", "--expenses", help="Json that defines how to categorize expenses.")
-   parser.add_argument("-x", "--excel", help="Path to save spreadsheet to.")
+   parser.add_argument("-x", "--excel", help="Path to save spreadsheet to (.xlsx, .csv, .parquet or .feather).")
+   parser.add_argument("--excel_format", default='xlsx', choices=EXPORT_FORMATS, help="Spreadsheet format when --excel is a directory.")
    parser.add_argument('--categories', type=list_of_strings, help="Categories to plot (separated by commas, without spaces)")
+   parser.add_argument("-f", "--force", action='store_true', help="Re-import documents even if they were already imported.")
+   parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of processes to use for parsing documents.")
+   parser.add_argument("--journal", action='store_true', help="Save changes to an append only journal instead of rewriting the transactions json (the journal is used from then on).")
+   parser.add_argument("--no_aggregates", action='store_true', help="Don't keep the saved monthly sums per action / category up to date.")
+   parser.add_argument("--streaming", action='store_true', help="Read the transactions straight out of the documents instead of with the full OFX parser (falls back to it when needed).")
+   parser.add_argument("--timings", help="Save the wall / CPU time of each stage, counts of the work done and the peak memory to this json.")
+   parser.add_argument("--profile", help="Profile the run with cProfile and save the stats to this file (i.e. for pstats or snakeviz).")
    args = parser.parse_args()
+   timings.start(args.timings, args.profile)
 
-   allTrans = AllTransactions(args.trans)
+   timings.startStage("load")
+   allTrans = AllTransactions(args.trans, args.journal, aggregates=not args.no_aggregates)
+   manifest = ImportManifest(args.trans) if args.trans != None else None
 
    if args.docs != None:
-      with open(args.docs, 'r') as f:
-         docsEntries = json.load(f)
-         for docsEntry in docsEntries:
-            fullDir = os.path.join(os.path.dirname(args.docs), docsEntry["dir"])
-            for fileName in os.listdir(fullDir):
-               fileName = os.path.join(fullDir, fileName)
-               if os.path.isfile(fileName):
-                  ext = os.path.splitext(fileName)[1].lower()
-                  if ext == '.ofx' or ext == '.qfx' or ext == '.qbo':
-                     ofx = OfxSorter(fileName, allTrans, docsEntry)
-                     ofx.importOfx()
-                     ofx.applyRulesToTransactions()
-   
+      timings.startStage("importDocs")
+      importDocs(args.docs, allTrans, manifest, args.force, args.jobs, args.streaming)
+
 
    if args.expenses != None:
+      timings.startStage("categorizeExpenses")
       allTrans.categorizeExpenses(args.expenses)
 
    if args.excel != None:
       # If just a directory is specified generated the file name.
-      path = args.excel if not os.path.isdir(args.excel) else os.path.join(args.excel, "transactions_" + getUniqueFileNameTimeStr() + ".xlsx")
+      path = args.excel if not os.path.isdir(args.excel) else os.path.join(args.excel, "transactions_" + getUniqueFileNameTimeStr() + "." + args.excel_format)
+      timings.startStage("spreadsheet")
       allTrans.makeTransactionSpreadsheet(path)
 
    if args.categories != None and len(args.categories) > 0:
-      stats = allTrans.getActionStats('expense')
-      months = getMonthsInRange(stats['oldest'], stats['newest'])
-      allTrans.plotActionBreakdown(months, 'expense', args.categories)
+      timings.startStage("plot")
+      allTrans.plotActionBreakdown(allTrans.getActionTimeRanges('expense'), 'expense', args.categories)
 
    # Save transactions before exiting.
-   allTrans.saveTransactions()
\ No newline at end of file
+   timings.startStage("save")
+   allTrans.saveTransactions()
+   if manifest != None:
+      manifest.saveManifest()
+   timings.counts['transactionsAdded'] += allTrans.transactionsAdded
+   timings.counts['transactionsModified'] += allTrans.transactionsModified
+   timings.finish(args.timings, args.profile, "OfxSorter.py", vars(args))
\ No newline at end of file
@@ -0,0 +1,124 @@
+import re
+import html
+from decimal import Decimal, InvalidOperation
+from ofxparse import OfxParser
+
+################################################################################
+
+OFX_TAG_REGEX = re.compile(r'<(/?)([A-Za-z0-9_.]+)>([^<]*)')
+OFX_STATEMENT_TAGS = ['STMTRS', 'CCSTMTRS'] # Bank / credit card statements.
+OFX_UNSUPPORTED_TAGS = ['INVSTMTRS', 'SIC'] # Investment statements and merchant codes are left to OfxParser.
+
+################################################################################
+
+class OfxDateParser(OfxParser):
+   # OfxParser.parseOfxDateTime only works after OfxParser.parse has set 'custom_date_format'.
+   custom_date_format = None
+
+################################################################################
+
+def iterOfxTags(fileobj, chunkSize: int = 1 << 16):
+   # Yield [is closing tag, tag name (upper case), text up to the next tag] for each tag in an OFX (SGML or XML)
+   # file, reading it a chunk at a time. Anything before the first tag (the header) is skipped.
+   buffer = ''
+   while True:
+      chunk = fileobj.read(chunkSize)
+      endOfFile = chunk == ''
+      buffer += chunk
+      # The text after the last '<' might continue in the next chunk, so it waits until then.
+      cut = len(buffer) if endOfFile else buffer.rfind('<')
+      if cut > 0:
+         for match in OFX_TAG_REGEX.finditer(buffer, 0, cut):
+            yield [match.group(1) == '/', match.group(2).upper(), match.group(3)]
+         buffer = buffer[cut:]
+      if endOfFile:
+         return
+
+################################################################################
+
+def getOfxTransactionDict(values):
+   # Transaction dict (same as OfxSorter.getTransactionDict) from the text of each tag in a <STMTTRN> block.
+   # Does what OfxParser.parseTransaction does, raises ValueError for anything that OfxParser might do differently.
+   def getText(tag: str, required: bool = False, allowEmpty: bool = False):
+      text = values.get(tag)
+      if text == None:
+         if required:
+            raise ValueError(f"Transaction without {tag}")
+         return None
+      if not text.isascii():
+         raise ValueError(f"Non ASCII {tag}") # OfxParser decodes these based on the header.
+      text = html.unescape(text).strip()
+      if text == '' and not allowEmpty:
+         raise ValueError(f"Empty {tag}")
+      return text
+
+   def getDateTime(tag: str, required: bool = False):
+      text = getText(tag, required)
+      if text == None:
+         return None
+      try:
+         return OfxDateParser.parseOfxDateTime(text)
+      except Exception:
+         raise ValueError(f"Bad {tag}: {text}")
+
+   def getAmount():
+      # Same number formats as OfxParser.toDecimal
+      amount = getText('TRNAMT', True)
+      if re.search(r'.*\..*,', amount):
+         amount = amount.replace('.', '')
+      if re.search(r'.*,.*\.', amount):
+         amount = amount.replace(',', '')
+      if '.' not in amount and ',' in amount:
+         amount = amount.replace(',', '.')
+      amount = amount.replace(' ', '').replace('+', '')
+      try:
+         return Decimal(amount)
+      except InvalidOperation:
+         if amount in ['null', '-null']:
+            return 0 # A null transaction (i.e. an interest rate change).
+         raise ValueError(f"Bad TRNAMT: {amount}")
+
+   trnType = getText('TRNTYPE')
+   retVal = {}
+   retVal["payee"] = getText('NAME') or ''
+   retVal["type"] = trnType.lower() if trnType != None else ''
+   retVal["date"] = str(getDateTime('DTPOSTED', True))
+   retVal["user_date"] = str(getDateTime('DTUSER'))
+   retVal["amount"] = str(getAmount())
+   retVal["id"] = getText('FITID', True)
+   retVal["memo"] = getText('MEMO', allowEmpty=True) or ''
+   retVal["sic"] = str(None) # Transactions with a SIC are left to OfxParser (see OFX_UNSUPPORTED_TAGS).
+   retVal["mcc"] = ''
+   retVal["checknum"] = getText('CHECKNUM') or ''
+   return retVal
+
+################################################################################
+
+def iterOfxTransactions(fileobj, chunkSize: int = 1 << 16):
+   # Yield the transactions (same dicts as OfxSorter.getTransactionDict) of the bank / credit card statement in an
+   # OFX file, without building the whole OfxParser object tree. Raises ValueError for files this doesn't handle
+   # the same as OfxParser (i.e. more than one statement, investment statements, non ASCII text), those should be
+   # parsed with OfxParser instead.
+   statementCount = 0
+   inStatement = False
+   values = None # Text of each tag in the current <STMTTRN> (first one wins), None when not in one.
+   for isClose, tag, text in iterOfxTags(fileobj, chunkSize):
+      if tag in OFX_UNSUPPORTED_TAGS:
+         raise ValueError(f"Unsupported tag: {tag}")
+      elif tag in OFX_STATEMENT_TAGS:
+         inStatement = not isClose
+         statementCount += 0 if isClose else 1
+         if statementCount > 1:
+            raise ValueError("More than one statement")
+      elif tag == 'STMTTRN' and inStatement:
+         if not isClose and values != None:
+            raise ValueError("Nested <STMTTRN>")
+         elif not isClose:
+            values = {}
+         elif values != None:
+            yield getOfxTransactionDict(values)
+            values = None
+      elif values != None and not isClose and tag not in values:
+         values[tag] = text
+   if statementCount == 0:
+      raise ValueError("No statement")
@@ -1,13 +1,8 @@
-import matplotlib.pyplot as plt
-import numpy as np
+import os
 import math
 import colorsys
 
-# Hue BMP Gen code
-try:
-   from PIL import Image
-except:
-   pass
+# matplotlib is imported by the functions that draw (it is slow to import, and most runs never plot).
 
 
 class betterColors:
@@ -107,29 +102,67 @@ class betterColors:
 ################################################################################
 ################################################################################
 
-def showBarPlot(dataDict: dict, barGroupLabels):
+PLOT_FILE_FORMATS = ['png', 'svg', 'pdf']
+
+batchFigure = None # Figure renderPlot draws every plot in (one per process).
+
+################################################################################
+
+def useHeadless():
+   # Draw with the Agg backend (no windows, doesn't need a display), for rendering plots to files.
+   import matplotlib.pyplot as plt
+   plt.switch_backend('Agg')
+
+################################################################################
+
+def savePlot(fig, path: str):
+   # Save the figure, the format comes from the extension of 'path' (one of PLOT_FILE_FORMATS).
+   fileFormat = os.path.splitext(path)[1].lower().lstrip('.')
+   if fileFormat not in PLOT_FILE_FORMATS:
+      raise ValueError(f"Can't save a plot as '{path}', the extension has to be one of {PLOT_FILE_FORMATS}")
+   fig.savefig(path, format=fileFormat)
+
+################################################################################
+
+def finishPlot(fig, path: str = None):
+   # Show the figure, or save it to 'path' (and close it) when there is one.
+   import matplotlib.pyplot as plt
+   if path == None:
+      plt.show()
+   else:
+      savePlot(fig, path)
+      plt.close(fig)
+
+################################################################################
+
+def drawBarPlot(ax, dataDict: dict, barGroupLabels):
    
    numBarGroups = len(barGroupLabels)   
    numCategories = len(dataDict.items())
    barWidth = 1.0 / float(numCategories)
 
-   fig = plt.subplots()
    i = 0
    for key, val in dataDict.items():
-      barPositions = [x + barWidth*float(i) for x in np.arange(numBarGroups) ]
-      plt.bar(barPositions, val, width = barWidth, label = key) 
+      barPositions = [x + barWidth*float(i) for x in range(numBarGroups) ]
+      ax.bar(barPositions, val, width = barWidth, label = key) 
       i += 1
 
    labelOffset = -barWidth/2 #barWidth * float((numCategories - 1)/2)
-   plt.xticks([r + labelOffset for r in range(numBarGroups)], barGroupLabels)
+   ax.set_xticks([r + labelOffset for r in range(numBarGroups)])
+   ax.set_xticklabels(barGroupLabels)
+
+   ax.legend()
+   ax.grid(True)
 
-   plt.legend()
-   plt.grid(True)
-   plt.show()
+def showBarPlot(dataDict: dict, barGroupLabels, path: str = None):
+   import matplotlib.pyplot as plt
+   fig, ax = plt.subplots()
+   drawBarPlot(ax, dataDict, barGroupLabels)
+   finishPlot(fig, path)
 
 ################################################################################
 
-def showBarPlotAlt(dataDict: dict, barGroupLabels):
+def drawBarPlotAlt(ax, dataDict: dict, barGroupLabels):
    
    numBarGroups = len(barGroupLabels)   
    numCategories = len(dataDict.items())
@@ -137,45 +170,94 @@ def showBarPlotAlt(dataDict: dict, barGroupLabels):
    barOffset = 0
    barWidth = totalBarWidth / float(numCategories)
 
-   fig, ax = plt.subplots()
    i = 0
    for key, val in dataDict.items():
-      barPositions = [barOffset + x + barWidth*float(i) for x in np.arange(numBarGroups) ]
-      plt.bar(barPositions, val, width = barWidth, label = key) 
+      barPositions = [barOffset + x + barWidth*float(i) for x in range(numBarGroups) ]
+      ax.bar(barPositions, val, width = barWidth, label = key) 
       i += 1
 
    labelOffset = (numCategories-1.0)*barWidth/2
-   plt.xticks([r + labelOffset for r in range(numBarGroups)], barGroupLabels)
+   ax.set_xticks([r + labelOffset for r in range(numBarGroups)])
+   ax.set_xticklabels(barGroupLabels)
 
-   plt.legend()
-   plt.grid(axis='y')
+   ax.legend()
+   ax.grid(axis='y')
    ax.format_coord = lambda x, y: '{:0.2f}'.format(y)
-   plt.show()
+
+def showBarPlotAlt(dataDict: dict, barGroupLabels, path: str = None):
+   import matplotlib.pyplot as plt
+   fig, ax = plt.subplots()
+   drawBarPlotAlt(ax, dataDict, barGroupLabels)
+   finishPlot(fig, path)
 
 ################################################################################
 
-def showStackedBarPlot(dataDict: dict, barGroupLabels):
+def drawStackedBarPlot(ax, dataDict: dict, barGroupLabels):
    
    numBarGroups = len(barGroupLabels)   
-   barPositions = np.arange(numBarGroups)
+   barPositions = list(range(numBarGroups))
    barWidth = 0.60
 
-   fig, ax = plt.subplots()
    bottom = [0] * numBarGroups
    colors = betterColors()
    for key, val in dataDict.items():
-      plt.bar(barPositions, val, bottom = bottom, width = barWidth, label = key, color=colors.get_next_color())
+      ax.bar(barPositions, val, bottom = bottom, width = barWidth, label = key, color=colors.get_next_color())
       for i in range(len(val)):
          bottom[i] += val[i]
 
-   plt.xticks(barPositions, barGroupLabels)
+   ax.set_xticks(barPositions)
+   ax.set_xticklabels(barGroupLabels)
 
-   plt.legend()
-   plt.grid(axis='y')
+   ax.legend()
+   ax.grid(axis='y')
    ax.format_coord = lambda x, y: '{:0.2f}'.format(y)
-   plt.show()
+
+def showStackedBarPlot(dataDict: dict, barGroupLabels, path: str = None):
+   import matplotlib.pyplot as plt
+   fig, ax = plt.subplots()
+   drawStackedBarPlot(ax, dataDict, barGroupLabels)
+   finishPlot(fig, path)
+
+################################################################################
+
+PLOT_DRAW_FUNCTIONS = {'bar': drawBarPlot, 'barAlt': drawBarPlotAlt, 'stackedBar': drawStackedBarPlot}
+
+################################################################################
+
+def renderPlot(plot):
+   # Draw a [kind, dataDict, barGroupLabels, path, title] plot (kind is one of PLOT_DRAW_FUNCTIONS) to its file.
+   # Uses the Agg backend, and one figure that is cleared for each plot instead of a new figure per plot.
+   import matplotlib.pyplot as plt
+   global batchFigure
+   kind, dataDict, barGroupLabels, path, title = plot
+   if batchFigure == None:
+      useHeadless()
+      batchFigure = plt.figure(figsize=(12, 6))
+   batchFigure.clear()
+   ax = batchFigure.add_subplot()
+   PLOT_DRAW_FUNCTIONS[kind](ax, dataDict, barGroupLabels)
+   if title != None:
+      ax.set_title(title)
+   batchFigure.tight_layout()
+   savePlot(batchFigure, path)
+   return path
+
+################################################################################
+
+def renderPlots(plots, jobs: int = 1):
+   # Render many plots (see renderPlot) to files, spread across 'jobs' processes. Returns the paths, in order.
+   if jobs <= 1 or len(plots) <= 1:
+      return [renderPlot(plot) for plot in plots]
+   from concurrent.futures import ProcessPoolExecutor
+   with ProcessPoolExecutor(max_workers=jobs) as pool:
+      return list(pool.map(renderPlot, plots, chunksize=max(1, len(plots) // (jobs * 4))))
 
 if __name__ == "__main__":
+   # Hue BMP Gen code
+   try:
+      from PIL import Image
+   except:
+      pass
    bc = betterColors()
 
    # Define image dimensions
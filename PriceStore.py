@@ -0,0 +1,473 @@
+import json
+import math
+import time
+import sqlite3
+import argparse
+import threading
+import urllib.parse
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta
+import numpy as np
+
+PRICE_DATE_FORMAT = "%Y-%m-%d"
+PRICE_CACHE_VERSION = 1 # PRAGMA user_version of the cache, older caches are cleared (see PriceStore).
+PRICE_CHECK_DAYS = 7 # How far back (or ahead) of a missing range a cached close is checked for splits (see PriceStore.update).
+
+################################################################################
+
+def getCloseMatrix(history: dict, days, symbols):
+    """
+    Closes from a history dict ({date: {symbol: close}}) as a days x symbols array. A day that is missing a symbol's
+    close (but has others) uses that symbol's last close, NaN before its first one (see getHoldingsValue).
+
+    Parameters
+    ----------
+    history : dict
+        {date: {symbol: close}}
+    days : list
+        Dates (keys of history) for the rows, in order.
+    symbols : list
+        Symbols for the columns.
+    """
+    prices = np.array([[history[day].get(symbol, np.nan) for symbol in symbols] for day in days], dtype=np.float64).reshape(len(days), len(symbols))
+    lastClose = np.where(np.isnan(prices), -1, np.arange(len(days))[:, None])
+    lastClose = np.maximum.accumulate(lastClose, axis=0)
+    return np.where(lastClose >= 0, prices[np.maximum(lastClose, 0), np.arange(len(symbols))], np.nan)
+
+################################################################################
+
+def getHoldingsValue(holdings, prices, days, symbols):
+    """
+    Value of the holdings on each day, the sum of the shares held times the close of each symbol. Raises a
+    ValueError if shares are held on a day without a close on or before it (i.e. the symbol's download failed), not
+    holding any is worth 0 whether there is a close or not.
+
+    Parameters
+    ----------
+    holdings : numpy.ndarray
+        Days x symbols number of shares held.
+    prices : numpy.ndarray
+        Days x symbols closes, from getCloseMatrix.
+    days : list
+        Dates of the rows.
+    symbols : list
+        Symbols of the columns.
+    """
+    held = np.abs(holdings) > 1e-9 # Selling everything can leave rounding errors behind.
+    missing = np.argwhere(held & np.isnan(prices))
+    if len(missing) > 0:
+        day, symbol = missing[0]
+        raise ValueError(f"No close for {symbols[symbol]} on or before {days[day]:%Y-%m-%d}, but {holdings[day, symbol]:g} shares are held (did its download fail?)")
+    return np.einsum('ij,ij->i', holdings, np.nan_to_num(prices))
+
+################################################################################
+
+def addDays(day: str, days: int):
+    return (datetime.strptime(day, PRICE_DATE_FORMAT) + timedelta(days=days)).strftime(PRICE_DATE_FORMAT)
+
+################################################################################
+
+class YahooPriceSource(object):
+    """
+    Daily closing prices from Yahoo Finance (via yfinance). These are the closes without the dividend adjustments,
+    which Yahoo rewrites after every dividend. They are still adjusted for the splits as of when they are downloaded,
+    so a split changes the closes from before it (see PriceStore.update).
+    """
+
+    def download(self, symbols, start: str, end: str):
+        """
+        Parameters
+        ----------
+        symbols : list
+            Stock ticker symbols (e.g., ["AAPL", "MSFT"]), all downloaded in one request.
+        start : str
+            Start date (inclusive) in "YYYY-MM-DD" format
+        end : str
+            End date (exclusive) in "YYYY-MM-DD" format
+
+        Returns
+        -------
+        dict
+            Symbol -> list of [date string, close], for the days that symbol traded. Raises if a download failed.
+        """
+        import yfinance as yf
+        if len(symbols) == 1:
+            # Ticker.history doesn't share state between threads the way yf.download does (see ConcurrentPriceSource).
+            return {symbols[0]: self.__downloadSymbol(yf, symbols[0], start, end)}
+        data = yf.download(list(symbols), start=start, end=end, auto_adjust=False)
+
+        retVal = {}
+        closes = data['Close'] if not data.empty else None
+        if closes is not None and not hasattr(closes, 'columns'):
+            closes = closes.to_frame(symbols[0]) # Older versions of yfinance don't have a column per symbol for one symbol.
+        for symbol in symbols:
+            column = closes[symbol].dropna() if closes is not None and symbol in closes.columns else [] # dropna, days the other symbols traded, but not this one.
+            if len(column) == 0:
+                # yf.download doesn't raise, a failed symbol is just left empty. Ask for it on its own to find out.
+                retVal[symbol] = self.__downloadSymbol(yf, symbol, start, end)
+                continue
+            retVal[symbol] = [[timestamp.strftime(PRICE_DATE_FORMAT), float(close)] for timestamp, close in zip(column.index, column.values)]
+        return retVal
+
+    def __downloadSymbol(self, yf, symbol: str, start: str, end: str):
+        # raise_errors, otherwise a failed download is an empty frame, same as a range without any closes.
+        try:
+            from yfinance.exceptions import YFPricesMissingError
+        except ImportError:
+            YFPricesMissingError = () # Older versions of yfinance, nothing to tell apart.
+        try:
+            frame = yf.Ticker(symbol).history(start=start, end=end, auto_adjust=False, raise_errors=True)
+        except YFPricesMissingError:
+            return [] # Didn't trade in the range (i.e. a weekend or before it was listed).
+        if frame.empty:
+            return []
+        column = frame['Close'].dropna()
+        return [[timestamp.strftime(PRICE_DATE_FORMAT), float(close)] for timestamp, close in zip(column.index, column.values)]
+
+################################################################################
+
+class FixturePriceSource(object):
+    """Prices from a local json file ({"SYMBOL": {"YYYY-MM-DD": close, ...}, ...}), i.e. for running without a network."""
+
+    def __init__(self, pathToFixtureJson: str):
+        with open(pathToFixtureJson, 'r') as f:
+            self.prices = json.load(f)
+        self.downloads = 0 # Number of download calls (i.e. to check what the cache fetched).
+
+    def download(self, symbols, start: str, end: str):
+        self.downloads += 1
+        retVal = {}
+        for symbol in symbols:
+            closes = self.prices.get(symbol, {})
+            retVal[symbol] = [[day, float(closes[day])] for day in sorted(closes) if start <= day < end]
+        return retVal
+
+################################################################################
+
+class HttpPriceSource(object):
+    """
+    Prices from a price server, GET <url>/prices/<symbol>?start=YYYY-MM-DD&end=YYYY-MM-DD returns the json list of
+    [date string, close] (i.e. a StubPriceServer).
+    """
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        self.url = url.rstrip('/')
+        self.timeout = timeout # Seconds to wait for a response.
+
+    def download(self, symbols, start: str, end: str):
+        retVal = {}
+        query = urllib.parse.urlencode({'start': start, 'end': end})
+        for symbol in symbols:
+            with urllib.request.urlopen(f"{self.url}/prices/{urllib.parse.quote(symbol)}?{query}", timeout=self.timeout) as response:
+                retVal[symbol] = json.load(response)
+        return retVal
+
+################################################################################
+
+class StubPriceServer(object):
+    """
+    Local HTTP server (for HttpPriceSource) with the prices from a fixture ({"SYMBOL": {"YYYY-MM-DD": close, ...}, ...}),
+    i.e. to check the concurrency and retries of ConcurrentPriceSource without a network. Each request can be slowed
+    down by 'delay' seconds and every 'failEvery'th request fails with a 503.
+    """
+
+    def __init__(self, prices: dict, delay: float = 0.0, failEvery: int = 0, port: int = 0):
+        self.prices = prices
+        self.delay = delay
+        self.failEvery = failEvery
+        self.requests = 0 # Number of requests served (including the failed ones).
+        self.lock = threading.Lock()
+
+        stub = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.handleRequest(self)
+            def log_message(self, format, *args):
+                pass
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = None
+
+    ############################################################################
+
+    def handleRequest(self, request: BaseHTTPRequestHandler):
+        with self.lock:
+            self.requests += 1
+            fail = self.failEvery > 0 and self.requests % self.failEvery == 0
+        time.sleep(self.delay)
+        url = urllib.parse.urlparse(request.path)
+        parts = url.path.strip('/').split('/')
+        if fail or len(parts) != 2 or parts[0] != 'prices':
+            request.send_error(503 if fail else 404)
+            return
+        query = urllib.parse.parse_qs(url.query)
+        start = query.get('start', [''])[0]
+        end = query.get('end', ['9999-99-99'])[0]
+        closes = self.prices.get(urllib.parse.unquote(parts[1]), {})
+        body = json.dumps([[day, float(closes[day])] for day in sorted(closes) if start <= day < end]).encode('utf-8')
+        request.send_response(200)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    ############################################################################
+
+    def start(self):
+        """Serve in a background thread, returns the url to give HttpPriceSource."""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+################################################################################
+
+class ConcurrentPriceSource(object):
+    """
+    Wraps another price source to download each symbol on its own, up to 'jobs' symbols at a time, so many symbols
+    take about as long as the slowest one. A download that raises (or leaves the symbol out) is tried again (up to
+    'retries' more times) after waiting 'backoff' seconds, doubling each time. 'minInterval' spaces out the start of the requests (across all
+    the threads) for servers that limit the request rate.
+    """
+
+    def __init__(self, source, jobs: int = 8, retries: int = 3, backoff: float = 0.5, minInterval: float = 0.0):
+        self.source = source
+        self.jobs = jobs
+        self.retries = retries
+        self.backoff = backoff
+        self.minInterval = minInterval
+        self.timings = {} # Symbol -> [seconds, attempts] of its last download (including the retries).
+        self.lock = threading.Lock()
+        self.nextStart = 0.0 # time.monotonic() the next request can start at (for minInterval).
+
+    ############################################################################
+
+    def __waitForTurn(self):
+        if self.minInterval <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.nextStart)
+            self.nextStart = start + self.minInterval
+        time.sleep(start - now)
+
+    ############################################################################
+
+    def __downloadSymbol(self, symbol: str, start: str, end: str):
+        began = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            self.__waitForTurn()
+            try:
+                closes = self.source.download([symbol], start, end)[symbol] # KeyError, the symbol failed.
+                break
+            except Exception:
+                if attempt > self.retries:
+                    self.timings[symbol] = [time.perf_counter() - began, attempt]
+                    raise
+            time.sleep(self.backoff * 2**(attempt - 1))
+        self.timings[symbol] = [time.perf_counter() - began, attempt]
+        return closes
+
+    ############################################################################
+
+    def download(self, symbols, start: str, end: str):
+        symbols = list(symbols)
+        if len(symbols) == 0:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.jobs, len(symbols)))) as pool:
+            return dict(zip(symbols, pool.map(lambda symbol: self.__downloadSymbol(symbol, start, end), symbols)))
+
+################################################################################
+
+class PriceStore(object):
+    """
+    Daily closing prices cached in a SQLite file, one row per symbol per day. Closes don't change once the day is
+    over, so only the date ranges that were never fetched are downloaded (the symbols that are missing the same range
+    share one batched download). The range each symbol has been fetched for is stored separately from its closes, so
+    days without a close (weekends, holidays, before it was listed) aren't downloaded again. A source reports a failed
+    download by raising or leaving the symbol out, those ranges are tried again next time. Today is never cached, it might not be over yet.
+    The exception is a split, the closes from before it change when they are adjusted for it. Each download checks
+    a cached close again for that (see update).
+    """
+
+    def __init__(self, pathToCache: str = None, source = None):
+        """
+        Parameters
+        ----------
+        pathToCache : str
+            SQLite file to cache the prices in (None to only cache in memory).
+        source : object
+            Where the prices come from, anything with a download(symbols, start, end) like YahooPriceSource.
+        """
+        self.source = source if source != None else YahooPriceSource()
+        self.connection = sqlite3.connect(pathToCache if pathToCache != None else ":memory:")
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version < PRICE_CACHE_VERSION:
+            # Older caches have closes adjusted for the dividends as of when they were downloaded, start over.
+            self.connection.execute("DROP TABLE IF EXISTS prices")
+            self.connection.execute("DROP TABLE IF EXISTS fetched")
+            self.connection.execute(f"PRAGMA user_version = {PRICE_CACHE_VERSION}")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS prices (symbol TEXT NOT NULL, date TEXT NOT NULL, close REAL, PRIMARY KEY (symbol, date))")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS fetched (symbol TEXT PRIMARY KEY, start TEXT NOT NULL, end TEXT NOT NULL)")
+        self.connection.commit()
+
+    ############################################################################
+
+    def getMissingRanges(self, symbols, start: str, end: str):
+        """Symbol -> list of [start, end) ranges that need to be downloaded to have every close from start to end."""
+        retVal = {}
+        for symbol in symbols:
+            row = self.connection.execute("SELECT start, end FROM fetched WHERE symbol = ?", [symbol]).fetchone()
+            if row == None or row[0] >= end or row[1] <= start:
+                ranges = [[start, end]] # Nothing fetched yet (or nothing that overlaps, so fill the whole gap).
+                if row != None:
+                    ranges = [[min(start, row[1]), max(end, row[0])]]
+            else:
+                ranges = []
+                if start < row[0]:
+                    ranges.append([start, row[0]])
+                if row[1] < end:
+                    ranges.append([row[1], end])
+            if len(ranges) > 0:
+                retVal[symbol] = ranges
+        return retVal
+
+    ############################################################################
+
+    def update(self, symbols, start: str, end: str):
+        """
+        Download (and cache) whatever is missing from start to end (up to today). Returns the number of downloads made.
+
+        Each download also gets the cached close next to the missing range again (within PRICE_CHECK_DAYS of it). If
+        that close changed, the symbol split since its closes were cached: they are all thrown away and the symbol is
+        downloaded again from start to end.
+        """
+        end = min(end, date.today().strftime(PRICE_DATE_FORMAT))
+        if start >= end:
+            return 0
+        symbolsByRange = {} # (download start, download end) -> [symbol, missing start, missing end, cached [day, close] or None]
+        for symbol, ranges in self.getMissingRanges(symbols, start, end).items():
+            for rangeStart, rangeEnd in ranges:
+                check = self.__getCheckClose(symbol, rangeStart, rangeEnd)
+                downloadRange = (rangeStart, rangeEnd)
+                if check != None:
+                    downloadRange = (check[0], rangeEnd) if check[0] < rangeStart else (rangeStart, addDays(check[0], 1))
+                symbolsByRange.setdefault(downloadRange, []).append([symbol, rangeStart, rangeEnd, check])
+
+        split = set()
+        for [downloadStart, downloadEnd], missing in symbolsByRange.items():
+            downloaded = self.source.download([symbol for symbol, _, _, _ in missing], downloadStart, downloadEnd)
+            for symbol, rangeStart, rangeEnd, check in missing:
+                if symbol not in downloaded:
+                    continue # Failed, don't remember the range so it is tried again.
+                closes = downloaded[symbol]
+                if check != None and not math.isclose(dict(closes).get(check[0], check[1]), check[1], rel_tol=1e-6):
+                    split.add(symbol)
+                if symbol not in split:
+                    self.__addCloses(symbol, closes, rangeStart, rangeEnd)
+        if len(split) > 0:
+            split = sorted(split)
+            self.connection.executemany("DELETE FROM prices WHERE symbol = ?", [[symbol] for symbol in split])
+            self.connection.executemany("DELETE FROM fetched WHERE symbol = ?", [[symbol] for symbol in split])
+            downloaded = self.source.download(split, start, end)
+            for symbol in split:
+                if symbol in downloaded:
+                    self.__addCloses(symbol, downloaded[symbol], start, end)
+        self.connection.commit()
+        return len(symbolsByRange) + (1 if len(split) > 0 else 0)
+
+    ############################################################################
+
+    def __getCheckClose(self, symbol: str, start: str, end: str):
+        # The cached [day, close] right before a missing range (or right after it, when it is before everything cached).
+        row = self.connection.execute("SELECT date, close FROM prices WHERE symbol = ? AND date < ? AND date >= ? ORDER BY date DESC LIMIT 1", [symbol, start, addDays(start, -PRICE_CHECK_DAYS)]).fetchone()
+        if row == None:
+            row = self.connection.execute("SELECT date, close FROM prices WHERE symbol = ? AND date >= ? AND date < ? ORDER BY date LIMIT 1", [symbol, end, addDays(end, PRICE_CHECK_DAYS)]).fetchone()
+        return row
+
+    ############################################################################
+
+    def __addCloses(self, symbol: str, closes, start: str, end: str):
+        # The range is fetched even without any closes in it (i.e. a weekend or before the symbol was listed).
+        closes = [[symbol, day, close] for day, close in closes if start <= day < end]
+        self.connection.executemany("INSERT OR REPLACE INTO prices (symbol, date, close) VALUES (?, ?, ?)", closes)
+        self.__addFetched(symbol, start, end)
+
+    ############################################################################
+
+    def __addFetched(self, symbol: str, start: str, end: str):
+        if start >= end:
+            return
+        row = self.connection.execute("SELECT start, end FROM fetched WHERE symbol = ?", [symbol]).fetchone()
+        if row != None:
+            start = min(start, row[0])
+            end = max(end, row[1])
+        self.connection.execute("INSERT OR REPLACE INTO fetched (symbol, start, end) VALUES (?, ?, ?)", [symbol, start, end])
+
+    ############################################################################
+
+    def getCloses(self, symbols, start: str, end: str):
+        """Rows of [date string, symbol, close] from start (inclusive) to end (exclusive), sorted by date."""
+        self.update(symbols, start, end)
+        today = date.today().strftime(PRICE_DATE_FORMAT)
+        rows = []
+        if len(symbols) > 0:
+            where = "symbol IN (" + ", ".join(["?"] * len(symbols)) + ") AND date >= ? AND date < ?"
+            rows = self.connection.execute("SELECT date, symbol, close FROM prices WHERE " + where + " ORDER BY date", list(symbols) + [start, end]).fetchall()
+        if end > today and len(symbols) > 0:
+            # Today's close (so far) isn't cached, get it fresh.
+            todayStart = max(start, today)
+            todayCloses = self.source.download(list(symbols), todayStart, end)
+            for symbol in symbols:
+                rows += [[day, symbol, close] for day, close in todayCloses.get(symbol, []) if todayStart <= day < end]
+            rows.sort(key=lambda row: row[0])
+        return rows
+
+    ############################################################################
+
+    def getHistory(self, symbols, start: str, end: str, history: dict = None):
+        """
+        Fill in (and return) a history dict in the format StockStats uses, {datetime: {symbol: close}}, with the
+        dates in order.
+        """
+        history = history if history != None else {}
+        dates = {} # Date string -> datetime, each day is in the rows once per symbol.
+        for day, symbol, close in self.getCloses(symbols, start, end):
+            if day not in dates:
+                dates[day] = datetime.strptime(day, PRICE_DATE_FORMAT)
+            history.setdefault(dates[day], {})[symbol] = close
+        return history
+
+################################################################################
+
+# Main start
+if __name__== "__main__":
+    parser = argparse.ArgumentParser(description="Serve the prices in a fixture json (for StockStats.py --price_server).")
+    parser.add_argument("fixture", help="Json with the stock prices ({\"SYMBOL\": {\"YYYY-MM-DD\": close}}).")
+    parser.add_argument("--port", type=int, default=8000, help="Port to serve on.")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering each request.")
+    parser.add_argument("--fail_every", type=int, default=0, help="Fail every Nth request (503), to check the retries.")
+    args = parser.parse_args()
+
+    with open(args.fixture, 'r') as f:
+        server = StubPriceServer(json.load(f), args.delay, args.fail_every, args.port)
+    print(f"Serving {args.fixture} on {server.url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.server.server_close()
@@ -2,7 +2,7 @@ import os
 import json
 import argparse
 from AllTransactions import AllTransactions
-from OfxSorter import OfxSorter
+from Timings import timings
 
 ################################################################################
 
@@ -12,15 +12,25 @@ if __name__== "__main__":
    parser.add_argument("-c", "--category", default=None, help="The name of the category to move transactions from.")
    parser.add_argument("-t", "--trans", required=True, help="Json contains all the previous parsed transactions.")
    parser.add_argument("-e", "--expenses", required=True, help="Json that defines how to categorize expenses.")
+   parser.add_argument("--journal", action='store_true', help="Save changes to an append only journal instead of rewriting the transactions json (the journal is used from then on).")
+   parser.add_argument("--no_aggregates", action='store_true', help="Don't keep the saved monthly sums per action / category up to date.")
+   parser.add_argument("--timings", help="Save the wall / CPU time of each stage, counts of the work done and the peak memory to this json.")
+   parser.add_argument("--profile", help="Profile the run with cProfile and save the stats to this file (i.e. for pstats or snakeviz).")
    args = parser.parse_args()
+   timings.start(args.timings, args.profile)
 
    # Import transactions from the json file.
-   allTrans = AllTransactions(args.trans)
+   timings.startStage("load")
+   allTrans = AllTransactions(args.trans, args.journal, aggregates=not args.no_aggregates)
 
    # Categorize expenses based on the expenses json file.
+   timings.startStage("categorizeExpenses")
    if args.category != None:
       allTrans.removeCategory(args.category)
    allTrans.categorizeExpenses(args.expenses, reCategorize=True)
 
    # Save transactions before exiting.
+   timings.startStage("save")
    allTrans.saveTransactions()
+   timings.counts['transactionsModified'] += allTrans.transactionsModified
+   timings.finish(args.timings, args.profile, "ReCategorize.py", vars(args))
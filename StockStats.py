@@ -1,11 +1,15 @@
 import os
 import json
+import bisect
 import argparse
 from datetime import datetime
-import yfinance as yf
-import matplotlib.pyplot as plt
+import numpy as np
+import PlotHelpers
+from PriceStore import PriceStore, YahooPriceSource, FixturePriceSource, HttpPriceSource, ConcurrentPriceSource, getCloseMatrix, getHoldingsValue
+from CostBasis import LotTracker, LOT_METHODS, getCostBasisOverTime
+from Timings import timings
 
-def plotStockHistory(ticker: str, start: str, end: str):
+def plotStockHistory(ticker: str, start: str, end: str, path: str = None):
     """
     Plot historical stock prices for a given ticker symbol and date range.
 
@@ -17,8 +21,11 @@ def plotStockHistory(ticker: str, start: str, end: str):
         Start date in "YYYY-MM-DD" format
     end : str
         End date in "YYYY-MM-DD" format
+    path : str
+        File to save the plot to (.png, .svg or .pdf) instead of showing it
     """
     # Download price data
+    import yfinance as yf
     data = yf.download(ticker, start=start, end=end)
 
     if data.empty:
@@ -26,6 +33,7 @@ def plotStockHistory(ticker: str, start: str, end: str):
         return
     
     # Plot closing prices
+    import matplotlib.pyplot as plt # Only imported when plotting (see PlotHelpers).
     plt.figure(figsize=(12, 6))
     plt.plot(data.index, data['Close'], label="Close Price", color='blue')
     
@@ -36,11 +44,78 @@ def plotStockHistory(ticker: str, start: str, end: str):
     plt.legend()
     
     plt.tight_layout()
-    plt.show()
+    PlotHelpers.finishPlot(plt.gcf(), path)
 
 ################################################################################
 
-def getStockHistory(ticker: str, start: str, end: str, history: dict):
+class StockHistory(dict):
+    """
+    History dict ({date: {symbol: close}}) that also keeps its dates in order, so the newest date and the first
+    trading day on or after a date are binary searches instead of a scan of every date (and the days from a trade
+    on are a slice).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__days = None # Sorted dates, rebuilt after a change.
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.__days = None
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.__days = None
+
+    def setdefault(self, key, default = None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def pop(self, *args):
+        self.__days = None
+        return super().pop(*args)
+
+    def popitem(self):
+        self.__days = None
+        return super().popitem()
+
+    def clear(self):
+        super().clear()
+        self.__days = None
+
+    ############################################################################
+
+    def getDays(self):
+        """All the dates, oldest first."""
+        if self.__days == None:
+            self.__days = sorted(self.keys())
+        return self.__days
+
+    def getNewestDate(self):
+        days = self.getDays()
+        return days[-1] if len(days) > 0 else None
+
+    def getFirstDayIndex(self, date: datetime):
+        """Index (in getDays) of the first trading day on or after 'date' (len(getDays()) if there isn't one)."""
+        return bisect.bisect_left(self.getDays(), date)
+
+    def getFirstDayOnOrAfter(self, date: datetime):
+        days = self.getDays()
+        index = self.getFirstDayIndex(date)
+        return days[index] if index < len(days) else None
+
+    def getDaysFrom(self, date: datetime):
+        """The trading days on or after 'date', oldest first."""
+        return self.getDays()[self.getFirstDayIndex(date):]
+
+################################################################################
+
+def getStockHistory(ticker: str, start: str, end: str, history: dict, store: PriceStore = None):
     """
     Parameters
     ----------
@@ -50,32 +125,28 @@ def getStockHistory(ticker: str, start: str, end: str, history: dict):
         Start date in "YYYY-MM-DD" format
     end : str
         End date in "YYYY-MM-DD" format
+    store : PriceStore
+        Where to get the prices (None to download them without caching)
     """
-    data = yf.download(ticker, start=start, end=end)
+    getStocksHistory([ticker], start, end, history, store)
 
-    timestamps = data.index.tolist()
-    temp = data['Close'].values.tolist()
-    closeVals = []
-    for t in temp:
-        closeVals += t
+################################################################################
 
-    for i in range(len(timestamps)):
-        try:
-            history[timestamps[i]][ticker] = closeVals[i]
-        except:
-            history[timestamps[i]] = {}
-            history[timestamps[i]][ticker] = closeVals[i]
+def getStocksHistory(symbols, start: str, end: str, history: dict, store: PriceStore = None):
+    """
+    Same as getStockHistory for many symbols. Only the prices that aren't in the store's cache are downloaded,
+    in a single request for all the symbols that are missing the same dates (a ConcurrentPriceSource splits that up
+    into one download per symbol, run in parallel).
+    """
+    store = store if store != None else PriceStore()
+    store.getHistory(symbols, start, end, history)
 
 ################################################################################
 
 def getNewestStockHistoryDate(history: dict):
-    newestDate = None
-    for h in history:
-        if newestDate == None:
-            newestDate = h
-        elif newestDate < h:
-            newestDate = h
-    return newestDate
+    if isinstance(history, StockHistory):
+        return history.getNewestDate()
+    return max(history) if len(history) > 0 else None
 
 ################################################################################
 
@@ -145,6 +216,8 @@ def getProfit(trades, stockHistory):
 ################################################################################
 
 def getProfitOverTime(trades, stockHistory):
+    if not isinstance(stockHistory, StockHistory):
+        stockHistory = StockHistory(stockHistory)
     for trade in trades:
         isSell = True if trade["Trade"].lower() == "sell" else False
         tradeShares = float(trade["Shares"])
@@ -153,21 +226,20 @@ def getProfitOverTime(trades, stockHistory):
         tradeSymbol = trade["Symbol"]
         tradeTotal = tradeShares * tradeCostPer
         trade["History"] = []
-        for stockDay in stockHistory:
-            if stockDay >= tradeDate:
-                dayValuePer = float(stockHistory[stockDay][tradeSymbol])
-                dayValueTotal = tradeShares * dayValuePer
-                dayProfit = dayValueTotal - tradeTotal
-
-                if isSell:
-                    dayValueTotal = -dayValueTotal
-                    dayProfit = -dayProfit
-
-                value = {}
-                value["Value"] = dayValueTotal
-                value["Profit"] = dayProfit
-                value["Date"] = stockDay
-                trade["History"].append(value)
+        for stockDay in stockHistory.getDaysFrom(tradeDate):
+            dayValuePer = float(stockHistory[stockDay][tradeSymbol])
+            dayValueTotal = tradeShares * dayValuePer
+            dayProfit = dayValueTotal - tradeTotal
+
+            if isSell:
+                dayValueTotal = -dayValueTotal
+                dayProfit = -dayProfit
+
+            value = {}
+            value["Value"] = dayValueTotal
+            value["Profit"] = dayProfit
+            value["Date"] = stockDay
+            trade["History"].append(value)
 
 ################################################################################
 
@@ -195,7 +267,8 @@ def getAllTradeProfits(trades):
 
 ################################################################################
 
-def plotProfit(name: str, days, profit):
+def plotProfit(name: str, days, profit, path: str = None):
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(12, 6))
     plt.plot(days, profit, label=name, color='blue')
     
@@ -206,7 +279,7 @@ def plotProfit(name: str, days, profit):
     plt.legend()
     
     plt.tight_layout()
-    plt.show()
+    PlotHelpers.finishPlot(plt.gcf(), path)
 
 ################################################################################
 
@@ -244,7 +317,54 @@ def getAllTradeValues(trades):
 
 ################################################################################
 
-def plotValues(name: str, days, value, investment):
+def getPortfolioOverTime(trades, stockHistory):
+    """
+    Same results as getProfitOverTime followed by getAllTradeValues / getAllTradeProfits, without building a
+    history list for every trade. Prices are a days x symbols matrix and each trade is a change in the number of
+    shares held (negative for sells) from its first trading day on, so the holdings, principal and cost are
+    cumulative sums and the value is the holdings times the prices.
+
+    A day that is missing a symbol's close (but has others) uses that symbol's last close. Raises a ValueError if a
+    symbol that is held doesn't have a close yet (see getHoldingsValue).
+
+    Returns
+    -------
+    list
+        [days, value, investment, profit], one entry per day from the first trade on.
+    """
+    days = stockHistory.getDays() if isinstance(stockHistory, StockHistory) else sorted(stockHistory)
+    symbols = getSymbols(trades)
+    if len(days) == 0 or len(trades) == 0:
+        return [[], [], [], []]
+    symbolIndexes = {symbol: i for i, symbol in enumerate(symbols)}
+
+    prices = getCloseMatrix(stockHistory, days, symbols)
+
+    # Per trade: the day it starts counting (first trading day on or after the trade) and the signed amounts.
+    dayStamps = np.array([np.datetime64(day, 's') for day in days])
+    tradeDates = np.array([np.datetime64(tradeToDate(trade), 's') for trade in trades])
+    startIndexes = np.searchsorted(dayStamps, tradeDates, side='left')
+    signs = np.array([-1.0 if trade["Trade"].lower() == "sell" else 1.0 for trade in trades])
+    shares = signs * np.array([float(trade["Shares"]) for trade in trades])
+    costs = shares * np.array([float(trade["Cost"]) for trade in trades])
+    investments = signs * np.array([abs(float(trade["Total"])) for trade in trades])
+    tradeSymbols = np.array([symbolIndexes[trade["Symbol"]] for trade in trades])
+    active = startIndexes < len(days) # Trades after the last day never count.
+
+    shareChanges = np.zeros((len(days), len(symbols)))
+    np.add.at(shareChanges, (startIndexes[active], tradeSymbols[active]), shares[active])
+    holdings = np.cumsum(shareChanges, axis=0)
+    value = getHoldingsValue(holdings, prices, days, symbols)
+    investment = np.cumsum(np.bincount(startIndexes[active], investments[active], len(days)))
+    profit = value - np.cumsum(np.bincount(startIndexes[active], costs[active], len(days)))
+
+    first = startIndexes.min()
+    return [days[first:], value[first:].tolist(), investment[first:].tolist(), profit[first:].tolist()]
+
+################################################################################
+
+def plotValues(name: str, days, value, investment, path: str = None):
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(12, 6))
     plt.plot(days, value, label="Value", color='blue')
     plt.plot(days, investment, label="Principal", color='black')
@@ -258,7 +378,25 @@ def plotValues(name: str, days, value, investment):
     plt.tight_layout()
     if min(value) > 0 and min(investment) > 0:
         plt.ylim(ymin=0)  # All the values are positive, make the scaling better.
-    plt.show()
+    PlotHelpers.finishPlot(plt.gcf(), path)
+
+################################################################################
+
+def plotGains(name: str, days, costBasis, realized, unrealized, path: str = None):
+    import matplotlib.pyplot as plt
+    plt.figure(figsize=(12, 6))
+    plt.plot(days, costBasis, label="Cost Basis", color='black')
+    plt.plot(days, realized, label="Realized Gain", color='green')
+    plt.plot(days, unrealized, label="Unrealized Gain", color='blue')
+
+    plt.title(f"Gains: {name}")
+    plt.xlabel("Date")
+    plt.ylabel("Price (USD)")
+    plt.grid(True, linestyle='--', alpha=0.5)
+    plt.legend()
+
+    plt.tight_layout()
+    PlotHelpers.finishPlot(plt.gcf(), path)
 
 
 
@@ -275,9 +413,24 @@ if __name__== "__main__":
     parser.add_argument('--include', default=[], type=list_of_strings, help="Symbols to include (separated by commas, without spaces)")
     parser.add_argument('--exclude', default=[], type=list_of_strings, help="Symbols to exclude (separated by commas, without spaces)")
     parser.add_argument("-p", '--profit', action='store_true', help='Profit Only Plot')
+    parser.add_argument('--plot_file', help="Save the plot to this file (.png, .svg or .pdf) instead of showing it.")
+    parser.add_argument('--price_cache', help="SQLite file to cache the stock prices in (defaults to <trades>_prices.sqlite).")
+    parser.add_argument('--no_price_cache', action='store_true', help="Download all the stock prices, without caching them.")
+    parser.add_argument('--lots', choices=LOT_METHODS, help="Track the lots bought (sells close them in this order) and show the cost basis and realized / unrealized gains.")
+    parser.add_argument('--price_fixture', help="Json with the stock prices to use instead of downloading them ({\"SYMBOL\": {\"YYYY-MM-DD\": close}}).")
+    parser.add_argument('--price_server', help="URL of a price server to download the prices from instead (i.e. python PriceStore.py <fixture>).")
+    parser.add_argument('--price_jobs', type=int, default=8, help="Number of symbols to download at the same time.")
+    parser.add_argument('--price_retries', type=int, default=3, help="Number of times to retry a failed download.")
+    parser.add_argument('--price_min_interval', type=float, default=0.0, help="Minimum seconds between the starts of two downloads (to stay under rate limits).")
+    parser.add_argument('--timings', help="Save the wall / CPU time of each stage, counts of the work done, the peak memory and the time each symbol took to download to this json.")
+    parser.add_argument('--profile', help="Profile the run with cProfile and save the stats to this file (i.e. for pstats or snakeviz).")
     args = parser.parse_args()
+    timings.start(args.timings, args.profile)
+    if args.plot_file != None:
+        PlotHelpers.useHeadless()
 
     # Parse the documents that contain transactions.
+    timings.startStage("loadTrades")
     with open(args.trades, 'r') as f:
         # Get trade history from JSON file
         trades = json.load(f)
@@ -295,18 +448,42 @@ if __name__== "__main__":
         symbols = getSymbols(trades)
 
         # Get the stock market history information.
-        history = {}
-        for symbol in symbols:
-            getStockHistory(symbol, startTimeStr, nowTimeStr, history)
-
-        getProfitOverTime(trades, history)
-        days, value, investment = getAllTradeValues(trades)
-        print(f"Totals as of Today: Value = {value[-1]} | Profit = {value[-1] - investment[-1]} | Principal: {investment[-1]}")
-        if args.profit:
-            days, profit = getAllTradeProfits(trades)
-            plotProfit("All", days, profit)
+        timings.startStage("prices")
+        priceSource = YahooPriceSource()
+        if args.price_fixture != None:
+            priceSource = FixturePriceSource(args.price_fixture)
+        elif args.price_server != None:
+            priceSource = HttpPriceSource(args.price_server)
+        priceSource = ConcurrentPriceSource(priceSource, args.price_jobs, args.price_retries, minInterval=args.price_min_interval)
+        priceCache = args.price_cache if args.price_cache != None else os.path.splitext(args.trades)[0] + "_prices.sqlite"
+        store = PriceStore(priceCache if not args.no_price_cache else None, priceSource)
+        history = StockHistory()
+        getStocksHistory(symbols, startTimeStr, nowTimeStr, history, store)
+        timings.counts['trades'] += len(trades)
+        timings.counts['symbols'] += len(symbols)
+        timings.counts['symbolsDownloaded'] += len(priceSource.timings)
+        timings.counts['days'] += len(history)
+        timings.details['priceDownloads'] = priceSource.timings
+
+        timings.startStage("compute")
+        if args.lots != None:
+            tracker = LotTracker(args.lots)
+            days, costBasis, realized, unrealized = getCostBasisOverTime(trades, history, tracker=tracker)
+            for symbol in tracker.getSymbols():
+                print(f"{symbol}: {tracker.shares[symbol]} shares in {len(tracker.getOpenLots(symbol))} lot(s) | Cost Basis = {tracker.costBasis[symbol]} | Realized = {tracker.realized[symbol]}")
+            print(f"Totals as of Today ({args.lots}): Cost Basis = {costBasis[-1]} | Realized = {realized[-1]} | Unrealized = {unrealized[-1]}")
+            timings.startStage("plot")
+            plotGains("All", days, costBasis, realized, unrealized, args.plot_file)
         else:
-            plotValues("All", days, value, investment)
+            days, value, investment, profit = getPortfolioOverTime(trades, history)
+            print(f"Totals as of Today: Value = {value[-1]} | Profit = {value[-1] - investment[-1]} | Principal: {investment[-1]}")
+            timings.startStage("plot")
+            if args.profit:
+                plotProfit("All", days, profit, args.plot_file)
+            else:
+                plotValues("All", days, value, investment, args.plot_file)
 
         # print(trades[-1])
 
+    timings.finish(args.timings, args.profile, "StockStats.py", vars(args))
+
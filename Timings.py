@@ -0,0 +1,116 @@
+import sys
+import json
+import time
+import cProfile
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+try:
+   import resource
+except ImportError:
+   resource = None # Not on Windows, there is no peak memory there.
+
+################################################################################
+
+def getPeakMemory(who = None):
+   # Peak resident memory (bytes) of this process (or its finished child processes, i.e. a process pool).
+   if resource == None:
+      return None
+   peak = resource.getrusage(who if who != None else resource.RUSAGE_SELF).ru_maxrss
+   return peak if sys.platform == 'darwin' else peak * 1024 # Linux reports KB, macOS bytes.
+
+################################################################################
+################################################################################
+################################################################################
+
+class Timings(object):
+   # Wall / CPU time of each stage of a run, counts of the work done and peak memory, saved as a json report
+   # (--timings on the command line tools). Optionally profiles the whole run with cProfile (--profile).
+   # Stages are either started one after the other (startStage, each one stops the previous one) or nested inside
+   # them (stage, i.e. the time spent in prompts while applying rules). A stage that runs more than once adds up.
+   # Code anywhere can add to the counts of the shared instance, 'timings' (i.e. timings.counts['lookups'] += 1).
+   # Counts on the per transaction paths are only kept when 'enabled' (a report is being saved), they cost too much
+   # otherwise.
+   def __init__(self):
+      self.enabled = False
+      self.stages = {} # Name -> [wall seconds, cpu seconds, calls, peak memory after]
+      self.counts = Counter()
+      self.details = {} # Anything else for the report (json serializable), i.e. the time per symbol downloaded.
+      self.profiler = None
+      self.__current = None # [name, wall start, cpu start] of the stage started by startStage.
+      self.__start = [time.perf_counter(), time.process_time()]
+
+   #############################################################################
+
+   def start(self, timingsPath: str = None, profilePath: str = None):
+      # Turn the counts on when the report will be saved to timingsPath and profile when profilePath is given.
+      self.enabled = timingsPath != None
+      if profilePath != None:
+         self.startProfile()
+
+   def startProfile(self):
+      self.profiler = cProfile.Profile()
+      self.profiler.enable()
+
+   #############################################################################
+
+   def __addStage(self, name: str, wallStart: float, cpuStart: float):
+      stage = self.stages.setdefault(name, [0.0, 0.0, 0, None])
+      stage[0] += time.perf_counter() - wallStart
+      stage[1] += time.process_time() - cpuStart
+      stage[2] += 1
+      stage[3] = getPeakMemory()
+
+   #############################################################################
+
+   def startStage(self, name: str):
+      self.stopStage()
+      self.__current = [name, time.perf_counter(), time.process_time()]
+
+   def stopStage(self):
+      if self.__current != None:
+         self.__addStage(*self.__current)
+         self.__current = None
+
+   #############################################################################
+
+   @contextmanager
+   def stage(self, name: str):
+      wallStart = time.perf_counter()
+      cpuStart = time.process_time()
+      try:
+         yield
+      finally:
+         self.__addStage(name, wallStart, cpuStart)
+
+   #############################################################################
+
+   def getReport(self, command: str = None, args = None):
+      self.stopStage()
+      report = {'command': command, 'args': args, 'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+      report['total'] = {'wall': time.perf_counter() - self.__start[0], 'cpu': time.process_time() - self.__start[1]}
+      if resource != None:
+         children = resource.getrusage(resource.RUSAGE_CHILDREN)
+         report['total']['childrenCpu'] = children.ru_utime + children.ru_stime
+      report['stages'] = {name: {'wall': wall, 'cpu': cpu, 'calls': calls, 'peakMemoryAfter': peak} for name, [wall, cpu, calls, peak] in self.stages.items()}
+      report['counts'] = dict(self.counts)
+      report['peakMemory'] = getPeakMemory()
+      report['peakMemoryChildren'] = getPeakMemory(resource.RUSAGE_CHILDREN) if resource != None else None
+      report.update(self.details)
+      return report
+
+   #############################################################################
+
+   def finish(self, timingsPath: str = None, profilePath: str = None, command: str = None, args = None):
+      # Save the json report to timingsPath and the cProfile stats (i.e. for pstats / snakeviz) to profilePath.
+      if self.profiler != None:
+         self.profiler.disable()
+         if profilePath != None:
+            self.profiler.dump_stats(profilePath)
+      if timingsPath != None:
+         with open(timingsPath, 'w') as f:
+            json.dump(self.getReport(command, args), f, indent=1, default=str)
+
+################################################################################
+
+timings = Timings()
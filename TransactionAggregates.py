@@ -0,0 +1,138 @@
+import os
+import json
+from decimal import Decimal
+from datetime import datetime
+from FinancialHelpers import *
+from TransactionRecord import RawTransaction
+
+################################################################################
+
+AGGREGATES_VERSION = 1
+
+################################################################################
+
+def isMonthAligned(timeRanges):
+   # Every time range starts and stops at the start of a month (or is open), i.e. getMonthsInRange / getYearsInRange.
+   # Then each month is in a time range completely or not at all.
+   for timeRange in timeRanges.values():
+      for edge in timeRange:
+         if edge != None and (edge.day != 1 or edge.hour != 0 or edge.minute != 0 or edge.second != 0 or edge.microsecond != 0):
+            return False
+   return True
+
+################################################################################
+################################################################################
+################################################################################
+
+class TransactionAggregates(object):
+   # Sum of the amounts per (month, action, category), saved next to the transactions json (<name>_aggregates.json)
+   # so the monthly / yearly reports don't go through every transaction. Kept up to date one transaction at a time
+   # as they are added / changed (see AllTransactions.__applyChange).
+   # The file has the version of its format and the size / mtime of the files it was made from (the json and the
+   # journal), it is only used while those haven't changed since.
+   # Each bucket also has the oldest / newest transaction date in it. These are only bounds once a transaction has
+   # been taken out of the bucket, but they are always in the bucket's month.
+   def __init__(self, pathToTransJson: str, sourcePaths):
+      self.pathToAggregates = os.path.splitext(pathToTransJson)[0] + "_aggregates.json"
+      self.sourcePaths = sourcePaths
+      self.buckets = None # (month, action, category) -> [sum (Decimal), count, oldest, newest], None if not loaded / built.
+
+   #############################################################################
+
+   def __getSource(self):
+      source = []
+      for path in self.sourcePaths:
+         stat = os.stat(path) if os.path.isfile(path) else None
+         source.append([os.path.basename(path), stat.st_size if stat != None else None, stat.st_mtime_ns if stat != None else None])
+      return source
+
+   #############################################################################
+
+   def load(self):
+      # Load the saved buckets if they are current, returns whether they were.
+      try:
+         with open(self.pathToAggregates, 'r') as f:
+            saved = json.load(f)
+      except (OSError, ValueError):
+         return False
+      if saved.get('version') != AGGREGATES_VERSION or saved.get('source') != self.__getSource():
+         return False
+      self.buckets = {}
+      for month, action, category, amountSum, count, oldest, newest in saved['buckets']:
+         self.buckets[(month, action, category)] = [Decimal(amountSum), count, parseTransDateTime(oldest), parseTransDateTime(newest)]
+      return True
+
+   #############################################################################
+
+   def save(self):
+      buckets = [[key[0], key[1], key[2], str(bucket[0]), bucket[1], str(bucket[2]), str(bucket[3])] for key, bucket in self.buckets.items()]
+      tempPath = self.pathToAggregates + ".tmp"
+      with open(tempPath, 'w') as f:
+         json.dump({'version': AGGREGATES_VERSION, 'source': self.__getSource(), 'buckets': buckets}, f)
+      os.replace(tempPath, self.pathToAggregates)
+
+   #############################################################################
+
+   def build(self, transList, getDate):
+      # getDate - Gets the datetime of a transaction (i.e. AllTransactions.getTransActionDateTime).
+      self.buckets = {}
+      for trans in transList:
+         self.add(trans, getDate(trans))
+
+   #############################################################################
+
+   def __getKey(self, trans, date: datetime):
+      return (date.strftime("%Y-%m"), trans.get('action'), trans.get('category'))
+
+   def __getAmount(self, trans):
+      # Decimal, so adding and taking out transactions doesn't drift from the sums made from scratch.
+      raw = trans['raw']
+      amount = raw.amount if type(raw) == RawTransaction else raw['amount']
+      return amount if type(amount) == Decimal else Decimal(str(amount))
+
+   #############################################################################
+
+   def add(self, trans, date: datetime):
+      key = self.__getKey(trans, date)
+      bucket = self.buckets.get(key)
+      if bucket == None:
+         self.buckets[key] = [self.__getAmount(trans), 1, date, date]
+         return
+      bucket[0] += self.__getAmount(trans)
+      bucket[1] += 1
+      bucket[2] = min(bucket[2], date)
+      bucket[3] = max(bucket[3], date)
+
+   #############################################################################
+
+   def remove(self, trans, date: datetime):
+      key = self.__getKey(trans, date)
+      bucket = self.buckets[key]
+      bucket[0] -= self.__getAmount(trans)
+      bucket[1] -= 1
+      if bucket[1] == 0:
+         del self.buckets[key]
+
+   #############################################################################
+
+   def straddles(self, startInclusive: datetime = None, stopExclusive: datetime = None):
+      # Whether a bucket has transactions on both sides of the start or stop (i.e. pruning with this date range
+      # would split a bucket, so the buckets can't be used).
+      for bucket in self.buckets.values():
+         for edge in [startInclusive, stopExclusive]:
+            if edge != None and bucket[2] < edge and bucket[3] >= edge:
+               return True
+      return False
+
+   #############################################################################
+
+   def getColumns(self) -> 'TransactionColumns':
+      # One row per bucket. The date of each row is the oldest date in the bucket, so it is in the bucket's month
+      # (for month aligned time ranges) and, when no bucket straddles a date range, in the range if the whole bucket is.
+      from TransactionColumns import TransactionColumns # numpy, see AllTransactions.
+      keys = list(self.buckets.keys())
+      return TransactionColumns([self.buckets[key][2] for key in keys],
+                                [float(self.buckets[key][0]) for key in keys],
+                                [key[1] for key in keys],
+                                [key[2] for key in keys],
+                                [None] * len(keys))
@@ -0,0 +1,166 @@
+import numpy as np
+from datetime import datetime
+from TransactionRecord import TransactionRecord, RawTransaction
+
+################################################################################
+
+def getTransactionColumns(transList):
+   # transList - TransactionRecords (the typed date / amount are used as is) or transaction dicts.
+   raws = [trans.raw if type(trans) == TransactionRecord else RawTransaction(trans['raw']) for trans in transList]
+   return TransactionColumns([raw.date for raw in raws],
+                             [float(raw.amount) for raw in raws],
+                             [trans.get('action') for trans in transList],
+                             [trans.get('category') for trans in transList],
+                             [trans.get('name') for trans in transList])
+
+################################################################################
+################################################################################
+################################################################################
+
+class TransactionColumns(object):
+   # Column (array) view of transactions. The dates and amounts are parsed once, and the action / category / name
+   # strings are stored as integer codes into the matching names list (-1 = not set). Each argument is a list with
+   # one entry per transaction (None for a missing action / category / name).
+   def __init__(self, dates, amounts, actions, categories, names):
+      self.count = len(dates)
+      self.dates = np.array(dates, dtype='datetime64[s]')
+      self.amounts = np.array(amounts, dtype=np.float64)
+      self.actionNames, self.actionCodes = self.__makeCodes(actions)
+      self.categoryNames, self.categoryCodes = self.__makeCodes(categories)
+      self.nameNames, self.nameCodes = self.__makeCodes(names)
+
+   #############################################################################
+
+   @classmethod
+   def fromCodes(cls, dates, amounts, actionNames, actionCodes, categoryNames, categoryCodes, nameNames, nameCodes):
+      # Columns from arrays that are already in column form (i.e. a snapshot or a subset). The arrays are used as is.
+      columns = cls.__new__(cls)
+      columns.count = len(dates)
+      columns.dates = dates
+      columns.amounts = amounts
+      columns.actionNames = list(actionNames)
+      columns.actionCodes = actionCodes
+      columns.categoryNames = list(categoryNames)
+      columns.categoryCodes = categoryCodes
+      columns.nameNames = list(nameNames)
+      columns.nameCodes = nameCodes
+      return columns
+
+   #############################################################################
+
+   def getSubset(self, mask):
+      # Columns of just the transactions in 'mask'. The names lists (and so the codes) stay the same.
+      return TransactionColumns.fromCodes(self.dates[mask], self.amounts[mask], self.actionNames, self.actionCodes[mask],
+                                          self.categoryNames, self.categoryCodes[mask], self.nameNames, self.nameCodes[mask])
+
+   #############################################################################
+
+   def __makeCodes(self, values):
+      names = []
+      codeLookup = {}
+      codes = np.empty(len(values), dtype=np.int32)
+      for i, val in enumerate(values):
+         if val == None:
+            codes[i] = -1
+            continue
+         code = codeLookup.get(val)
+         if code == None:
+            code = len(names)
+            codeLookup[val] = code
+            names.append(val)
+         codes[i] = code
+      return [names, codes]
+
+   #############################################################################
+
+   def getActionMask(self, action: str):
+      if action not in self.actionNames:
+         return np.zeros(self.count, dtype=bool)
+      return self.actionCodes == self.actionNames.index(action)
+
+   #############################################################################
+
+   def getActionsMask(self, actions):
+      return np.isin(self.actionCodes, [code for code, action in enumerate(self.actionNames) if action in actions])
+
+   #############################################################################
+
+   def getCategoriesMask(self, categories):
+      return np.isin(self.categoryCodes, [code for code, cat in enumerate(self.categoryNames) if cat in categories])
+
+   #############################################################################
+
+   def getDateRangeMask(self, startInclusive: datetime = None, stopExclusive: datetime = None):
+      mask = np.ones(self.count, dtype=bool)
+      if startInclusive != None:
+         mask &= self.dates >= np.datetime64(startInclusive, 's')
+      if stopExclusive != None:
+         mask &= self.dates < np.datetime64(stopExclusive, 's')
+      return mask
+
+   #############################################################################
+
+   def getCategoryRows(self, categories):
+      # Map each category code to a row in 'categories'. Categories that aren't in the list go to
+      # the 'else' row (if 'else' is in the list) or -1. Index the result with 'categoryCodes + 1'.
+      elseRow = categories.index('else') if 'else' in categories else -1
+      rows = np.full(len(self.categoryNames) + 1, elseRow, dtype=np.int32)
+      for code, cat in enumerate(self.categoryNames):
+         if cat in categories:
+            rows[code + 1] = categories.index(cat)
+      return rows
+
+   #############################################################################
+
+   def getBucketIndexes(self, timeRanges):
+      # Index of the time range (in 'timeRanges' order) that each transaction falls in, -1 if none.
+      # Returns None if the time ranges aren't back to back (i.e. each one starts where the last one stopped).
+      ranges = list(timeRanges.values())
+      if len(ranges) == 0:
+         return np.full(self.count, -1, dtype=np.int64)
+      for i in range(len(ranges)):
+         if i > 0 and (ranges[i][0] == None or ranges[i][0] != ranges[i-1][1]):
+            return None
+         if ranges[i][0] != None and ranges[i][1] != None and ranges[i][0] >= ranges[i][1]:
+            return None
+         if i < len(ranges)-1 and ranges[i][1] == None:
+            return None
+
+      # Binary search each date into the sorted bucket edges (an open start / stop is the min / max date).
+      edges = [np.datetime64(r[0], 's') if r[0] != None else np.datetime64(np.iinfo(np.int64).min + 1, 's') for r in ranges]
+      edges.append(np.datetime64(ranges[-1][1], 's') if ranges[-1][1] != None else np.datetime64(np.iinfo(np.int64).max, 's'))
+      buckets = np.searchsorted(np.array(edges, dtype='datetime64[s]'), self.dates, side='right') - 1
+      buckets[buckets >= len(ranges)] = -1
+      return buckets
+
+   #############################################################################
+
+   def getGroupedSums(self, timeRanges):
+      # Sum of the amounts for every action x category x time range, in a single pass over the transactions.
+      # Returns an array indexed by [action code, category code + 1, time range index] (category row 0 is 'no category').
+      numActions = len(self.actionNames)
+      numCategories = len(self.categoryNames) + 1
+      numBuckets = len(timeRanges)
+      groups = self.actionCodes.astype(np.int64) * numCategories + self.categoryCodes + 1
+      hasAction = self.actionCodes >= 0
+
+      buckets = self.getBucketIndexes(timeRanges)
+      if buckets is not None:
+         valid = hasAction & (buckets >= 0)
+         sums = np.bincount(groups[valid] * numBuckets + buckets[valid], self.amounts[valid], numActions * numCategories * numBuckets)
+         return sums.reshape(numActions, numCategories, numBuckets)
+
+      # Overlapping or gapped time ranges, a transaction can be in any number of them.
+      sums = np.zeros((numActions * numCategories, numBuckets))
+      for bucket, thisTimeRange in enumerate(timeRanges.values()):
+         valid = hasAction & self.getDateRangeMask(thisTimeRange[0], thisTimeRange[1])
+         sums[:, bucket] = np.bincount(groups[valid], self.amounts[valid], numActions * numCategories)
+      return sums.reshape(numActions, numCategories, numBuckets)
+
+   #############################################################################
+
+   def getActionSums(self, groupedSums, action: str):
+      # Slice of 'groupedSums' for one action, indexed by [category code + 1, time range index].
+      if action not in self.actionNames:
+         return np.zeros(groupedSums.shape[1:])
+      return groupedSums[self.actionNames.index(action)]
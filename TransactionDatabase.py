@@ -0,0 +1,133 @@
+import os
+import json
+import sqlite3
+from FinancialHelpers import *
+
+################################################################################
+
+DATABASE_EXTENSIONS = ['.db', '.sqlite', '.sqlite3']
+
+################################################################################
+
+def isDatabasePath(path: str):
+   return path != None and os.path.splitext(path)[1].lower() in DATABASE_EXTENSIONS
+
+################################################################################
+################################################################################
+################################################################################
+
+class TransactionDatabase(object):
+   # Transactions stored in a SQLite file. Each row has the full transaction (as json) plus the columns that get
+   # searched / summed. Changes are written as they happen and committed by 'commit' (like saving the json).
+   def __init__(self, pathToDatabase: str):
+      isNew = not os.path.isfile(pathToDatabase)
+      self.connection = sqlite3.connect(pathToDatabase)
+      self.connection.execute("CREATE TABLE IF NOT EXISTS transactions (id INTEGER PRIMARY KEY, rawKey TEXT NOT NULL, date TEXT, amount REAL, action TEXT, category TEXT, trans TEXT NOT NULL)")
+      self.connection.execute("CREATE INDEX IF NOT EXISTS transactionsRawKey ON transactions (rawKey)")
+      self.connection.execute("CREATE INDEX IF NOT EXISTS transactionsDate ON transactions (date)")
+      self.connection.execute("CREATE INDEX IF NOT EXISTS transactionsAction ON transactions (action, date)")
+      self.connection.execute("CREATE INDEX IF NOT EXISTS transactionsCategory ON transactions (category, date)")
+      self.filters = [] # List of [sql, params] that every query is limited to (see the prune methods in AllTransactions)
+
+      # A new database starts with the transactions from the json of the same name (if there is one).
+      pathToTransJson = os.path.splitext(pathToDatabase)[0] + ".json"
+      if isNew and os.path.isfile(pathToTransJson):
+         with open(pathToTransJson, 'r') as f:
+            for trans in json.load(f):
+               self.__insert(trans)
+      self.connection.commit()
+
+   #############################################################################
+
+   def __getRawKey(self, rawTrans: dict):
+      return json.dumps(rawTrans, sort_keys=True)
+
+   #############################################################################
+
+   def __getRowValues(self, trans):
+      try:
+         amount = float(trans['raw']['amount'])
+      except:
+         amount = None
+      return [trans['raw'].get('date'), amount, trans.get('action'), trans.get('category'), json.dumps(trans)]
+
+   #############################################################################
+
+   def __insert(self, trans):
+      self.connection.execute("INSERT INTO transactions (rawKey, date, amount, action, category, trans) VALUES (?, ?, ?, ?, ?, ?)", [self.__getRawKey(trans['raw'])] + self.__getRowValues(trans))
+
+   #############################################################################
+
+   def __update(self, rowId: int, trans):
+      self.connection.execute("UPDATE transactions SET date = ?, amount = ?, action = ?, category = ?, trans = ? WHERE id = ?", self.__getRowValues(trans) + [rowId])
+
+   #############################################################################
+
+   def __getWhere(self, extraSql: str = None, extraParams = []):
+      clauses = [sql for sql, params in self.filters]
+      params = [param for sql, filterParams in self.filters for param in filterParams]
+      if extraSql != None:
+         clauses.append(extraSql)
+         params += extraParams
+      if len(clauses) == 0:
+         return ["", params]
+      return [" WHERE " + " AND ".join(clauses), params]
+
+   #############################################################################
+
+   def addFilter(self, sql: str, params = []):
+      self.filters.append([sql, params])
+
+   #############################################################################
+
+   def getTransactions(self):
+      where, params = self.__getWhere()
+      return [json.loads(row[0]) for row in self.connection.execute("SELECT trans FROM transactions" + where + " ORDER BY id", params)]
+
+   #############################################################################
+
+   def getMatchingTransactions(self, rawTrans: dict):
+      where, params = self.__getWhere("rawKey = ?", [self.__getRawKey(rawTrans)])
+      return [json.loads(row[0]) for row in self.connection.execute("SELECT trans FROM transactions" + where + " ORDER BY id", params)]
+
+   #############################################################################
+
+   def applyChange(self, change):
+      # Same changes as AllTransactions.__applyChange
+      if change["op"] == "add":
+         rawKey = self.__getRawKey(change["trans"]["raw"])
+         if self.connection.execute("SELECT 1 FROM transactions WHERE rawKey = ? LIMIT 1", [rawKey]).fetchone() == None:
+            self.__insert(change["trans"])
+      elif change["op"] == "mod":
+         rows = self.connection.execute("SELECT id, trans FROM transactions WHERE rawKey = ?", [self.__getRawKey(change["raw"])]).fetchall()
+         for rowId, transJson in rows:
+            trans = json.loads(transJson)
+            trans.update(change["values"])
+            self.__update(rowId, trans)
+      elif change["op"] == "removeCategory":
+         rows = self.connection.execute("SELECT id, trans FROM transactions WHERE category = ?", [change["category"]]).fetchall()
+         for rowId, transJson in rows:
+            trans = json.loads(transJson)
+            trans.pop("category")
+            self.__update(rowId, trans)
+
+   #############################################################################
+
+   def getActionStats(self, action: str):
+      # [oldest date string, newest date string, count]
+      where, params = self.__getWhere("action = ?", [action])
+      return list(self.connection.execute("SELECT MIN(date), MAX(date), COUNT(*) FROM transactions" + where, params).fetchone())
+
+   #############################################################################
+
+   def getGroupedSums(self, byMonth: bool = False):
+      # Rows of [date, action, category, sum of the amounts], one per distinct date / action / category. Or, byMonth,
+      # one per month / action / category, with the oldest date in the month (like TransactionAggregates.getColumns).
+      where, params = self.__getWhere("amount IS NOT NULL")
+      group = "substr(date, 1, 7)" if byMonth else "date"
+      return self.connection.execute("SELECT MIN(date), action, category, SUM(amount) FROM transactions" + where + " GROUP BY " + group + ", action, category ORDER BY 1", params).fetchall()
+
+   #############################################################################
+
+   def commit(self):
+      self.connection.commit()
@@ -0,0 +1,105 @@
+import os
+import csv
+from FinancialHelpers import *
+
+################################################################################
+
+EXPORT_FORMATS = ['xlsx', 'csv', 'parquet', 'feather']
+
+################################################################################
+
+def toFloatOrNone(value):
+   try:
+      return float(value)
+   except (TypeError, ValueError):
+      return None
+
+################################################################################
+
+def getSpreadsheetColumns(transList, metaDataKeys = [], rawKey: str = 'raw'):
+   # [column names, columns (list of values per column)] for a spreadsheet of the transactions, each column built
+   # directly from the transactions. The columns are 'meta.<key>' for each of the metadata keys, then
+   # TRANSACTION_KEYS from each transaction's raw dict (rawKey = None when the transactions are the raw dicts).
+   # Missing values are None and the amounts are floats (None if they aren't a number).
+   metaDataKeys = list(dict.fromkeys(metaDataKeys)) # Without duplicates, in order.
+   names = ['meta.' + key for key in metaDataKeys] + TRANSACTION_KEYS
+   columns = [[trans.get(key) for trans in transList] for key in metaDataKeys]
+
+   raws = [trans.get(rawKey) for trans in transList] if rawKey != None else transList
+   raws = [raw if raw != None else {} for raw in raws]
+   for key in TRANSACTION_KEYS:
+      if key == 'amount':
+         columns.append([toFloatOrNone(raw.get(key)) for raw in raws])
+      else:
+         columns.append([raw.get(key) for raw in raws])
+   return [names, columns]
+
+################################################################################
+
+def getExportFormat(savePath: str):
+   exportFormat = os.path.splitext(savePath)[1].lower().lstrip('.')
+   if exportFormat not in EXPORT_FORMATS:
+      raise ValueError(f"Can't export to '{savePath}', the extension has to be one of {EXPORT_FORMATS}")
+   return exportFormat
+
+################################################################################
+
+def writeXlsx(names, columns, savePath: str):
+   # Written a row at a time without keeping the sheet in memory (xlsxwriter's constant memory mode, or openpyxl's
+   # write only mode when xlsxwriter isn't installed). Same layout as pandas' to_excel: the row number then the columns.
+   rows = zip(range(len(columns[0]) if len(columns) > 0 else 0), *columns)
+   try:
+      import xlsxwriter
+   except ImportError:
+      xlsxwriter = None
+
+   if xlsxwriter != None:
+      workbook = xlsxwriter.Workbook(savePath, {'constant_memory': True, 'strings_to_formulas': False, 'strings_to_urls': False})
+      sheet = workbook.add_worksheet('Sheet1')
+      sheet.write_row(0, 1, names)
+      for rowNum, row in enumerate(rows):
+         sheet.write_row(rowNum + 1, 0, row)
+      workbook.close()
+   else:
+      from openpyxl import Workbook
+      workbook = Workbook(write_only=True)
+      sheet = workbook.create_sheet('Sheet1')
+      sheet.append([None] + names)
+      for row in rows:
+         sheet.append(row)
+      workbook.save(savePath)
+
+################################################################################
+
+def writeCsv(names, columns, savePath: str):
+   # Same layout as pandas' to_csv: the row number then the columns, missing values are empty.
+   rows = zip(range(len(columns[0]) if len(columns) > 0 else 0), *columns)
+   with open(savePath, 'w', newline='', encoding='utf-8') as f:
+      writer = csv.writer(f)
+      writer.writerow([''] + names)
+      writer.writerows(rows)
+
+################################################################################
+
+def exportColumns(names, columns, savePath: str):
+   # Save the columns (see getSpreadsheetColumns), the format is the extension of savePath (one of EXPORT_FORMATS).
+   # Parquet and Feather need pandas with pyarrow.
+   exportFormat = getExportFormat(savePath)
+   if exportFormat == 'xlsx':
+      writeXlsx(names, columns, savePath)
+   elif exportFormat == 'csv':
+      writeCsv(names, columns, savePath)
+   else:
+      import pandas as pd
+      data = pd.DataFrame(dict(zip(names, columns)), columns=names)
+      if exportFormat == 'parquet':
+         data.to_parquet(savePath)
+      else:
+         data.to_feather(savePath)
+
+################################################################################
+
+def exportTransactions(transList, savePath: str, metaDataKeys = [], rawKey: str = 'raw'):
+   getExportFormat(savePath) # Check the extension before doing the work.
+   names, columns = getSpreadsheetColumns(transList, metaDataKeys, rawKey)
+   exportColumns(names, columns, savePath)
@@ -0,0 +1,109 @@
+import os
+import json
+import shutil
+from datetime import datetime
+from FinancialHelpers import *
+
+################################################################################
+
+JOURNAL_COMPACT_CHANGES = 5000 # Fold the journal into the snapshot once it has this many changes.
+
+################################################################################
+################################################################################
+################################################################################
+
+class TransactionJournal(object):
+   # Append only log (JSON Lines, one change per line) of the changes made on top of the transactions json (the snapshot).
+   #   <name>.json                    - Snapshot, same format as always.
+   #   <name>_journal.jsonl           - Changes since the snapshot was written.
+   #   <name>_journal_<time>.jsonl    - Older journals, already folded into the snapshot.
+   #   <name>_journal_base.json       - The snapshot from when the journal was started (same extension as the snapshot).
+   # Replaying the base and then every journal in order gets back the transactions at any point in time.
+   def __init__(self, pathToTransJson: str):
+      self.pathToTransJson = pathToTransJson
+      self.pathPrefix = os.path.splitext(pathToTransJson)[0] + "_journal"
+      self.pathToJournal = self.pathPrefix + ".jsonl"
+      self.pathToBase = self.pathPrefix + "_base" + os.path.splitext(pathToTransJson)[1]
+      self.changeCount = 0
+
+   #############################################################################
+
+   def exists(self):
+      return os.path.isfile(self.pathToJournal)
+
+   #############################################################################
+
+   def migrate(self):
+      # Start journaling on top of the current transactions json.
+      if not os.path.isfile(self.pathToBase):
+         if os.path.isfile(self.pathToTransJson):
+            shutil.copyfile(self.pathToTransJson, self.pathToBase)
+         else:
+            writeJsonList(self.pathToBase, [])
+      open(self.pathToJournal, 'a').close()
+
+   #############################################################################
+
+   def __readChanges(self, path: str):
+      changes = []
+      with open(path, 'r') as f:
+         for line in f:
+            try:
+               changes.append(json.loads(line))
+            except:
+               pass # Partially written line (i.e. the last save was interrupted)
+      return changes
+
+   #############################################################################
+
+   def readChanges(self):
+      # Changes since the snapshot.
+      changes = self.__readChanges(self.pathToJournal) if self.exists() else []
+      self.changeCount = len(changes)
+      return changes
+
+   #############################################################################
+
+   def readHistory(self, asOf: datetime):
+      # [base transactions, changes] needed to rebuild the transactions as of 'asOf'.
+      transList = list(iterJsonList(self.pathToBase))
+
+      journalDir = os.path.dirname(os.path.abspath(self.pathToJournal))
+      archiveStart = os.path.basename(self.pathPrefix) + "_"
+      archives = [os.path.join(journalDir, fileName) for fileName in os.listdir(journalDir) if fileName.startswith(archiveStart) and fileName.endswith(".jsonl") and fileName[len(archiveStart):-len(".jsonl")].isdigit()]
+
+      changes = []
+      asOfStr = asOf.strftime(TRANSACTION_DATE_FORMAT)
+      for path in sorted(archives) + [self.pathToJournal]:
+         if os.path.isfile(path):
+            changes += [change for change in self.__readChanges(path) if change["time"] <= asOfStr]
+      return [transList, changes]
+
+   #############################################################################
+
+   def appendChanges(self, changes):
+      if len(changes) == 0:
+         return
+      with open(self.pathToJournal, 'a') as f:
+         for change in changes:
+            f.write(json.dumps(change) + "\n")
+         f.flush()
+         os.fsync(f.fileno())
+      self.changeCount += len(changes)
+
+   #############################################################################
+
+   def needsCompaction(self):
+      return self.changeCount >= JOURNAL_COMPACT_CHANGES
+
+   #############################################################################
+
+   def compact(self, transList):
+      # Write a new snapshot, then move the journal it includes out of the way.
+      pathWithoutExt, ext = os.path.splitext(self.pathToTransJson)
+      tempPath = pathWithoutExt + "_tmp" + ext
+      writeJsonList(tempPath, transList)
+      os.replace(tempPath, self.pathToTransJson)
+      os.replace(self.pathToJournal, self.pathPrefix + "_" + getUniqueFileNameTimeStr() + ".jsonl")
+      open(self.pathToJournal, 'a').close()
+      self.changeCount = 0
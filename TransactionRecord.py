@@ -0,0 +1,223 @@
+import sys
+from decimal import Decimal, InvalidOperation
+from datetime import datetime
+from FinancialHelpers import *
+
+################################################################################
+
+MISSING = object() # Slot value for a key that isn't in the json.
+META_KEYS = ["action", "type", "name", "category"]
+TRANSACTION_KEY_SET = frozenset(TRANSACTION_KEYS)
+RECORD_KEY_SET = frozenset(META_KEYS + ["raw"])
+
+################################################################################
+
+def internValue(value):
+   return sys.intern(value) if type(value) == str else value
+
+################################################################################
+
+def toTypedDate(dateStr):
+   # datetime if the string is exactly str() of that datetime, otherwise the string is kept as is.
+   if type(dateStr) == str and len(dateStr) == 19:
+      try:
+         date = parseTransDateTime(dateStr)
+         if str(date) == dateStr:
+            return date
+      except ValueError:
+         pass
+   return dateStr
+
+################################################################################
+
+def toTypedAmount(amountStr):
+   # Decimal if the string is exactly str() of that Decimal (Decimal keeps the number of digits, i.e. '-12.30'),
+   # otherwise the string is kept as is.
+   if type(amountStr) == str:
+      try:
+         amount = Decimal(amountStr)
+         if str(amount) == amountStr:
+            return amount
+      except InvalidOperation:
+         pass
+   return amountStr
+
+################################################################################
+
+def toJsonValue(value):
+   # Back to the value that was in the json.
+   if type(value) == datetime or type(value) == Decimal:
+      return str(value)
+   return value
+
+################################################################################
+################################################################################
+################################################################################
+
+class RawTransaction(object):
+   # The 'raw' dict of a transaction (the TRANSACTION_KEYS strings from the OFX file) as a record. 'date' is a datetime
+   # and 'amount' is a Decimal (when they convert back to the exact same string), the other strings (except the
+   # unique 'id') are interned.
+   # Keys the json didn't have are MISSING, keys that aren't in TRANSACTION_KEYS go in 'extra'.
+   # Reads like the dict it came from (trans['amount'] is still the string) so it can be passed wherever a 'raw' dict is.
+   __slots__ = TRANSACTION_KEYS + ["extra"]
+
+   def __init__(self, rawTrans: dict):
+      # One assignment per key (instead of a loop over TRANSACTION_KEYS), this runs for every transaction loaded.
+      get = rawTrans.get
+      self.payee = internValue(get("payee", MISSING))
+      self.type = internValue(get("type", MISSING))
+      self.date = toTypedDate(get("date", MISSING))
+      self.user_date = internValue(get("user_date", MISSING))
+      self.amount = toTypedAmount(get("amount", MISSING))
+      self.id = get("id", MISSING)
+      self.memo = internValue(get("memo", MISSING))
+      self.sic = internValue(get("sic", MISSING))
+      self.mcc = internValue(get("mcc", MISSING))
+      self.checknum = internValue(get("checknum", MISSING))
+      self.extra = None
+      if rawTrans.keys() != TRANSACTION_KEY_SET:
+         self.extra = {key: value for key, value in rawTrans.items() if key not in TRANSACTION_KEY_SET} or None
+
+   #############################################################################
+
+   def toDict(self):
+      # The 'raw' dict as it is in the json.
+      retVal = {}
+      for key in TRANSACTION_KEYS:
+         value = getattr(self, key)
+         if value is not MISSING:
+            retVal[key] = toJsonValue(value)
+      if self.extra != None:
+         retVal.update(self.extra)
+      return retVal
+
+   #############################################################################
+
+   def __getitem__(self, key: str):
+      if key in TRANSACTION_KEYS:
+         value = getattr(self, key)
+         if value is not MISSING:
+            return toJsonValue(value)
+      elif self.extra != None and key in self.extra:
+         return self.extra[key]
+      raise KeyError(key)
+
+   def get(self, key: str, default = None):
+      try:
+         return self[key]
+      except KeyError:
+         return default
+
+   def __contains__(self, key: str):
+      return self.get(key, MISSING) is not MISSING
+
+   def keys(self):
+      return self.toDict().keys()
+
+   def items(self):
+      return self.toDict().items()
+
+   def __eq__(self, other):
+      if isinstance(other, RawTransaction):
+         other = other.toDict()
+      return self.toDict() == other
+
+   __hash__ = None # Changes when the transaction does, same as a dict.
+
+################################################################################
+################################################################################
+################################################################################
+
+class TransactionRecord(object):
+   # One stored transaction ({"action", "type", "name", "raw", "category"} in the json) as a record. The metadata
+   # strings are interned (there are only a few distinct ones) and 'raw' is a RawTransaction. Keys that aren't
+   # in META_KEYS go in 'extra'. Supports the dict operations AllTransactions has always used on transactions
+   # (trans['action'], trans.get('category'), trans.pop('category'), trans.update(values), ...).
+   __slots__ = META_KEYS + ["raw", "extra"]
+
+   def __init__(self, trans: dict):
+      get = trans.get
+      self.action = internValue(get("action", MISSING))
+      self.type = internValue(get("type", MISSING))
+      self.name = internValue(get("name", MISSING))
+      self.category = internValue(get("category", MISSING))
+      raw = get("raw", MISSING)
+      self.raw = RawTransaction(raw) if type(raw) == dict else raw
+      self.extra = None
+      if not trans.keys() <= RECORD_KEY_SET:
+         self.extra = {key: value for key, value in trans.items() if key not in RECORD_KEY_SET}
+
+   #############################################################################
+
+   def toDict(self):
+      # The transaction as it is in the json.
+      retVal = {}
+      for key in ["action", "type", "name", "raw", "category"]:
+         value = getattr(self, key)
+         if value is MISSING:
+            continue
+         retVal[key] = value.toDict() if isinstance(value, RawTransaction) else value
+      if self.extra != None:
+         retVal.update(self.extra)
+      return retVal
+
+   #############################################################################
+
+   def __getitem__(self, key: str):
+      if key in META_KEYS or key == "raw":
+         value = getattr(self, key)
+         if value is not MISSING:
+            return value
+      elif self.extra != None and key in self.extra:
+         return self.extra[key]
+      raise KeyError(key)
+
+   def get(self, key: str, default = None):
+      try:
+         return self[key]
+      except KeyError:
+         return default
+
+   def __contains__(self, key: str):
+      return self.get(key, MISSING) is not MISSING
+
+   def __setitem__(self, key: str, value):
+      if key in META_KEYS:
+         setattr(self, key, internValue(value))
+      elif key == "raw":
+         self.raw = RawTransaction(value) if type(value) == dict else value
+      else:
+         if self.extra == None:
+            self.extra = {}
+         self.extra[key] = value
+
+   def update(self, values: dict):
+      for key, value in values.items():
+         self[key] = value
+
+   def pop(self, key: str, *default):
+      value = self.get(key, MISSING)
+      if value is MISSING:
+         if len(default) > 0:
+            return default[0]
+         raise KeyError(key)
+      if key in META_KEYS or key == "raw":
+         setattr(self, key, MISSING)
+      else:
+         del self.extra[key]
+         self.extra = self.extra or None
+      return value
+
+   def keys(self):
+      return self.toDict().keys()
+
+   def items(self):
+      return self.toDict().items()
+
+   def __eq__(self, other):
+      if isinstance(other, TransactionRecord):
+         other = other.toDict()
+      return self.toDict() == other
+
+   __hash__ = None
@@ -0,0 +1,165 @@
+import re
+import operator
+from Timings import timings
+
+################################################################################
+
+AMOUNT_COMPARES = {'>': operator.gt, '>=': operator.ge, '==': operator.eq, '<=': operator.le, '<': operator.lt}
+REGEX_SPECIAL_CHARS = '.^$*+?{}[]()|'
+
+################################################################################
+
+def getLiteralPrefix(pattern: str):
+   # Literal text that any string matched by re.match(pattern, ...) has to start with. This is conservative,
+   # it stops at the first special character and gives up on patterns that might have top level alternation.
+   if '|' in pattern:
+      return ''
+   prefix = ''
+   i = 1 if pattern.startswith('^') else 0
+   while i < len(pattern):
+      if pattern[i] == '\\':
+         if i+1 >= len(pattern) or pattern[i+1].isalnum():
+            break # Character class like \d or \s (or a back reference)
+         literal = pattern[i+1]
+         i += 2
+      elif pattern[i] in REGEX_SPECIAL_CHARS:
+         break
+      else:
+         literal = pattern[i]
+         i += 1
+
+      nextChar = pattern[i] if i < len(pattern) else ''
+      if nextChar in ['*', '?', '{']:
+         break # This character might not be there.
+      prefix += literal
+      if nextChar == '+':
+         break
+   return prefix
+
+################################################################################
+################################################################################
+################################################################################
+
+class TransactionRules(object):
+   # A rules list from a json file, i.e. [ [ [{"payee": "regex"}, {"amount": "> 50"}], result ], ... ],
+   # compiled once so it can be checked against many transactions.
+   def __init__(self, rulesList, compareAmounts: bool = False):
+      # compareAmounts - 'amount' checks are comparisons against the negated amount (i.e. expenses) instead of regexes.
+      self.rules = [] # List of [checks, result]. Each check is a function that takes a raw transaction dict.
+      for rule in rulesList:
+         checks = [self.__compileCheck(check, compareAmounts) for check in rule[0]]
+         self.rules.append([checks, rule[1]])
+      self.__buildDispatch(rulesList, compareAmounts)
+
+   #############################################################################
+
+   def __buildDispatch(self, rulesList, compareAmounts: bool):
+      # Each rule is filed under one of its regex checks so that the rules that could match a transaction
+      # (the candidates) can be found without testing every rule:
+      #   prefixTries   - Per field, a trie (nested dicts, rule indexes under the '' key) of the regex literal prefixes.
+      #   combinedRegex - Per field, all the regexes without a literal prefix joined into one alternation. If it
+      #                   doesn't match, none of the rules filed under it can match.
+      #   alwaysCheck   - Rules that can't be filed under a regex check.
+      self.prefixTries = {}
+      self.combinedRegex = {}
+      self.alwaysCheck = []
+      combinedPatterns = {}
+      for ruleIndex, rule in enumerate(rulesList):
+         regexChecks = [list(check.items())[0] for check in rule[0]]
+         regexChecks = [[key, pattern] for key, pattern in regexChecks if not (compareAmounts and key == 'amount')]
+         prefixChecks = [[key, getLiteralPrefix(pattern)] for key, pattern in regexChecks if getLiteralPrefix(pattern) != '']
+         if len(prefixChecks) > 0:
+            key, prefix = prefixChecks[0]
+            node = self.prefixTries.setdefault(key, {})
+            for char in prefix:
+               node = node.setdefault(char, {})
+            node.setdefault('', []).append(ruleIndex)
+         elif len(regexChecks) > 0 and re.search(r'\\[1-9]|\(\?P=', regexChecks[0][1]) == None:
+            # (Back references would point at the wrong group once joined, those rules are always checked.)
+            key, pattern = regexChecks[0]
+            combinedPatterns.setdefault(key, [[], []])
+            combinedPatterns[key][0].append(pattern)
+            combinedPatterns[key][1].append(ruleIndex)
+         else:
+            self.alwaysCheck.append(ruleIndex)
+
+      for key, [patterns, ruleIndexes] in combinedPatterns.items():
+         try:
+            combined = re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+         except re.error:
+            # Some patterns can't be joined (i.e. inline flags or back references). Always check these rules.
+            self.alwaysCheck += ruleIndexes
+            continue
+         self.combinedRegex[key] = [combined, ruleIndexes]
+      self.alwaysCheck.sort()
+
+   #############################################################################
+
+   def __getCandidates(self, transToCheck):
+      # Indexes (in order) of the rules that could match the transaction.
+      candidates = list(self.alwaysCheck)
+      for key, trie in self.prefixTries.items():
+         node = trie
+         for char in transToCheck[key]:
+            node = node.get(char)
+            if node == None:
+               break
+            candidates += node.get('', [])
+      for key, [combined, ruleIndexes] in self.combinedRegex.items():
+         if combined.match(transToCheck[key]) != None:
+            candidates += ruleIndexes
+      candidates.sort()
+      return candidates
+
+   #############################################################################
+
+   def __compileCheck(self, check, compareAmounts: bool):
+      transKey, transMatchStr = list(check.items())[0]
+      if compareAmounts and transKey == 'amount': # Amount is special, can do greater than, less than, equal, etc
+         cmd, val = transMatchStr.split(' ')
+         val = float(val)
+         compare = AMOUNT_COMPARES.get(cmd)
+         if compare == None:
+            return lambda trans: True # Unknown comparison, never fails.
+         return lambda trans: compare(-float(trans[transKey]), val) # expenses are negative values so negate
+
+      pattern = re.compile(transMatchStr)
+      return lambda trans: pattern.match(trans[transKey]) != None
+
+   #############################################################################
+
+   def getMatch(self, transToCheck):
+      # Result of the first rule that passes all of its checks (None if no rule matches).
+      candidates = self.__getCandidates(transToCheck)
+      for checked, ruleIndex in enumerate(candidates):
+         checks, result = self.rules[ruleIndex]
+         ruleMatch = True
+         for check in checks:
+            if not check(transToCheck):
+               ruleMatch = False
+               break # No need to check the rest.
+         if ruleMatch:
+            if timings.enabled:
+               self.__count(checked + 1)
+            return result
+      if timings.enabled:
+         self.__count(len(candidates))
+      return None
+
+   def __count(self, rulesChecked: int):
+      timings.counts['ruleMatches'] += 1
+      timings.counts['rulesChecked'] += rulesChecked
+
+   #############################################################################
+
+   def getMatchSequential(self, transToCheck):
+      # Same as getMatch, but tries every rule in order instead of only the candidates.
+      for checks, result in self.rules:
+         ruleMatch = True
+         for check in checks:
+            if not check(transToCheck):
+               ruleMatch = False
+               break # No need to check the rest.
+         if ruleMatch:
+            return result
+      return None
@@ -0,0 +1,94 @@
+import os
+import json
+import numpy as np
+from TransactionColumns import TransactionColumns
+
+################################################################################
+
+SNAPSHOT_MAGIC = b'OFXCOLS1'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_ALIGN = 8
+
+# Arrays stored after the header (in this order), one entry per transaction.
+SNAPSHOT_ARRAYS = [['dates', 'datetime64[s]'], ['amounts', np.float64], ['actionCodes', np.int32], ['categoryCodes', np.int32], ['nameCodes', np.int32]]
+
+################################################################################
+################################################################################
+################################################################################
+
+class TransactionSnapshot(object):
+   # Binary columnar copy of the transactions json (<name>_snapshot.bin) for read only reports. Layout:
+   #   magic (8 bytes), header length (uint64), header json, padding to 8 bytes, then each of SNAPSHOT_ARRAYS.
+   # The header has the count, the string tables (action / category / name names, the codes index into these) and
+   # the size / mtime of the json it was made from. The arrays are opened with numpy.memmap, so opening is quick
+   # no matter how many transactions there are, and processes reading the same snapshot share the pages.
+   def __init__(self, pathToTransJson: str):
+      self.pathToTransJson = pathToTransJson
+      self.pathToSnapshot = os.path.splitext(pathToTransJson)[0] + "_snapshot.bin"
+
+   #############################################################################
+
+   def __getSource(self):
+      stat = os.stat(self.pathToTransJson)
+      return {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+   #############################################################################
+
+   def __readHeader(self):
+      # [header, offset of the first array], or None if there isn't a snapshot (or it isn't one this can read).
+      try:
+         with open(self.pathToSnapshot, 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+               return None
+            headerLen = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            header = json.loads(f.read(headerLen).decode('utf-8'))
+      except (OSError, ValueError, IndexError):
+         return None
+      if header.get('version') != SNAPSHOT_VERSION:
+         return None
+      offset = len(SNAPSHOT_MAGIC) + 8 + headerLen
+      return [header, offset + (-offset % SNAPSHOT_ALIGN)]
+
+   #############################################################################
+
+   def isCurrent(self):
+      # The snapshot was made from the json as it is now.
+      headerInfo = self.__readHeader()
+      return headerInfo != None and os.path.isfile(self.pathToTransJson) and headerInfo[0]['source'] == self.__getSource()
+
+   #############################################################################
+
+   def write(self, columns: TransactionColumns):
+      header = {'version': SNAPSHOT_VERSION, 'count': columns.count, 'source': self.__getSource(),
+                'actionNames': columns.actionNames, 'categoryNames': columns.categoryNames, 'nameNames': columns.nameNames}
+      headerBytes = json.dumps(header).encode('utf-8')
+      offset = len(SNAPSHOT_MAGIC) + 8 + len(headerBytes)
+
+      # Written to a temp file and moved over the old snapshot, so readers never see a partial one.
+      tempPath = self.pathToSnapshot + ".tmp"
+      with open(tempPath, 'wb') as f:
+         f.write(SNAPSHOT_MAGIC)
+         f.write(np.array([len(headerBytes)], dtype=np.uint64).tobytes())
+         f.write(headerBytes)
+         f.write(b'\0' * (-offset % SNAPSHOT_ALIGN))
+         for name, dtype in SNAPSHOT_ARRAYS:
+            array = np.ascontiguousarray(getattr(columns, name), dtype=dtype)
+            f.write(array.tobytes())
+            f.write(b'\0' * (-array.nbytes % SNAPSHOT_ALIGN))
+      os.replace(tempPath, self.pathToSnapshot)
+
+   #############################################################################
+
+   def read(self) -> TransactionColumns:
+      # Memory mapped (read only) columns.
+      header, offset = self.__readHeader()
+      count = header['count']
+      arrays = {}
+      for name, dtype in SNAPSHOT_ARRAYS:
+         if count == 0:
+            arrays[name] = np.empty(0, dtype=dtype) # Zero length can't be memory mapped.
+            continue
+         arrays[name] = np.memmap(self.pathToSnapshot, dtype=dtype, mode='r', offset=offset, shape=(count,))
+         offset += arrays[name].nbytes + (-arrays[name].nbytes % SNAPSHOT_ALIGN)
+      return TransactionColumns.fromCodes(arrays['dates'], arrays['amounts'], header['actionNames'], arrays['actionCodes'],
+                                          header['categoryNames'], arrays['categoryCodes'], header['nameNames'], arrays['nameCodes'])
@@ -0,0 +1,89 @@
+import pytest
+from CostBasis import LOT_METHODS, LotTracker, getCostBasisOverTime
+from Benchmarks import makeTrades
+
+################################################################################
+
+def makeTrade(date: str, trade: str, shares: float, cost: float, lot: str = None, symbol: str = "AAA"):
+   retVal = {"Date": date, "Symbol": symbol, "Trade": trade, "Shares": str(shares), "Cost": str(cost), "Total": str(shares * cost)}
+   if lot != None:
+      retVal["Lot"] = lot
+   return retVal
+
+def getOpenLots(tracker: LotTracker, symbol: str = "AAA"):
+   return [[lot.lotId, lot.shares, lot.costPer] for lot in tracker.getOpenLots(symbol)]
+
+# Three buys, then 15 shares sold at 30 (naming the second buy's lot for 'specific').
+BUYS = [makeTrade("2020-01-01", "Buy", 10, 10), makeTrade("2020-01-02", "Buy", 10, 20), makeTrade("2020-01-03", "Buy", 10, 40)]
+SELL = makeTrade("2020-01-04", "Sell", 15, 30, lot="2020-01-02")
+
+################################################################################
+
+@pytest.mark.parametrize("method, soldCost, openLots", [
+   ("fifo", 10*10 + 5*20, [["2020-01-02", 5, 20], ["2020-01-03", 10, 40]]),
+   ("lifo", 10*40 + 5*20, [["2020-01-01", 10, 10], ["2020-01-02", 5, 20]]),
+   ("specific", 10*20 + 5*10, [["2020-01-01", 5, 10], ["2020-01-03", 10, 40]]),
+])
+def test_lotMethods(method, soldCost, openLots):
+   tracker = LotTracker(method)
+   for trade in BUYS:
+      shares = float(trade["Shares"])
+      assert tracker.addTrade(trade) == [shares, shares * float(trade["Cost"]), 0.0]
+   assert tracker.addTrade(SELL) == [-15, -soldCost, 15*30 - soldCost]
+   assert getOpenLots(tracker) == openLots
+   assert tracker.shares["AAA"] == 15
+   assert tracker.costBasis["AAA"] == 10*10 + 10*20 + 10*40 - soldCost
+   assert tracker.realized["AAA"] == 15*30 - soldCost
+
+################################################################################
+
+def test_specificLotIds():
+   # Buys with a "Lot" are named by it, a lot sold out is dropped even from the middle.
+   tracker = LotTracker("specific")
+   tracker.addTrade(makeTrade("2020-01-01", "Buy", 10, 10, lot="a"))
+   tracker.addTrade(makeTrade("2020-01-02", "Buy", 10, 20, lot="b"))
+   tracker.addTrade(makeTrade("2020-01-03", "Buy", 10, 30, lot="c"))
+   assert tracker.addTrade(makeTrade("2020-01-04", "Sell", 10, 25, lot="b")) == [-10, -200, 50]
+   assert getOpenLots(tracker) == [["a", 10, 10], ["c", 10, 30]]
+   tracker.addTrade(makeTrade("2020-01-05", "Sell", 15, 25, lot="c")) # 10 from 'c', then oldest first.
+   assert getOpenLots(tracker) == [["a", 5, 10]]
+
+def test_sellWithoutLotUsesOldest():
+   tracker = LotTracker("specific")
+   for trade in BUYS:
+      tracker.addTrade(trade)
+   tracker.addTrade(makeTrade("2020-01-04", "Sell", 15, 30))
+   assert getOpenLots(tracker) == [["2020-01-02", 5, 20], ["2020-01-03", 10, 40]]
+
+def test_fractionalSharesCloseLots():
+   tracker = LotTracker("fifo")
+   tracker.addTrade(makeTrade("2020-01-01", "Buy", 0.1, 10))
+   tracker.addTrade(makeTrade("2020-01-02", "Buy", 0.2, 10))
+   tracker.addTrade(makeTrade("2020-01-03", "Sell", 0.3, 10))
+   assert getOpenLots(tracker) == []
+
+def test_badTrades():
+   with pytest.raises(ValueError):
+      LotTracker("hifo")
+   tracker = LotTracker("fifo")
+   tracker.addTrade(BUYS[0])
+   with pytest.raises(ValueError):
+      tracker.addTrade(makeTrade("2020-01-02", "Sell", 11, 10))
+
+################################################################################
+
+@pytest.mark.parametrize("method", LOT_METHODS)
+def test_costBasisOverTime(method):
+   # Realized + unrealized gain is the value of what is held minus what was paid (net of what was sold).
+   trades, history = makeTrades(500, 5)
+   days, costBasis, realized, unrealized = getCostBasisOverTime(trades, history, method)
+   held = {}
+   paid = 0.0
+   for trade in trades:
+      shares = float(trade["Shares"]) * (-1 if trade["Trade"] == "Sell" else 1)
+      held[trade["Symbol"]] = held.get(trade["Symbol"], 0) + shares
+      paid += shares * float(trade["Cost"])
+   value = sum([shares * history[days[-1]][symbol] for symbol, shares in held.items()])
+   assert realized[-1] + unrealized[-1] == pytest.approx(value - paid)
+   assert len(days) == len(costBasis) == len(realized) == len(unrealized)
+   assert days[0] == min(day for day in history if day.strftime("%Y-%m-%d") >= trades[0]["Date"])
@@ -0,0 +1,46 @@
+import json
+import pytest
+from FinancialHelpers import iterJsonList
+
+################################################################################
+
+# Lists whose values get cut off at the end of a chunk at some chunk size: numbers ('-1.' then '5'), strings,
+# escapes (ensure_ascii writes \u escapes, including surrogate pairs) and literals.
+JSON_LISTS = [
+   [-1.5, 2],
+   [{}, -15000000000.0],
+   [1e5, 2e-3, -0.25, 12345678901234567890, 0, 7],
+   ["a,]", "quote \" backslash \\ slash /", "tab\t new line\n", "é 中 \U0001f600", ""],
+   [True, False, None, [1.5, [2e10]], {"x": -2.5e3, "y": "}]"}],
+   [],
+]
+CHUNK_SIZES = [1, 2, 3, 4, 5, 6, 7, 8, 64]
+
+################################################################################
+
+@pytest.mark.parametrize("items", JSON_LISTS)
+@pytest.mark.parametrize("indent", [None, 1])
+@pytest.mark.parametrize("ensureAscii", [True, False])
+def test_iterJsonListMatchesJsonLoad(tmp_path, items, indent, ensureAscii):
+   path = tmp_path / "list.json"
+   path.write_text(json.dumps(items, indent=indent, ensure_ascii=ensureAscii), encoding='utf-8')
+   expected = json.loads(path.read_text(encoding='utf-8'))
+   for chunkSize in CHUNK_SIZES:
+      assert list(iterJsonList(str(path), chunkSize)) == expected, f"chunkSize {chunkSize}"
+
+################################################################################
+
+def test_iterJsonListJsonLines(tmp_path):
+   path = tmp_path / "list.jsonl"
+   path.write_text('{"a": 1}\n\n[2, -3.5]\n"x"\n')
+   assert list(iterJsonList(str(path), 1)) == [{"a": 1}, [2, -3.5], "x"]
+
+################################################################################
+
+@pytest.mark.parametrize("text", ["[1x]", "[1, 2", "{}", '["abc'])
+def test_iterJsonListBadJson(tmp_path, text):
+   path = tmp_path / "bad.json"
+   path.write_text(text)
+   for chunkSize in CHUNK_SIZES:
+      with pytest.raises(ValueError):
+         list(iterJsonList(str(path), chunkSize))
@@ -0,0 +1,57 @@
+import os
+from AllTransactions import AllTransactions
+from ImportManifest import ImportManifest
+from OfxSorter import importDocs
+from Benchmarks import makeOfxDocs
+
+################################################################################
+
+def test_manifestSkipsUnchangedFiles(tmp_path):
+   pathToTransJson = str(tmp_path / "trans.json")
+   path = tmp_path / "statement.ofx"
+   path.write_text("first")
+   manifest = ImportManifest(pathToTransJson)
+   assert not manifest.isImported(str(path))
+   manifest.recordImport(str(path), 3)
+   manifest.saveManifest()
+
+   # Loaded again from the json next to the transactions.
+   manifest = ImportManifest(pathToTransJson)
+   assert manifest.isImported(str(path))
+
+   # Touched without changing: still imported (the hash is checked), changed: imported again.
+   os.utime(path, (1, 1))
+   assert manifest.isImported(str(path))
+   assert manifest.entries["statement.ofx"]["mtime"] == 1
+   path.write_text("other")
+   assert not manifest.isImported(str(path))
+   path.write_text("longer than before")
+   assert not manifest.isImported(str(path))
+
+################################################################################
+
+def importAll(tmp_path, capsys, force: bool = False):
+   # Returns the line importDocs prints with the number of files imported / skipped.
+   pathToDocsJson = str(tmp_path / "docs.json")
+   pathToTransJson = str(tmp_path / "trans.json")
+   allTrans = AllTransactions(pathToTransJson)
+   manifest = ImportManifest(pathToTransJson)
+   capsys.readouterr()
+   importDocs(pathToDocsJson, allTrans, manifest, force)
+   allTrans.saveTransactions()
+   manifest.saveManifest()
+   return [line for line in capsys.readouterr().out.splitlines() if line.startswith("Importing Documents")][0]
+
+def test_importDocsReimportsChangedFiles(tmp_path, capsys):
+   makeOfxDocs(str(tmp_path), 40, 4, 10)
+   assert importAll(tmp_path, capsys) == "Importing Documents: 4 File(s) imported, 0 File(s) skipped (already imported)"
+   transCount = len(AllTransactions(str(tmp_path / "trans.json")).transList)
+   assert transCount == 40
+   assert importAll(tmp_path, capsys) == "Importing Documents: 0 File(s) imported, 4 File(s) skipped (already imported)"
+
+   # A changed statement is imported again, its transactions are already stored so none are added.
+   with open(tmp_path / "ofx" / "statement0001.ofx", 'a') as f:
+      f.write("\n")
+   assert importAll(tmp_path, capsys) == "Importing Documents: 1 File(s) imported, 3 File(s) skipped (already imported)"
+   assert importAll(tmp_path, capsys, force=True) == "Importing Documents: 4 File(s) imported, 0 File(s) skipped (already imported)"
+   assert len(AllTransactions(str(tmp_path / "trans.json")).transList) == transCount
@@ -0,0 +1,87 @@
+import json
+import pytest
+from datetime import datetime
+import TransactionJournal
+from AllTransactions import AllTransactions
+from Benchmarks import makeTransactions
+from FinancialHelpers import *
+
+DOCS_ENTRY = {"type": "checking", "name": "Checking"}
+
+################################################################################
+
+def getTransDicts(allTrans: AllTransactions):
+   return sorted([trans.toDict() for trans in allTrans.transList], key=lambda trans: trans['raw']['id'])
+
+def setJournalTimes(allTrans: AllTransactions, time: str):
+   # Changes are stamped with the time they were made, move the ones in the journal back to 'time'.
+   path = allTrans.journal.pathToJournal
+   with open(path, 'r') as f:
+      changes = [json.loads(line) for line in f]
+   with open(path, 'w') as f:
+      for change in changes:
+         change["time"] = time
+         f.write(json.dumps(change) + "\n")
+
+def makeChanges(allTrans: AllTransactions, newId: str):
+   raw = dict(allTrans.transList[0]['raw'].items())
+   raw['id'] = newId
+   allTrans.addTransaction(raw, DOCS_ENTRY, 'expense')
+   allTrans.modCategory(allTrans.transList[1]['raw'], 'changed' + newId)
+   allTrans.saveTransactions()
+
+################################################################################
+
+@pytest.fixture
+def pathToTransJson(tmp_path):
+   path = str(tmp_path / "trans.json")
+   writeJsonList(path, makeTransactions(50))
+   return path
+
+################################################################################
+
+def test_journalReplay(pathToTransJson):
+   allTrans = AllTransactions(pathToTransJson, journal=True)
+   makeChanges(allTrans, 'new1')
+   allTrans.removeCategory('food')
+   allTrans.saveTransactions()
+
+   # Only the journal was written, replaying it on top of the json gets back what was saved.
+   assert list(iterJsonList(pathToTransJson)) == makeTransactions(50)
+   assert getTransDicts(AllTransactions(pathToTransJson)) == getTransDicts(allTrans)
+   assert len(allTrans.transList) == 51
+   assert 'food' not in [trans.get('category') for trans in allTrans.transList]
+
+################################################################################
+
+def test_journalAsOf(pathToTransJson, monkeypatch):
+   monkeypatch.setattr(TransactionJournal, "JOURNAL_COMPACT_CHANGES", 4) # The second save compacts.
+   base = getTransDicts(AllTransactions(pathToTransJson))
+   allTrans = AllTransactions(pathToTransJson, journal=True)
+   makeChanges(allTrans, 'new1')
+   setJournalTimes(allTrans, "2020-01-01 00:00:00")
+   afterFirst = getTransDicts(AllTransactions(pathToTransJson))
+   makeChanges(allTrans, 'new2')
+   assert allTrans.journal.changeCount == 0 # Compacted, the changes are in the json and an archived journal.
+   assert getTransDicts(AllTransactions(pathToTransJson)) == getTransDicts(allTrans)
+
+   assert getTransDicts(AllTransactions(pathToTransJson, asOf=datetime(2019, 1, 1))) == base
+   assert getTransDicts(AllTransactions(pathToTransJson, asOf=datetime(2020, 6, 1))) == afterFirst
+   assert getTransDicts(AllTransactions(pathToTransJson, asOf=datetime.now())) == getTransDicts(allTrans)
+
+################################################################################
+
+def test_journalLoadActions(pathToTransJson):
+   # A journal change that moves a transaction into (or out of) the loaded actions counts.
+   allTrans = AllTransactions(pathToTransJson, journal=True)
+   expense = next(trans for trans in allTrans.transList if trans['action'] == 'expense')
+   income = next(trans for trans in allTrans.transList if trans['action'] == 'income')
+   allTrans.modTransaction(expense['raw'], DOCS_ENTRY, 'income')
+   allTrans.modTransaction(income['raw'], DOCS_ENTRY, 'move')
+   allTrans.saveTransactions()
+
+   expected = [trans for trans in getTransDicts(allTrans) if trans['action'] == 'income']
+   assert getTransDicts(AllTransactions(pathToTransJson, actions=['income'])) == expected
+   assert getTransDicts(AllTransactions(pathToTransJson, asOf=datetime.now(), actions=['income'])) == expected
+   assert expense['raw']['id'] in [trans['raw']['id'] for trans in expected]
+   assert income['raw']['id'] not in [trans['raw']['id'] for trans in expected]
@@ -0,0 +1,71 @@
+import pytest
+from TransactionRules import TransactionRules, getLiteralPrefix
+from Benchmarks import makeExpenseRules, makeRuleTransactions
+
+################################################################################
+
+def makeRaw(payee: str, amount: str = "-10.00", memo: str = ""):
+   return {"payee": payee, "type": "debit", "date": "2020-01-01 00:00:00", "user_date": "None", "amount": amount, "id": payee, "memo": memo, "sic": "None", "mcc": "", "checknum": "None"}
+
+# Rules that go through each way getMatch finds its candidates: literal prefixes (escaped, optional characters),
+# combined regexes, alternation, back references, inline flags, other fields and amounts. Several rules can match
+# the same transaction, the first one has to win.
+RULES = [
+   [[{"payee": "AMAZON"}, {"amount": "> 100"}], "big amazon"],
+   [[{"payee": "AMAZON MKTP"}], "amazon marketplace"],
+   [[{"payee": "AMAZON"}], "amazon"],
+   [[{"payee": "SHELL|CHEVRON"}], "gas"],
+   [[{"payee": "\\$5 DEAL"}], "deal"],
+   [[{"payee": "COS?TCO"}], "costco"],
+   [[{"payee": ".*COFFEE"}], "coffee"],
+   [[{"payee": "(\\w+) \\1"}], "repeated"],
+   [[{"payee": "(?i)netflix"}], "netflix"],
+   [[{"memo": "rent"}, {"payee": "[A-Z]+"}], "rent"],
+   [[{"amount": "< 5"}], "small"],
+   [[{"payee": "\\d+"}], "numbers"],
+]
+PAYEES = ["AMAZON MKTP US", "AMAZON.COM", "AMAZON", "SHELL 55", "CHEVRON", "$5 DEAL", "COTCO", "COSTCO", "BIG COFFEE",
+          "JOE JOE", "NETFLIX.COM", "Netflix", "LANDLORD", "123 MAIN", "", "A", "ZZZ"]
+
+################################################################################
+
+@pytest.mark.parametrize("compareAmounts", [False, True])
+def test_getMatchSameAsSequential(compareAmounts):
+   rules = TransactionRules(RULES, compareAmounts) # Without compareAmounts the amount checks are regexes.
+   for payee in PAYEES:
+      for amount in ["-1.00", "-50.00", "-150.00", "20.00"]:
+         for memo in ["", "rent"]:
+            raw = makeRaw(payee, amount, memo)
+            assert rules.getMatch(raw) == rules.getMatchSequential(raw), raw
+
+def test_getMatchFirstRuleWins():
+   rules = TransactionRules(RULES, compareAmounts=True)
+   assert rules.getMatch(makeRaw("AMAZON MKTP US", "-150.00")) == "big amazon"
+   assert rules.getMatch(makeRaw("AMAZON MKTP US", "-50.00")) == "amazon marketplace"
+   assert rules.getMatch(makeRaw("JOE JOE")) == "repeated"
+   assert rules.getMatch(makeRaw("Netflix")) == "netflix"
+   assert rules.getMatch(makeRaw("AMAZON", "4.00")) == "amazon"
+   assert rules.getMatch(makeRaw("zzz", "4.00")) == "small"
+   assert rules.getMatch(makeRaw("zzz", "-10.00")) == None
+
+def test_getMatchSameAsSequentialSynthetic():
+   rules = TransactionRules(makeExpenseRules(300)['rules'], compareAmounts=True)
+   rawList = [trans['raw'] for trans in makeRuleTransactions(3000, 300)]
+   results = [rules.getMatch(raw) for raw in rawList]
+   assert results == [rules.getMatchSequential(raw) for raw in rawList]
+   assert results.count(None) not in [0, len(results)] # Some match and some don't.
+
+################################################################################
+
+@pytest.mark.parametrize("pattern, prefix", [
+   ("AMAZON", "AMAZON"),
+   ("^AMAZON", "AMAZON"),
+   ("COS?TCO", "CO"),
+   ("AB+C", "AB"),
+   ("\\$5 DEAL", "$5 DEAL"),
+   ("A\\dB", "A"),
+   ("SHELL|CHEVRON", ""),
+   (".*COFFEE", ""),
+])
+def test_getLiteralPrefix(pattern, prefix):
+   assert getLiteralPrefix(pattern) == prefix